@@ -4,15 +4,20 @@
 #
 from typing import Any, Dict, List
 
+import numpy as np
 import requests
 from ase.calculators.lammpslib import LAMMPSlib
 from celery import Celery, Task, current_task
 from celery.utils.log import get_task_logger
 
-from neomd import calculator, converter, metadata
+from neomd import calculator, converter, metadata, schema, similarity
 from neomd.queries import Neo4jQueryBuilder
+from neomd.store import ConfigurationStore
 
+from ..config import config
 from ..graphdriver import GraphDriver
+from ..trajectory import Trajectory
+from ..utils import describe_states, load_states, state_store_path
 from .celeryconfig import CeleryConfig
 
 celery = Celery(
@@ -47,62 +52,58 @@ class PostingTask(Task):
         return super().before_start(task_id, args, kwargs)
 
     def on_success(self, retval, task_id, args, kwargs):
-        # send update that task has finished
-        send_update(task_id, {"type": TASK_COMPLETE})
+        # send update that task has finished; the run tells the API which
+        # trajectory's cached metadata the task may have changed
+        send_update(
+            task_id, {"type": TASK_COMPLETE, "run": kwargs.get("run", None)}
+        )
         return super().on_success(retval, task_id, args, kwargs)
 
 
 @celery.task(name="subset_connectivity_difference", base=PostingTask)
-def subset_connectivity_difference(stateIDs: List[int]):
+def subset_connectivity_difference(
+    stateIDs: List[int], depth: int = 3, descriptor: str = "structure_types"
+):
     """
-    Calculates the critical states of a sequence.
-    This is achieved using a greedy algorithm where the first state is compared to the entire sequence,
-    and then the index of the state with the most difference is returned.
-    Using this most different state, we start the loop again and look for the
-    maximally different state from that point in the sequence.
-    Continue until 3 iterations or we reach the end.
+    Calculates the critical states of a sequence with a farthest-point
+    traversal: starting from the first state, the state most different
+    from every state picked so far is picked next, wherever it is in the
+    sequence. Every state is described once, and only the distances to the
+    newest pick are computed at each step. Picks are sent as soon as they
+    are found.
 
     :param stateIDs: The states to compare.
+    :param depth: Number of states to pick after the first.
+    :param descriptor: Descriptor to compare states by; see
+    neomd.similarity.DESCRIPTORS. "spectrum" diagonalizes the Laplacian
+    of every state and is much slower for large structures.
 
     :returns: The IDs of the critical states of the sequence.
     """
+    if depth < 1:
+        raise ValueError("The depth must be at least 1.")
     driver = GraphDriver()
     task_id = current_task.request.id
 
-    qb = Neo4jQueryBuilder.infer_db_structure(driver)
-    q = qb.get_states(stateIDs, True)
-    state_atom_dict = converter.query_to_ASE(driver, q)
-
-    connectivity_list = []  # all connectivity matrices in order
-    for stateID in stateIDs:
-        atoms = state_atom_dict[stateID]
-        connectivity_list.append((stateID, atoms))
+    ids = list(dict.fromkeys(stateIDs))  # without duplicates, in order
+    descriptors = [d for _, d in describe_states(driver, ids, descriptor)]
+    descriptors = np.concatenate(descriptors) if descriptors else []
 
     maximum_difference = []
-    iter = 0
-    while iter < 3:
-        result = calculator.max_connectivity_difference(
-            connectivity_list[0][1], connectivity_list[1:]
+    traversal = similarity.farthest_states(ids, descriptors, depth + 1)
+    next(traversal, None)  # the first state is where the traversal starts
+    for stateID, _ in traversal:
+        maximum_difference.append(stateID)
+        current_task.update_state(state="PROGRESS")
+        send_update(
+            task_id,
+            {
+                "type": TASK_PROGRESS,
+                "data": stateID,
+            },
         )
-        if result["id"] is not None and result["id"] not in maximum_difference:
-            maximum_difference.append(result["id"])
-
-            current_task.update_state(state="PROGRESS")
-            send_update(
-                task_id,
-                {
-                    "type": TASK_PROGRESS,
-                    "data": result["id"],
-                },
-            )
 
-            connectivity_list = connectivity_list[result["index"] :]
-        else:
-            break
-        iter += 1
-
-    # again, return the states here possibly?
-    return ""
+    return maximum_difference
 
 
 @celery.task(name="neb_on_path", base=PostingTask)
@@ -133,9 +134,7 @@ def neb_on_path(
     md = metadata.get_metadata(driver, run)
     path, allStates = calculator.canonical_path(driver, run, start, end)
 
-    qb = Neo4jQueryBuilder.infer_db_structure(driver)
-    q = qb.get_states(allStates, True)
-    full_atom_dict = converter.query_to_ASE(driver, q)
+    full_atom_dict = load_states(driver, allStates)
 
     if interpolate < 0:
         # should send error message to main
@@ -183,8 +182,10 @@ def neb_on_path(
         idx += 1
 
         # convert ASE Atoms to new states
-        for atoms in images[1:-1]:
-            stateID = converter.ase_to_neo4j(driver, ["NEB", run], atoms)
+        stateIDs = converter.ase_list_to_neo4j(
+            driver, ["NEB", run], images[1:-1]
+        )
+        for stateID, atoms in zip(stateIDs, images[1:-1]):
             send_neb_step(stateID, atoms, idx)
             idx += 1
 
@@ -216,3 +217,42 @@ def save_to_db(new_attributes):
             data.update({"id": id})
             tx.run(q.text, data)
         tx.commit()
+
+
+@celery.task(name="materialize_states")
+def materialize_states(run: str, stateIDs: List[int]):
+    """
+    Writes the configurations of a trajectory's states to a memory-mapped
+    store in the cache, so that later calculations do not have to query
+    the database for them.
+
+    :param run: Name of the trajectory.
+    :param stateIDs: The states to store.
+    """
+    driver = GraphDriver()
+    ConfigurationStore.materialize(driver, stateIDs, state_store_path(run))
+
+
+@celery.task(name="build_similarity_index", base=PostingTask)
+def build_similarity_index(run: str, descriptor: str = "structure_types"):
+    """
+    Builds or extends the similarity index of a trajectory in the cache;
+    see Trajectory.similarity_index.
+
+    :param run: Name of the trajectory.
+    :param descriptor: Name of the descriptor to index states by.
+    """
+    driver = GraphDriver()
+    trajectory = Trajectory.load_sequence(driver, run)
+    trajectory.similarity_index(driver, descriptor)
+
+
+@celery.task(name="report_index_seeks")
+def report_index_seeks():
+    """
+    Waits for the indexes created at startup to come online and logs
+    whether the lookups they are meant for use them.
+    """
+    driver = GraphDriver()
+    report = schema.ensure_indexes(driver, report=True)
+    logger.info(f"Index seeks (before/after): {schema.index_seeks(report)}")
@@ -8,6 +8,12 @@ class Config(object):
     SAVE_CACHE = True
     LOAD_CACHE = True
     SIZE_THRESHOLD = 250
+    STATE_STORE = True
+    FETCH_SHARD_SIZE = 1000
+    FETCH_WORKERS = 4
+    # prefork Celery workers are daemonic and can't start more processes
+    RMSD_PROCESSES = 1
+    ENSURE_INDEXES = True
 
 
 config = Config()
@@ -6,10 +6,16 @@ import logging
 import os
 from pathlib import Path
 
+import neo4j
 from fastapi import FastAPI
 from fastapi.responses import RedirectResponse
 from fastapi.staticfiles import StaticFiles
 
+from neomd import schema
+
+from .background_worker.celery import celery
+from .config import config
+from .graphdriver import GraphDriver
 from .routers import calculate, data, scripts, worker
 
 f = Path(__file__)
@@ -21,6 +27,22 @@ os.environ["DISPLAY"] = ""
 app = FastAPI()
 
 
+@app.on_event("startup")
+def create_indexes():
+    """
+    Makes sure the database has the indexes the queries rely on. Startup
+    does not wait for them to be populated; a background task does, and
+    logs whether the queries use them.
+    """
+    if not config.ENSURE_INDEXES:
+        return
+    try:
+        schema.ensure_indexes(GraphDriver(), timeout=0)
+        celery.send_task("report_index_seeks")
+    except (neo4j.exceptions.Neo4jError, neo4j.exceptions.DriverError) as e:
+        logging.warning(f"Could not create indexes: {e}")
+
+
 @app.get("/")
 def frontend():
     return RedirectResponse(url="/index.html", status_code=303)
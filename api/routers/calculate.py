@@ -7,19 +7,25 @@ Module for running various calculations on the data-set.
 """
 from typing import List
 
-import ase.geometry
-from fastapi import APIRouter, Body
+from fastapi import APIRouter, Body, HTTPException, Response
 from sklearn import preprocessing
 from sklearn.cluster import OPTICS
 
-from neomd import converter
-from neomd.queries import Neo4jQueryBuilder
+from neomd import calculator, fetch
+from neomd.similarity import DESCRIPTORS
 
+from ..background_worker.celery import celery
+from ..config import config
 from ..graphdriver import GraphDriver
+from ..trajectory import Trajectory
+from ..utils import load_labelled_states
 from .worker import add_task_to_queue
 
 router = APIRouter(prefix="/calculate", tags=["calculations"])
 
+# similarity index builds in progress, by (run, descriptor)
+index_tasks = {}
+
 
 @router.post("/cluster_states", status_code=200)
 def cluster_states(
@@ -34,15 +40,15 @@ def cluster_states(
 
     :returns: A dictionary of state IDs to cluster numbers.
     """
-    qb = Neo4jQueryBuilder(nodes=["State"])
     driver = GraphDriver()
 
-    q = qb.get_states(id_list=stateIds, attribute_list=props + ["id"])
-
-    j = {}
-    with driver.session() as session:
-        result = session.run(q.text)
-        j = result.data()
+    j = fetch.fetch_attributes(
+        driver,
+        stateIds,
+        props + ["id"],
+        shard_size=config.FETCH_SHARD_SIZE,
+        max_workers=config.FETCH_WORKERS,
+    )
 
     ids = []
     states = []
@@ -66,12 +72,15 @@ def cluster_states(
 # make this a websocket?
 @router.post("/selection_distance")
 def selection_distance(
-    stateSet1: List[int] = Body([]), stateSet2: List[int] = Body([])
+    run: str, stateSet1: List[int] = Body([]), stateSet2: List[int] = Body([])
 ):
     """
-    Given two lists of state IDs, get their atomic configurations and compare using ase's
-    Frobeian norm.
+    Given two lists of state IDs, get their atomic configurations and
+    compare them by their RMSD after minimum-image Kabsch alignment; see
+    calculator.batch_rmsd. Atoms are paired by the labels of the
+    trajectory, so it must have been relabelled.
 
+    :param run: Trajectory the states belong to.
     :param stateSet1: First set of states.
     :param stateSet2: Second set of states.
 
@@ -82,18 +91,70 @@ def selection_distance(
 
     # get all states without duplicates
     stateIDs = list(set(stateSet1 + stateSet2))
-    qb = Neo4jQueryBuilder.infer_db_structure(driver)
+    try:
+        state_atom_dict = load_labelled_states(driver, run, stateIDs)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    # every pair is compared in one batched call
+    m = calculator.atoms_rmsd(
+        [state_atom_dict[id1] for id1 in stateSet1],
+        [state_atom_dict[id2] for id2 in stateSet2],
+        num_processes=config.RMSD_PROCESSES,
+    )
+    return {
+        id1: dict(zip(stateSet2, row.tolist()))
+        for id1, row in zip(stateSet1, m)
+    }
+
+
+@router.get("/similar_states")
+def similar_states(
+    run: str,
+    stateID: int,
+    response: Response,
+    k: int = 10,
+    descriptor: str = "structure_types",
+):
+    """
+    Finds the states of a trajectory most similar to the given state, using
+    the trajectory's similarity index. The index is built, or extended with
+    new states, by a background task; until it contains the state, the
+    response has status 202 and an empty list.
 
-    q = qb.get_states(stateIDs, True)
-    state_atom_dict = converter.query_to_ASE(driver, q)
-    m = {id: {id2: 0 for id2 in stateSet2} for id in stateSet1}
-    for id1 in stateSet1:
-        s1 = state_atom_dict[id1]
-        for id2 in stateSet2:
-            s2 = state_atom_dict[id2]
-            dist = ase.geometry.distance(s1, s2)
-            m[id1][id2] = dist
-    return m
+    :param run: Name of the trajectory.
+    :param stateID: The state to find similar states to.
+    :param k: Number of states to return.
+    :param descriptor: Descriptor to compare states by, "structure_types"
+    or the much slower "spectrum".
+
+    :returns List[Dict[str, float]]: The k most similar states as
+    {"id", "distance"}, closest first.
+    """
+    if descriptor not in DESCRIPTORS:
+        raise HTTPException(
+            status_code=400, detail=f"Unknown descriptor {descriptor}."
+        )
+    driver = GraphDriver()
+    trajectory = Trajectory.load_sequence(driver, run)
+    if stateID not in trajectory.unique_states:
+        raise HTTPException(
+            status_code=404, detail=f"State {stateID} is not in {run}."
+        )
+
+    index = trajectory.load_similarity_index(descriptor)
+    if index is None or len(index) < len(trajectory.unique_states):
+        key = (run, descriptor)
+        task = index_tasks.get(key, None)
+        if task is None or task.ready():
+            index_tasks[key] = celery.send_task(
+                "build_similarity_index",
+                kwargs={"run": run, "descriptor": descriptor},
+            )
+
+    if index is None or stateID not in index:
+        response.status_code = 202
+        return []
+    return [{"id": i, "distance": d} for i, d in index.query(stateID, k)]
 
 
 @router.get("/neb_on_path", status_code=201)
@@ -137,20 +198,37 @@ def neb_on_path(
 
 
 @router.post("/subset_connectivity_difference", status_code=201)
-def subset_connectivity_difference(stateIDs: List[int] = Body([])):
+def subset_connectivity_difference(
+    stateIDs: List[int] = Body([]),
+    depth: int = 3,
+    descriptor: str = "structure_types",
+):
     """
-    Uses a greedy search algorithm to generate a preview of the states where
-    each state shown is as different as possible from the previous state.
+    Uses a farthest-point traversal to generate a preview of the states where
+    each state shown is as different as possible from the states before it.
     Helps locate structural differences in the simulation.
 
     :param stateIDs: A list of state IDs to run the calculation for.
+    :param depth: Number of states to find, at least 1.
+    :param descriptor: Descriptor to compare states by, "structure_types"
+    or the much slower "spectrum".
 
     :returns int: The task ID.
     """
+    if depth < 1:
+        raise HTTPException(
+            status_code=400, detail="The depth must be at least 1."
+        )
+    if descriptor not in DESCRIPTORS:
+        raise HTTPException(
+            status_code=400, detail=f"Unknown descriptor {descriptor}."
+        )
     task_id = add_task_to_queue(
         "subset_connectivity_difference",
         {
             "stateIDs": stateIDs,
+            "depth": depth,
+            "descriptor": descriptor,
         },
     )
 
@@ -6,8 +6,9 @@
 Module for retrieving data from the database.
 """
 import logging
+import os
 import time
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, Iterable, List, Optional, Tuple
 
 from ase import Atoms
 from celery.utils import uuid
@@ -16,35 +17,39 @@ from pymemcache import serde
 from pymemcache.client.base import PooledClient
 
 import neomd.utils
-from neomd import converter, metadata, visualizations
-from neomd.queries import Neo4jQueryBuilder
+from neomd import fetch, metadata, visualizations
 
 from ..background_worker.celery import celery
+from ..config import config
 from ..graphdriver import GraphDriver
 from ..trajectory import Trajectory
 from ..utils import (
     find_missing_properties,
     get_script_code,
     get_script_properties_map,
+    iter_states,
+    load_states,
     qImage_to_string,
     remove_duplicates,
+    state_store_path,
 )
 
 router = APIRouter(prefix="/data", tags=["data"])
 
 
-async def run_script(script: str, state_atom_dict: Dict[int, Atoms]):
+async def run_script(script: str, state_atoms: Iterable[Tuple[int, Atoms]]):
     """
-    Runs the provided script's run() function on the state_atom_dict provided.
+    Runs the provided script's run() function on the states provided.
 
     :param script str: The script's name.
-    :param state_atom_dict Dict[int, ase.Atoms]: A dictionary of IDs to atoms to run the script on.
+    :param state_atoms Iterable[Tuple[int, ase.Atoms]]: (ID, atoms) pairs
+    to run the script on, consumed one state at a time.
 
-    :returns: The result of the scripts being run on the dictionary.
+    :returns: The result of the scripts being run on the states.
     """
     code = get_script_code(script)
     exec(code, globals())
-    new_attributes = run(state_atom_dict)
+    new_attributes = run(state_atoms)
     task_id = uuid()
     celery.send_task(
         "save_to_db",
@@ -70,10 +75,7 @@ async def generate_ovito_image_endpoint(
     :returns: Object containing state ID and a base64 encoded image string.
     """
     driver = GraphDriver()
-    qb = Neo4jQueryBuilder.infer_db_structure(driver)
-
-    q = qb.get_states([id], True)
-    atom_dict = converter.query_to_ASE(driver, q)
+    atom_dict = load_states(driver, [id])
 
     modifier = get_script_code(visScript, folder="vis_scripts")
     exec(modifier, globals())
@@ -115,19 +117,16 @@ async def ws_load_properties_for_subset(websocket: WebSocket):
     await websocket.accept()
     try:
         data = await websocket.receive_json()
-        qb = Neo4jQueryBuilder(nodes=["State"])
         driver = GraphDriver()
 
-        q = qb.get_states(
-            id_list=data["stateIds"],
-            attribute_list=data["props"] + ["id"],
+        stateList = fetch.fetch_attributes(
+            driver,
+            data["stateIds"],
+            data["props"] + ["id"],
+            shard_size=config.FETCH_SHARD_SIZE,
+            max_workers=config.FETCH_WORKERS,
         )
 
-        stateList = []
-        with driver.session() as session:
-            result = session.run(q.text)
-            stateList = result.data()
-
         def split(arr, chunk_size):
             for i in range(0, len(arr), chunk_size):
                 yield arr[i : i + chunk_size]
@@ -175,20 +174,17 @@ async def load_properties_for_subset(stateList: List[Dict[str, Any]]):
             all_missing = all_missing + values
 
         if len(all_missing) > 0:
-            qb = Neo4jQueryBuilder.infer_db_structure(driver)
-            q = qb.get_states(remove_duplicates(all_missing), True)
-            state_atom_dict = converter.query_to_ASE(driver, q)
-
             # convert stateList to dict for easy modification
             stateDict = {}
             for state in stateList:
                 stateDict[state["id"]] = state
 
             for analysisName, states in runScripts.items():
-                script_dict = {
-                    id: state_atom_dict[id] for id in remove_duplicates(states)
-                }
-                results = await run_script(analysisName, script_dict)
+                # stream the configurations so each script holds one at a time
+                results = await run_script(
+                    analysisName,
+                    iter_states(driver, remove_duplicates(states)),
+                )
                 for id, data in results.items():
                     stateData = stateDict[id]
                     for key, value in data.items():
@@ -210,10 +206,13 @@ def get_potential(run: str) -> str:
     :return: the filename of the potential file
     """
     driver = GraphDriver()
-    q = f"MATCH (m:Metadata) WHERE m.run = '{run}' RETURN m.potentialFileName AS filename, m.potentialFileRaw AS data;"
+    q = (
+        "MATCH (m:Metadata) WHERE m.run = $run "
+        "RETURN m.potentialFileName AS filename, m.potentialFileRaw AS data;"
+    )
 
     with driver.session() as session:
-        result = session.run(q)
+        result = session.run(q, run=run)
         r = result.single()
         filename = r["filename"]
         with open(filename, "w") as f:
@@ -257,18 +256,7 @@ def list_trajectories():
     :returns List[str]: A list of trajectories available in the database.
     """
     driver = GraphDriver()
-
-    # maybe build querybuilder with runs?
-    j = []
-    with driver.session() as session:
-        result = session.run("MATCH (m:Metadata) RETURN DISTINCT m.run;")
-        runs = []
-        for r in result.values():
-            for record in r:
-                runs.append(record)
-        j = runs
-
-    return j
+    return metadata.get_runs(driver)
 
 
 @router.get("/load_trajectory")
@@ -278,6 +266,7 @@ def load_trajectory(
     mMax: int,
     chunkingThreshold: float,
     numClusters: int | None = None,
+    lag: int = 1,
 ):
     """
     Loads the trajectory's sequence, runs PCCA on it, simplifies it, and returns a list of important / unimportant regions + states.
@@ -287,6 +276,8 @@ def load_trajectory(
     :param mMin int: When running PCCA, the minimum cluster size to try.
     :param mMax int: When running PCCA, the maximum cluster size to try.
     :param chunkingThreshold float: Cluster membership threshold at which states are considered important.
+    :param lag int: Number of steps between the two states of a transition
+    when building the transition matrix.
     """
 
     s_t = time.time()
@@ -296,13 +287,20 @@ def load_trajectory(
     trajectory = Trajectory.load_sequence(driver, run)
 
     try:
-        trajectory.pcca(driver, mMin, mMax, numClusters)
+        trajectory.pcca(driver, mMin, mMax, numClusters, lag)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"{e}")
     # calculate what cluster each state belongs to, need it for simplify_sequence
     trajectory.calculateIDToCluster()
     trajectory.simplify_sequence(chunkingThreshold)
 
+    # keep the configurations on disk for later calculations
+    if config.STATE_STORE and not os.path.exists(state_store_path(run)):
+        celery.send_task(
+            "materialize_states",
+            kwargs={"run": run, "stateIDs": list(trajectory.unique_states)},
+        )
+
     mem_client = PooledClient(
         "localhost", max_pool_size=1, serde=serde.pickle_serde
     )
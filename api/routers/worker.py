@@ -9,6 +9,8 @@ from celery.result import AsyncResult
 from celery.utils import uuid
 from fastapi import APIRouter, WebSocket, WebSocketDisconnect
 
+from neomd import metadata
+
 from ..background_worker.celery import TASK_COMPLETE, celery
 from ..connectionmanager import ConnectionManager
 
@@ -45,6 +47,10 @@ async def update_task(task_id: str, data: dict):
     :param task_id: The task to update.
     :param data: The data to send.
     """
+    if data["type"] == TASK_COMPLETE:
+        # metadata the task changed is only invalidated in the worker's
+        # process; without a run, everything is dropped
+        metadata.invalidate_metadata(data.get("run", None))
     if task_id in cm.active_connections:
         if data["type"] == TASK_COMPLETE:
             result = AsyncResult(task_id, app=celery)
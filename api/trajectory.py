@@ -2,6 +2,7 @@
 # © 2025. Triad National Security, LLC. All rights reserved.
 # This program was produced under U.S. Government contract 89233218CNA000001 for Los Alamos National Laboratory (LANL), which is operated by Triad National Security, LLC for the U.S. Department of Energy/National Nuclear Security Administration. All rights in the program are reserved by Triad National Security, LLC, and the U.S. Department of Energy/National Nuclear Security Administration. The Government is granted for itself and others acting on its behalf a nonexclusive, paid-up, irrevocable worldwide license in this material to reproduce, prepare. derivative works, distribute copies to the public, perform publicly and display publicly, and to permit others to do so.
 #
+import os
 import random
 from collections import Counter
 from typing import Optional
@@ -9,10 +10,18 @@ from typing import Optional
 import neo4j
 import pygpcca as gp
 
-from neomd import calculator
+from neomd.similarity import SimilarityIndex
+from neomd.transitions import TransitionCounts
 
 from .config import config
-from .utils import load_pickle, save_pickle
+from .utils import (
+    createDir,
+    describe_states,
+    load_pickle,
+    remove_pickles,
+    save_pickle,
+    similarity_index_path,
+)
 
 # TODO: move this to neomd
 # make PCCA a seperate static class
@@ -30,6 +39,7 @@ class Trajectory:
     chunks = []
     min_chi = []
     simplified_unique_states = None
+    lag = 1
 
     def __init__(self, name, sequence, unique_states):
         self.name = name
@@ -47,12 +57,40 @@ class Trajectory:
         """
 
         r = load_pickle(run, "sequence")
-        if r is not None:
-            return Trajectory(run, r["sequence"], r["unique_states"])
-
-        sequence = calculator.get_sequence(driver, run)
-        unique_states = set(sequence)
-
+        # the transition counts record how far the sequence has been read
+        counts = load_pickle(run, "transition_counts")
+        if (
+            r is not None
+            and counts is not None
+            and counts.last_timestep is not None
+            and counts.length == len(r["sequence"])
+        ):
+            # only read the transitions added since the sequence was cached
+            new = counts.update(driver)
+            if len(new) == 0:
+                return cls(run, r["sequence"], r["unique_states"])
+
+            sequence = r["sequence"] + new
+            unique_states = r["unique_states"] | set(new)
+            # results calculated from the shorter sequence are stale;
+            # transition counts are brought up to date instead
+            for prefix in [
+                "transition_matrix",
+                "optimal_clusterings",
+                "pcca_cluster_",
+                "idToTimestep",
+            ]:
+                remove_pickles(run, prefix)
+        else:
+            counts = TransitionCounts(run)
+            sequence = counts.update(driver)
+            if len(sequence) == 0:
+                raise ValueError(f"Trajectory {run} not found.")
+            unique_states = set(sequence)
+
+        # occurrences are only written for the states that changed
+        counts.write_occurrences(driver)
+        save_pickle(run, "transition_counts", counts)
         save_pickle(
             run,
             "sequence",
@@ -117,25 +155,83 @@ class Trajectory:
         ]
         return self.optimal_value
 
+    def cache_name(self, name: str) -> str:
+        """
+        Returns the name results that depend on the lag time are cached under.
+
+        :param name: Name of the cached result at a lag of 1.
+        """
+        return name if self.lag == 1 else f"{name}_lag_{self.lag}"
+
+    def load_similarity_index(
+        self, descriptor: str = "structure_types"
+    ) -> Optional[SimilarityIndex]:
+        """
+        Loads the trajectory's saved similarity index without updating it.
+
+        :param descriptor: Name of the descriptor states are indexed by; see
+        neomd.similarity.DESCRIPTORS.
+        :returns: The index, or None if it has not been built yet.
+        """
+        path = similarity_index_path(self.name, descriptor)
+        if config.LOAD_CACHE and os.path.exists(path):
+            return SimilarityIndex.load(path)
+        return None
+
+    def similarity_index(
+        self, driver: neo4j.Driver, descriptor: str = "structure_types"
+    ) -> SimilarityIndex:
+        """
+        Loads the trajectory's similarity index and indexes the states that
+        were added since it was saved, a shard at a time. The index is
+        saved after every shard, so an interrupted build resumes where it
+        stopped. Slow for large trajectories; run it in a background task.
+
+        :param driver: Neo4j driver to query the database with.
+        :param descriptor: Name of the descriptor to index states by; see
+        neomd.similarity.DESCRIPTORS.
+        """
+        index = self.load_similarity_index(descriptor)
+        if index is None:
+            index = SimilarityIndex(descriptor)
+
+        missing = [s for s in self.unique_states if s not in index]
+        for shard, descriptors in describe_states(driver, missing, descriptor):
+            index.add(shard, descriptors)
+            if config.SAVE_CACHE:
+                createDir("api/cache")
+                index.save(similarity_index_path(self.name, descriptor))
+
+        return index
+
     def calculate_transition_matrix(self, driver: neo4j.Driver):
         """
-        Wrapper for calculating the transition matrix of the trajectory; uses cached versions of the matrix if available.
+        Wrapper for calculating the transition matrix of the trajectory at
+        its lag time; uses cached versions of the matrix if available.
 
         :param driver: Neo4j driver to query the database with.
 
         :returns: A tuple of a scipy.sparse matrix and a List to index it with.
         """
-        r = load_pickle(self.name, "transition_matrix")
+        r = load_pickle(self.name, self.cache_name("transition_matrix"))
         if r is not None:
             return r["matrix"], r["idx_to_id"]
 
-        m, idx_to_id = calculator.calculate_transition_matrix(
-            driver, run=self.name
-        )
+        # counts only need the part of the sequence they haven't seen
+        counts = load_pickle(self.name, self.cache_name("transition_counts"))
+        if counts is None or counts.length > len(self.sequence):
+            counts = TransitionCounts(self.name, self.lag)
+        if counts.length < len(self.sequence):
+            counts.extend(self.sequence[counts.length :])
+            save_pickle(
+                self.name, self.cache_name("transition_counts"), counts
+            )
+
+        m, idx_to_id = counts.transition_matrix()
 
         save_pickle(
             self.name,
-            "transition_matrix",
+            self.cache_name("transition_matrix"),
             {"matrix": m, "idx_to_id": idx_to_id},
         )
 
@@ -147,6 +243,7 @@ class Trajectory:
         m_min: int,
         m_max: int,
         num_clusters: Optional[int],
+        lag: int = 1,
     ):
         """
         Runs PCCA on the trajectory. We need the range every time because pyGPCCA doesn't work without
@@ -156,16 +253,18 @@ class Trajectory:
         :param m_min: The minimimum number of clusters in the range.
         :param m_max: The maximum number of clusters in the range.
         :param num_clusters: Optional, the exact number of clusters to cluster the trajectory with.
+        :param lag: Number of steps between the two states of a transition.
         """
+        self.lag = lag
         m, idx_to_id = self.calculate_transition_matrix(driver)
 
         if not num_clusters:
-            r = load_pickle(self.name, "optimal_clusterings")
+            r = load_pickle(self.name, self.cache_name("optimal_clusterings"))
             if r is not None:
                 optimal = r.get((m_min, m_max), None)
                 if optimal is not None:
                     clustering = load_pickle(
-                        self.name, f"pcca_cluster_{optimal}"
+                        self.name, self.cache_name(f"pcca_cluster_{optimal}")
                     )
                     if clustering is not None:
                         self.current_clustering = optimal
@@ -179,12 +278,12 @@ class Trajectory:
         self.current_clustering = ov
 
         if not num_clusters:
-            r = load_pickle(self.name, "optimal_clusterings")
+            r = load_pickle(self.name, self.cache_name("optimal_clusterings"))
             if r is None:
                 r = {}
             r[(m_min, m_max)] = ov
 
-            save_pickle(self.name, "optimal_clusterings", r)
+            save_pickle(self.name, self.cache_name("optimal_clusterings"), r)
 
         self.single_pcca(gpcca, idx_to_id, ov)
 
@@ -198,7 +297,9 @@ class Trajectory:
         :param idx_to_id: [TODO:description]
         :param num_clusters: Number of clusters to cluster the trajectory into.
         """
-        r = load_pickle(self.name, f"pcca_cluster_{num_clusters}")
+        r = load_pickle(
+            self.name, self.cache_name(f"pcca_cluster_{num_clusters}")
+        )
         if r is not None:
             self.clusterings[num_clusters] = r["clusters"]
             self.fuzzy_memberships[num_clusters] = r["fuzzy_memberships"]
@@ -209,7 +310,7 @@ class Trajectory:
         self.save_membership_info(gpcca, idx_to_id, num_clusters)
         save_pickle(
             self.name,
-            f"pcca_cluster_{num_clusters}",
+            self.cache_name(f"pcca_cluster_{num_clusters}"),
             {
                 "clusters": self.clusterings[num_clusters],
                 "fuzzy_memberships": self.fuzzy_memberships[num_clusters],
@@ -3,17 +3,27 @@
 # This program was produced under U.S. Government contract 89233218CNA000001 for Los Alamos National Laboratory (LANL), which is operated by Triad National Security, LLC for the U.S. Department of Energy/National Nuclear Security Administration. All rights in the program are reserved by Triad National Security, LLC, and the U.S. Department of Energy/National Nuclear Security Administration. The Government is granted for itself and others acting on its behalf a nonexclusive, paid-up, irrevocable worldwide license in this material to reproduce, prepare. derivative works, distribute copies to the public, perform publicly and display publicly, and to permit others to do so.
 #
 import base64
+import glob
 import io
 import os
 import pickle
-from typing import Any, Dict, List
+from typing import Any, Dict, Iterator, List, Tuple
+
+import neo4j
+import numpy as np
+from ase import Atoms
 
 # image rendering
 from PIL import Image
 from typeguard import typechecked
 
+from neomd import fetch, metadata, similarity
+from neomd.store import ConfigurationStore, iter_load_ASE, load_ASE
+
 from .config import config
 
+state_stores: Dict[str, ConfigurationStore] = {}  # opened once per process
+
 
 def remove_duplicates(arr: List[Any]):
     return list(set(arr))
@@ -132,6 +142,19 @@ def save_pickle(run: str, t: str, j: Any):
             pickle.dump(j, f)
 
 
+@typechecked
+def remove_pickles(run: str, prefix: str):
+    """
+    Removes every cached result whose name starts with prefix, e.g. when
+    the data it was calculated from changed.
+
+    :param run: name of the run to remove results for
+    :param prefix: start of the names of the data to remove
+    """
+    for path in glob.glob(f"api/cache/{run}_{prefix}*.pickle"):
+        os.remove(path)
+
+
 @typechecked
 def createDir(path: str):
     """
@@ -160,3 +183,133 @@ def load_pickle(run: str, t: str) -> Any:
         except Exception:
             print(f"Calculating {run} {t} instead of using cached version.")
             return None
+
+
+def state_store_path(run: str) -> str:
+    """
+    Returns the directory the configuration store of a trajectory lives in.
+
+    :param run: name of the run
+    """
+    return f"api/cache/{run}_states"
+
+
+def similarity_index_path(run: str, descriptor: str) -> str:
+    """
+    Returns the file the similarity index of a trajectory is saved to.
+
+    :param run: name of the run
+    :param descriptor: name of the descriptor the index is built with
+    """
+    return f"api/cache/{run}_similarity_{descriptor}.npz"
+
+
+def get_state_stores() -> List[ConfigurationStore]:
+    """
+    Opens every configuration store materialized in the cache. Stores are
+    memory mapped, so they are only opened once per process.
+
+    :returns: A list of the available stores.
+    """
+    if not config.STATE_STORE or not os.path.exists("api/cache"):
+        return []
+
+    with os.scandir("api/cache") as entries:
+        for entry in entries:
+            if (
+                entry.is_dir()
+                and entry.name.endswith("_states")
+                and entry.path not in state_stores
+                and os.path.exists(f"{entry.path}/index.npz")
+            ):
+                state_stores[entry.path] = ConfigurationStore(entry.path)
+
+    return list(state_stores.values())
+
+
+@typechecked
+def load_states(driver: neo4j.Driver, stateIDs: List[int]) -> Dict[int, Atoms]:
+    """
+    Loads the configurations of the states requested, from the
+    materialized configuration stores when possible and the database
+    otherwise.
+
+    :param driver: Neo4j driver to query the database with.
+    :param stateIDs: The states to load.
+    :returns: A dictionary of state IDs to ASE Atoms objects.
+    """
+    return load_ASE(
+        driver,
+        stateIDs,
+        get_state_stores(),
+        shard_size=config.FETCH_SHARD_SIZE,
+        max_workers=config.FETCH_WORKERS,
+    )
+
+
+@typechecked
+def load_labelled_states(
+    driver: neo4j.Driver, run: str, stateIDs: List[int]
+) -> Dict[int, Atoms]:
+    """
+    Loads the configurations of the states requested, with their atoms
+    ordered by the labels relabel_trajectory gave them, so that atom i
+    is the same atom in every state. The stores are ordered by
+    internal_id, so the states are always read from the database.
+
+    :param driver: Neo4j driver to query the database with.
+    :param run: Trajectory whose labels order the atoms.
+    :param stateIDs: The states to load.
+    :raises ValueError: Raised if the trajectory is not relabelled.
+    :returns: A dictionary of state IDs to ASE Atoms objects.
+    """
+    if run not in metadata.get_runs(driver):
+        raise ValueError(f"Trajectory {run} not found.")
+    if not metadata.get_metadata(driver, run).get("relabelled", False):
+        raise ValueError(
+            f"Trajectory {run} has not been relabelled; "
+            "run calculator.relabel_trajectory first."
+        )
+    return fetch.fetch_ASE(
+        driver,
+        stateIDs,
+        order_by=f"{run}_label",
+        shard_size=config.FETCH_SHARD_SIZE,
+        max_workers=config.FETCH_WORKERS,
+    )
+
+
+@typechecked
+def iter_states(
+    driver: neo4j.Driver, stateIDs: List[int]
+) -> Iterator[Tuple[int, Atoms]]:
+    """
+    Generator version of load_states; yields the configurations one at a
+    time instead of keeping all of them in memory.
+
+    :param driver: Neo4j driver to query the database with.
+    :param stateIDs: The states to load.
+    :returns: Iterator of (state ID, ASE Atoms) tuples.
+    """
+    return iter_load_ASE(driver, stateIDs, get_state_stores())
+
+
+@typechecked
+def describe_states(
+    driver: neo4j.Driver, stateIDs: List[int], descriptor: str
+) -> Iterator[Tuple[List[int], np.ndarray]]:
+    """
+    Computes the descriptors of states a shard at a time, so only one shard
+    of configurations is kept in memory.
+
+    :param driver: Neo4j driver to query the database with.
+    :param stateIDs: The states to describe.
+    :param descriptor: Name of the descriptor; see
+    neomd.similarity.DESCRIPTORS.
+    :returns: Iterator of (state IDs, their descriptors) for every shard.
+    """
+    describe = similarity.DESCRIPTORS[descriptor]
+    for i in range(0, len(stateIDs), config.FETCH_SHARD_SIZE):
+        shard = stateIDs[i : i + config.FETCH_SHARD_SIZE]
+        state_atom_dict = load_states(driver, shard)
+        yield shard, np.array([describe(state_atom_dict[s]) for s in shard])
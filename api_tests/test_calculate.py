@@ -17,6 +17,7 @@ def test_cluster_states():
 
 def test_selection_distance():
     r = client.post("/calculate/selection_distance",
+                params={"run": "nano_pt"},
                 json={"stateSet1": [1623,1621,1618,1609,644], 
                       "stateSet2": [611,650,649,640,639]})
     assert r.status_code == 200
@@ -243,14 +243,19 @@ export function apiSubsetConnectivityDifference(stateIDs) {
 /**
  * Runs the distance function for the two state sets specified.
  *
+ * @param {String} run - The trajectory whose atom labels pair the atoms of the states.
  * @param {Array<Number>} stateSet1 - The first set of states.
  * @param {Array<Number>} stateSet2 - The second set of states.
  * @returns {Object} An object of {id : {id: distance}}
  */
-export function apiSelectionDistance(stateSet1, stateSet2) {
+export function apiSelectionDistance(run, stateSet1, stateSet2) {
     return new Promise((resolve, reject) => {
         axios
-            .post(`${API_URL}/calculate/selection_distance`, { stateSet1, stateSet2 })
+            .post(
+                `${API_URL}/calculate/selection_distance`,
+                { stateSet1, stateSet2 },
+                { params: { run } },
+            )
             .then((response) => resolve(response.data))
             .catch((e) => reject(e));
     });
@@ -38,10 +38,12 @@ function SelectionComparisonView({
     useEffect(() => {
         if (!comparisonData) {
             setIsLoading(true);
-            apiSelectionDistance(s1, s2).then((data) => {
-                setIsLoading(false);
-                setComparisonData(data);
-            });
+            apiSelectionDistance(selection1.trajectoryName, s1, s2)
+                .then((data) => {
+                    setIsLoading(false);
+                    setComparisonData(data);
+                })
+                .catch(() => setIsLoading(false));
         }
     }, []);
 
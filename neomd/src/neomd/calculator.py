@@ -8,11 +8,11 @@ Basically a synthesis of the converter and querybuilder modules.
 """
 
 import copy
+import functools
 import os
-import sys
 from typing import Dict, List, Optional, Set, Tuple, TypeAlias, Union, Iterable
 
-import ase.geometry
+import ase
 import neo4j
 import networkx as nx
 import numpy as np
@@ -30,9 +30,10 @@ from sklearn import preprocessing
 from typeguard import typechecked
 from tqdm import tqdm
 from multiprocessing import Pool
-from neomd import converter, utils
+from neomd import converter, distance, fetch, utils
 from neomd.graphs import StateGraph, TransitionGraph, graphutils
-from neomd.metadata import get_metadata
+from neomd.graphs.stategraph import match_graphs
+from neomd.metadata import invalidate_metadata
 from neomd.queries import Neo4jQueryBuilder
 
 os.environ["DISPLAY"] = ""
@@ -44,17 +45,27 @@ Transition: TypeAlias = Tuple[StateID, StateID]
 # TODO: check that analysisType is supported
 # TODO: get rid of eval, have analysisType hit a dictionary or something
 def apply_ovito_pipeline_modifier(
-    state_atom_dict: Dict[int, ase.Atoms], analysisType: str
+    state_atom_dict: Union[
+        Dict[int, ase.Atoms], Iterable[Tuple[int, ase.Atoms]]
+    ],
+    analysisType: str,
 ):
     """
     Apply any Ovito modifier to the dataset.
 
+    :param state_atom_dict: Dictionary of state IDs to Atoms, or an
+    iterable of (state ID, Atoms) such as converter.iter_query_to_ASE.
+    :param analysisType: Name of the Ovito modifier to apply.
+
     :returns: - dict of {state_number: attributes} calculated from the modifier
     """
 
     new_attributes = {}
 
-    for id, atoms in state_atom_dict.items():
+    if isinstance(state_atom_dict, dict):
+        state_atom_dict = state_atom_dict.items()
+
+    for id, atoms in state_atom_dict:
         o_atoms = ase_to_ovito(atoms)
         pipeline = Pipeline(source=StaticSource(data=o_atoms))
         modifier = eval(
@@ -131,12 +142,237 @@ def calculate_trajectory_occurrences(driver: neo4j.Driver, run: str):
     q = qb.generate_get_occurrences(run)
     try:
         with driver.session() as session:
-            session.run(q.text)
+            session.run(q.text, q.params)
     except neo4j.exceptions.ServiceUnavailable as exception:
         raise exception
+    invalidate_metadata(run)
+
+
+def index_sequence(
+    sequence: Union[List, np.ndarray],
+    state_to_canon: Optional[Dict[int, int]] = None,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Maps the states of a sequence to matrix indices.
+
+    :param sequence: The states visited by the trajectory, in order.
+    :param state_to_canon: If supplied, states are replaced by their
+    canonical representation; states missing from the dictionary are
+    their own canonical state.
+    :returns: a tuple of (sorted state IDs, index of every step)
+    """
+    sequence = np.asarray(sequence)
+    if len(sequence) == 0:
+        raise ValueError("Cannot build a transition matrix without states.")
+
+    lo, hi = sequence.min(), sequence.max()
+    if hi - lo < 8 * len(sequence) + (1 << 20):
+        # IDs come from a counter, so a lookup table avoids sorting
+        present = np.zeros(hi - lo + 1, dtype=bool)
+        present[sequence - lo] = True
+        ids = np.flatnonzero(present) + lo
+        inverse = (np.cumsum(present) - 1)[sequence - lo]
+    else:
+        ids, inverse = np.unique(sequence, return_inverse=True)
+
+    if state_to_canon is not None:
+        canon = np.array([state_to_canon.get(int(i), int(i)) for i in ids])
+        ids, remap = np.unique(canon, return_inverse=True)
+        inverse = remap[inverse]
+
+    return ids, inverse
+
+
+def count_transitions(
+    inverse: np.ndarray,
+    n: int,
+    lags: List[int],
+    blocks: Optional[np.ndarray] = None,
+    n_blocks: int = 1,
+) -> sparse.csr_matrix:
+    """
+    Counts the transitions at every lag in a single sparse construction.
+    Counts are stacked vertically, one n x n matrix per (block, lag), in
+    the order block 0 lag 0, block 0 lag 1, ..., block 1 lag 0, ...
+
+    :param inverse: Matrix index of every step, from index_sequence.
+    :param n: Number of states.
+    :param lags: The lags to count transitions at.
+    :param blocks: If supplied, the block of each step; transitions are
+    counted in the block of the step they start from.
+    :param n_blocks: Number of blocks.
+    """
+    rows = []
+    cols = []
+    for k, lag in enumerate(lags):
+        if lag < 1:
+            raise ValueError("Lags must be at least 1.")
+        if lag >= len(inverse):
+            continue
+        offset = k * n
+        if blocks is not None:
+            offset = offset + blocks[:-lag] * (len(lags) * n)
+        rows.append(inverse[:-lag] + offset)
+        cols.append(inverse[lag:])
+
+    rows = np.concatenate(rows) if rows else np.zeros(0, np.int64)
+    cols = np.concatenate(cols) if cols else np.zeros(0, np.int64)
+    # duplicate entries are summed when converting to CSR
+    return sparse.coo_matrix(
+        (np.ones(len(rows)), (rows, cols)),
+        shape=(n_blocks * len(lags) * n, n),
+    ).tocsr()
+
+
+def normalize_counts(counts: sparse.spmatrix) -> sparse.csc_matrix:
+    """
+    Row-normalizes a count matrix into transition probabilities. States
+    that are never left transition to themselves with probability 1,
+    so that every row sums to 1.
+
+    :param counts: Square matrix of transition counts.
+    """
+    counts = sparse.csr_matrix(counts, dtype=np.float64)
+    row_sums = np.asarray(counts.sum(axis=1)).ravel()
+    absorbing = (row_sums == 0).astype(np.float64)
+    counts = counts + sparse.diags(absorbing)
+    return (sparse.diags(1.0 / (row_sums + absorbing)) @ counts).tocsc()
+
+
+@typechecked
+def transition_matrix_from_sequence(
+    sequence: Union[List, np.ndarray],
+    state_to_canon: Optional[Dict[int, int]] = None,
+    lag: int = 1,
+) -> Tuple[sparse.csc_matrix, List]:
+    """
+    Builds the transition matrix of a trajectory from its sequence of
+    states. The [i][j]th element is the number of i to j transitions /
+    the number of transitions out of i, where a transition goes from
+    step t to step t + lag. See normalize_counts for states that are
+    never left.
+
+    :param sequence: The states visited by the trajectory, in order.
+    :param state_to_canon: If supplied, states are replaced by their
+    canonical representation before counting; states missing from the
+    dictionary are their own canonical state.
+    :param lag: Number of steps between the two states of a transition.
+    :returns: a tuple of (sparse.csc_matrix of transition probabilities,
+                          List where the index retrieves the state id)
+    """
+    counts, idx_to_id = lagged_count_matrices(
+        sequence, [lag], state_to_canon
+    )
+    return normalize_counts(counts[lag]), idx_to_id
+
+
+@typechecked
+def lagged_count_matrices(
+    sequence: Union[List, np.ndarray],
+    lags: List[int],
+    state_to_canon: Optional[Dict[int, int]] = None,
+) -> Tuple[Dict[int, sparse.csr_matrix], List]:
+    """
+    Counts the transitions of a trajectory at several lag times at once.
+    Every matrix is indexed the same way, so they can be compared
+    directly; use normalize_counts to get probabilities.
+
+    :param sequence: The states visited by the trajectory, in order.
+    :param lags: Number of steps between the two states of a transition.
+    :param state_to_canon: See index_sequence.
+    :returns: a tuple of (Dict of lags to sparse.csr_matrix of counts,
+                          List where the index retrieves the state id)
+    """
+    ids, inverse = index_sequence(sequence, state_to_canon)
+    n = len(ids)
+    stacked = count_transitions(inverse, n, lags)
+    counts = {lag: stacked[k * n : (k + 1) * n] for k, lag in enumerate(lags)}
+    return counts, ids.tolist()
+
+
+@typechecked
+def windowed_count_matrices(
+    sequence: Union[List, np.ndarray],
+    window: int,
+    step: Optional[int] = None,
+    lag: int = 1,
+    state_to_canon: Optional[Dict[int, int]] = None,
+) -> Tuple[List[Tuple[int, sparse.csr_matrix]], List]:
+    """
+    Counts the transitions of a trajectory within windows of the sequence
+    that slide by step. A transition belongs to the window it starts in.
+    Only windows that fit in the sequence are returned, except for the
+    first window, which is returned even if the sequence is shorter.
+    Transitions are counted once per step-sized block, and each window
+    is the running sum of its blocks.
+
+    :param sequence: The states visited by the trajectory, in order.
+    :param window: Number of steps in a window.
+    :param step: Number of steps between the starts of two windows;
+    defaults to window, i.e. windows that do not overlap.
+    :param lag: Number of steps between the two states of a transition.
+    :param state_to_canon: See index_sequence.
+    :raises ValueError: Raised if window is not a multiple of step.
+    :returns: a tuple of (List of (start of window, sparse.csr_matrix
+                          of counts), List where the index retrieves
+                          the state id)
+    """
+    step = window if step is None else step
+    if step < 1 or window % step != 0:
+        raise ValueError("The window must be a positive multiple of step.")
+
+    ids, inverse = index_sequence(sequence, state_to_canon)
+    n = len(ids)
+    n_blocks = -(-len(inverse) // step)
+    blocks = np.arange(len(inverse)) // step
+    per_window = window // step
+    # blocks past the end of a short sequence are empty
+    stacked = count_transitions(
+        inverse, n, [lag], blocks, max(n_blocks, per_window)
+    )
+
+    windows = []
+    current = stacked[: per_window * n]
+    current = sum(
+        (current[b * n : (b + 1) * n] for b in range(1, per_window)),
+        current[:n],
+    )
+    windows.append((0, current))
+    for b in range(per_window, n_blocks):
+        old = b - per_window
+        if (old + 1) * step + window > len(inverse):
+            break
+        current = (
+            current
+            + stacked[b * n : (b + 1) * n]
+            - stacked[old * n : (old + 1) * n]
+        )
+        windows.append(((old + 1) * step, current))
+
+    return windows, ids.tolist()
+
+
+@typechecked
+def get_canonical_map(driver: neo4j.Driver, run: str) -> Dict[int, int]:
+    """
+    Gets the canonical representation of every state in a trajectory.
+
+    :param driver: Neo4j driver to query.
+    :param run: Name of the trajectory.
+    :returns: Dictionary of state IDs to canonical state IDs.
+    """
+    state_to_canon = {}
+    q = f"""
+    MATCH (n:State)-[r:canon_rep_{run}]->(n2:State)
+    WITH n, n2 ORDER BY r.timestep DESC
+    RETURN n.id AS state, n2.id AS sym;"""
+    with driver.session() as session:
+        r = session.run(q)
+        for record in r:
+            state_to_canon[record["state"]] = record["sym"]
+    return state_to_canon
 
 
-# TODO: use querybuilder
 @typechecked
 def calculate_transition_matrix(driver: neo4j.Driver, run: str, useCanon: bool = False):
     """
@@ -144,87 +380,18 @@ def calculate_transition_matrix(driver: neo4j.Driver, run: str, useCanon: bool =
     The [i][j]th element of each matrix is defined as
     the number of i to j transitions / the # of visits to i;
     i.e., the probability of visiting of i from j.
+    Nothing is written to the database; see transition_matrix_from_sequence.
 
     :param driver: - neo4j driver
     :param run: name of the run to build the transition matrix for
     :param useCanon: Use the canonical representations of states
     when building the transition matrix.
-    :returns: a tuple of (sparse.csr_matrix of connection information,
-                          Dict where the index retrieves the state id)
-    """
-
-    # check if occurrence counts have been calculated for the trajectory
-    md = get_metadata(driver, run)
-    if f"{run}_occurrences" not in md:
-        calculate_trajectory_occurrences(driver, run)
-
-    q = """
-    MATCH (n:{run}:State)-[r:{run}]->(n2:{run}:State)
-    WITH n.id AS n_id, n2.id AS n2_id, count(r) AS transition_count,
-    n.{occurrenceString} AS occurrences
-    WITH collect({{id: n2_id, p: toFloat(transition_count) / occurrences }})
-    AS transitions, n_id
-    RETURN n_id, transitions
-    ORDER BY n_id;
-    """.format(run=run, occurrenceString=f"{run}_occurrences")
-    with driver.session() as session:
-        result = session.run(q)
-        uniqueStates = result.data()
-
-    matrix = None
-    idx_to_id = []
-    if useCanon:
-        state_to_canon = {}
-        # get state_to_canon dict, and convert every transition
-        q = f"""
-        MATCH (n:State)-[r:canon_rep_{run}]->(n2:State)
-        WITH n, n2 ORDER BY r.timestep DESC
-        RETURN n.id AS state, n2.id AS sym;"""
-        with driver.session() as session:
-            r = session.run(q)
-            for record in r:
-                state_to_canon[record["state"]] = record["sym"]
-    else:
-        mSize = len(uniqueStates)
-        id_to_idx = {}
-        matrix = sparse.lil_matrix((mSize, mSize))
-        for idx, ut in enumerate(uniqueStates):
-            id_to_idx.update({ut["n_id"]: idx})
-        idx_to_id = list(id_to_idx.keys())
-
-        for ut in uniqueStates:
-            curr_id = id_to_idx[ut["n_id"]]
-            for t in ut["transitions"]:
-                matrix[curr_id, id_to_idx[t["id"]]] = t["p"]
-
-    return matrix.tocsc(), idx_to_id
-
-
-def max_connectivity_difference(
-    atoms1: ase.Atoms, atoms_list: List[Tuple[StateID, ase.Atoms]]
-):
-    """
-    Get the geometric distance between two ase Atoms objects.
-
-    :param atoms1: The Atoms to compare to the rest of the list.
-    :param connectivity_list: [TODO:description]
-
-    :return: A dictionary containing the value, id and index of the most
-    different Atoms object from atoms1.
+    :returns: a tuple of (sparse.csc_matrix of connection information,
+                          List where the index retrieves the state id)
     """
-    # entry is (id, matrix)
-    max_val = -sys.maxsize - 1
-    max_id = None
-    max_idx = None
-    for idx, entry in enumerate(atoms_list):
-        id, atoms2 = entry
-        val = ase.geometry.distance(atoms1, atoms2)
-        if abs(val) > max_val:
-            max_val = abs(val)
-            max_id = id
-            max_idx = idx
-
-    return {"value": max_val, "id": max_id, "index": max_idx}
+    sequence = get_sequence(driver, run)
+    state_to_canon = get_canonical_map(driver, run) if useCanon else None
+    return transition_matrix_from_sequence(sequence, state_to_canon)
 
 
 # TODO: use querybuilder, needs to be better documented
@@ -244,11 +411,11 @@ def canonical_path(driver: neo4j.Driver, run: str, start: int, end: int):
     with driver.session() as session:
         # get the path first, just the ids
         q = f"""MATCH (n:State:{run})-[r:{run}]->(n2:State:{run})
-        WHERE r.timestep >= {start} AND r.timestep <= {end}
+        WHERE r.timestep >= $start AND r.timestep <= $end
         RETURN n.id AS first, r.timestep AS timestep, n2.id AS second, r.sym AS sym
         ORDER BY timestep, sym;"""
 
-        symmetry_results = session.run(q)
+        symmetry_results = session.run(q, start=start, end=end)
         for r in symmetry_results:
             if r["sym"]:
                 t = path.get(r["timestep"], None)
@@ -295,53 +462,81 @@ def canonical_path(driver: neo4j.Driver, run: str, start: int, end: int):
     return path, stateIDs
 
 
-def relabel_trajectory(driver: neo4j.Driver, qb: Neo4jQueryBuilder, run: str):
+def _build_graph(item: Tuple[StateID, Atoms]) -> Tuple[StateID, nx.Graph]:
+    s, atoms = item
+    return s, StateGraph(atoms, s).graph
+
+
+def _map_pair(item) -> Tuple[StateID, np.ndarray]:
+    child, parent, g_child, g_parent = item
+    m = match_graphs(g_child, g_parent)
+    if m is None:
+        raise ValueError(f"Graphs {child} and {parent} are not isomorphic.")
+    return child, np.array([m[x] for x in range(len(g_child))])
+
+
+def compose_labels(
+    initial: StateID,
+    parents: Dict[StateID, StateID],
+    mappings: Dict[StateID, np.ndarray],
+    size: int,
+) -> Dict[StateID, np.ndarray]:
+    """
+    Composes the atom labels of every state in a BFS tree. The initial
+    state's atoms are labelled in order, and every other state takes its
+    parent's labels, mapped through the isomorphism between the two if
+    they are connected by a symmetric transition.
+
+    :param initial: The root of the tree.
+    :param parents: Dictionary of states to their parent, in BFS order.
+    :param mappings: Dictionary of states to an array that maps each of
+    their atoms to one of their parent's atoms.
+    :param size: The number of atoms in each state.
+    :returns: Dictionary of states to the label of each of their atoms.
+    """
+    labels = {initial: np.arange(size)}
+    for s, parent in parents.items():
+        m = mappings.get(s, None)
+        labels[s] = labels[parent] if m is None else labels[parent][m]
+    return labels
+
+
+def relabel_trajectory(
+    driver: neo4j.Driver,
+    qb: Neo4jQueryBuilder,
+    run: str,
+    num_processes: Optional[int] = None,
+    batch_size: int = 50000,
+):
     """
     Adds trajectory specific labels to each Atom node in the database.
     When retrieved from the database and ordered by these labels, they
     are consistent for each state, allowing you to run NEBs between non-adjacent
     states and so on.
 
+    Labels are propagated along a single BFS tree from the first state;
+    graphs are only built and matched for the symmetric transitions in
+    the tree, in a process pool.
+
     :param driver: Neo4j driver to access the database with.
     :param run: Name of the trajectory to access.
     :param qb: Querybuilder to use.
+    :param num_processes: Number of processes to match graphs with;
+    defaults to the number of CPUs.
+    :param batch_size: Approximate number of atoms to label per query.
+    :returns: Dictionary of state IDs to the label of each of their atoms,
+    ordered by internal_id.
     """
 
     # get every state and its transitions, and if they are symmetric or not
     q = f"""MATCH (n:{run})-[r:{run}]->(n2:{run})
     RETURN DISTINCT n.id as s1, r.sym as sym, n2.id as s2"""
     sym_g = nx.Graph()
-    states = set()
     with driver.session() as session:
         res = session.run(q)
         for rec in res:
-            states.add(rec["s1"])
-            states.add(rec["s2"])
             sym_g.add_edge(rec["s1"], rec["s2"], sym=rec["sym"])
 
-    q = qb.get_states(list(states), True)
-    ase_dict = converter.query_to_ASE(driver, q)
-
-    mappings = {}
-    inter = {}
-
-    def get_graph(s_id):
-        g = graph_dict.get(s_id, None)
-        if g is None:
-            g = StateGraph(ase_dict[s_id], s_id)
-            graph_dict[s_id] = g
-        return g
-
-    def get_intermediate_mapping(t):
-        m = inter.get(t, None)
-        if m is None:
-            s1, s2 = t
-            g1 = get_graph(s1)
-            g2 = get_graph(s2)
-            m = g2.map_from(g1)
-            inter[t] = m
-        return m
-
     # get first state in sequence
     q = f"""MATCH (n:{run})-[r:{run}]->(:{run})
             WHERE r.sym = False
@@ -352,50 +547,74 @@ def relabel_trajectory(driver: neo4j.Driver, qb: Neo4jQueryBuilder, run: str):
         res = session.run(q)
         initial = res.single()["id"]
 
-    nodes = list(sym_g.nodes)
-    for n in nodes:
-        g = StateGraph(ase_dict[initial], initial)
-        if n != initial:
-            path = nx.shortest_path(sym_g, initial, n)
-            graph_dict = {}
-            map_list = []
-            for j in range(len(path) - 1):
-                this = path[j]
-                nxt = path[j + 1]
-                edge = sym_g.get_edge_data(this, nxt)
-
-                if edge is None:
-                    raise ValueError(f"Edge missing: {this} -> {nxt}")
-
-                if edge["sym"]:
-                    m = get_intermediate_mapping((this, nxt))
-                    map_list.append(m)
-
-            map_list.reverse()
-            g = copy.deepcopy(get_graph(n))
-
-            for m in map_list:
-                new_labelling = nx.relabel_nodes(g.graph, m)
-                g.graph = new_labelling
+    parents = {s: p for s, p in nx.bfs_predecessors(sym_g, initial)}
+    if len(parents) + 1 != len(sym_g):
+        missing = set(sym_g.nodes) - set(parents) - {initial}
+        raise ValueError(f"States {missing} are not connected to {initial}.")
+
+    ase_dict = {}
+    for d in fetch.fetch_sharded(
+        driver,
+        list(sym_g.nodes),
+        lambda ids: qb.get_states(ids, True, columnar=True),
+        converter.result_to_ASE,
+    ):
+        ase_dict.update(d)
+
+    # only symmetric transitions change the labels
+    pairs = [(s, p) for s, p in parents.items() if sym_g.edges[p, s]["sym"]]
+    mappings = {}
+    if len(pairs) > 0:
+        needed = {s for pair in pairs for s in pair}
+        with Pool(processes=num_processes) as pool:
+            graphs = dict(
+                pool.imap_unordered(
+                    _build_graph, [(s, ase_dict[s]) for s in needed]
+                )
+            )
+            mappings = dict(
+                pool.imap_unordered(
+                    _map_pair,
+                    [(s, p, graphs[s], graphs[p]) for s, p in pairs],
+                )
+            )
 
-        mappings[n] = g
+    labels = compose_labels(
+        initial, parents, mappings, len(ase_dict[initial])
+    )
 
+    q = f"""UNWIND $batch AS row
+    MATCH (s:State {{id: row.state}})
+    UNWIND range(0, size(row.ids) - 1) AS i
+    MATCH (a:Atom {{internal_id: row.ids[i]}})-[:PART_OF]->(s)
+    SET a.{run}_label = row.labels[i];
+    """
     with driver.session() as session:
-        for state, g in mappings.items():
-            label_objects = []
-            for label, node in g.graph.nodes(data=True):
-                label_objects.append(f"{{ id: {node['id']}, label: {label} }}")
-            batch = f"[{','.join(label_objects)}]"
-            q = f"""UNWIND {batch} AS row
-            MATCH (a:Atom {{internal_id: row.id}})-[:PART_OF]->(:State {{id: {state}}})
-            SET a.{run}_label = row.label;
-            """
-            session.run(q)
-
-        q = f"MATCH (m:Metadata {{run: '{run}' }}) SET m.relabelled = true;"
-        session.run(q)
+        batch = []
+        atoms = 0
+        for state, l in labels.items():
+            batch.append(
+                {
+                    "state": state,
+                    "ids": ase_dict[state].get_tags().tolist(),
+                    "labels": l.tolist(),
+                }
+            )
+            atoms += len(l)
+            if atoms >= batch_size:
+                session.run(q, batch=batch).consume()
+                batch = []
+                atoms = 0
+        if len(batch) > 0:
+            session.run(q, batch=batch).consume()
+
+        session.run(
+            "MATCH (m:Metadata {run: $run }) SET m.relabelled = true;",
+            run=run,
+        )
+    invalidate_metadata(run)
 
-    return mappings
+    return labels
 
 
 def get_sequence(driver: neo4j.Driver, run: str, sym=False):
@@ -419,6 +638,45 @@ def get_sequence(driver: neo4j.Driver, run: str, sym=False):
     return sequence
 
 
+@typechecked
+def get_sequence_after(
+    driver: neo4j.Driver,
+    run: str,
+    timestep: Optional[int] = None,
+    sym=False,
+) -> Tuple[List[int], Optional[int]]:
+    """
+    Gets the part of a trajectory's sequence after a timestep.
+
+    :param driver: Neo4j driver to query.
+    :param run: Name of the trajectory.
+    :param timestep: Last timestep already processed; if None, the whole
+    sequence is returned.
+    :param sym: Whether or not to include symmetric transitions.
+    :returns: a tuple of (the states after timestep, the last timestep
+    in the trajectory, or timestep if there is nothing new)
+    """
+    conditions = ["r.timestep > $timestep"] if timestep is not None else []
+    if not sym:
+        conditions.append("r.sym = False")
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+
+    q = f"""MATCH (n:State:{run})-[r:{run}]->(:State:{run})
+    {where}
+    RETURN n.id as id, r.timestep as timestep
+    ORDER BY r.timestep ASC;
+    """
+    sequence = []
+    last = timestep
+    with driver.session() as session:
+        result = session.run(q, timestep=timestep)
+        for r in result:
+            sequence.append(r["id"])
+            last = r["timestep"]
+
+    return sequence, last
+
+
 def get_transitions(driver: neo4j.Driver, run: str, sym=False):
     sym_statement = ""
     if not sym:
@@ -466,55 +724,274 @@ def kabsch(P, Q):
     return U @ np.diag([1, 1, np.linalg.det(U) * np.linalg.det(Vh)]) @ Vh
 
 
+def batch_align(
+    ref_positions: np.ndarray,
+    positions_stack: np.ndarray,
+    keep_centroid: bool = True,
+) -> np.ndarray:
+    """
+    Aligns a stack of structures to reference positions with the Kabsch
+    algorithm; all of the rotations are found with one batched SVD.
+    Atoms must be in the same order in every structure.
+
+    :param ref_positions: (n, 3) positions to align to, or (k, n, 3) to
+    align each structure to its own reference.
+    :param positions_stack: (k, n, 3) positions to align.
+    :param keep_centroid: If True, each structure is rotated about its own
+    centroid, as align does; otherwise it is also moved onto the
+    reference's centroid.
+    :returns: (k, n, 3) aligned positions.
+    """
+    ref = np.asarray(ref_positions, dtype=np.float64)
+    stack = np.asarray(positions_stack, dtype=np.float64)
+    if ref.ndim == 2:
+        ref = ref[np.newaxis]
+    if stack.ndim != 3 or ref.shape[1:] != stack.shape[1:]:
+        raise ValueError(
+            f"Can't align positions of shape {stack.shape} to {ref.shape}."
+        )
+
+    ref_com = ref.mean(axis=1, keepdims=True)
+    com = stack.mean(axis=1, keepdims=True)
+    P = stack - com
+    Q = ref - ref_com
+
+    H = np.einsum("kni,knj->kij", P, Q)
+    U, _, Vh = np.linalg.svd(H)
+    # flip the last axis where needed so that R is a proper rotation
+    d = np.linalg.det(U) * np.linalg.det(Vh)
+    U[:, :, 2] *= d[:, np.newaxis]
+    R = U @ Vh
+
+    aligned = np.einsum("kni,kij->knj", P, R)
+    return aligned + (com if keep_centroid else ref_com)
+
+
+_rmsd_worker = {}  # candidates of the current worker process
+
+
+def _init_rmsd_worker(stack, cell, pbc, block_size):
+    _rmsd_worker.update(
+        stack=stack, cell=cell, pbc=pbc, block_size=block_size
+    )
+
+
+def _rmsd_rows(refs: np.ndarray) -> np.ndarray:
+    stack = _rmsd_worker["stack"]
+    cell = _rmsd_worker["cell"]
+    pbc = _rmsd_worker["pbc"]
+    k, n = stack.shape[:2]
+    rows = max(1, _rmsd_worker["block_size"] // max(k * n * 3, 1))
+
+    out = np.zeros((len(refs), k))
+    for r0 in range(0, len(refs), rows):
+        ref = refs[r0 : r0 + rows, np.newaxis]
+        delta = stack[np.newaxis] - ref
+        if cell is not None and pbc.any():
+            # closest periodic image of every atom to its reference position
+            frac = np.linalg.solve(cell.T, delta.reshape(-1, 3).T).T
+            frac[:, pbc] -= np.round(frac[:, pbc])
+            delta = (frac @ cell).reshape(delta.shape)
+        ref = np.broadcast_to(ref, delta.shape).reshape(-1, n, 3)
+        aligned = batch_align(ref, ref + delta.reshape(-1, n, 3), False)
+        sq = ((aligned - ref) ** 2).sum(axis=(1, 2)) / max(n, 1)
+        out[r0 : r0 + rows] = np.sqrt(sq).reshape(-1, k)
+    return out
+
+
+def batch_rmsd(
+    ref_positions: np.ndarray,
+    positions_stack: np.ndarray,
+    cell: Optional[np.ndarray] = None,
+    pbc: Union[bool, np.ndarray] = False,
+    num_processes: int = 1,
+    block_size: int = 1 << 22,
+) -> np.ndarray:
+    """
+    Computes the RMSD between every reference and every candidate after
+    Kabsch alignment, with whole blocks of pairs aligned in one batched
+    call. Atoms must be in the same order in every structure, e.g. read
+    ordered by the labels of relabel_trajectory; no permutations are
+    searched, unlike ase.geometry.distance.
+
+    :param ref_positions: (n, 3) or (r, n, 3) reference positions.
+    :param positions_stack: (k, n, 3) candidate positions.
+    :param cell: (3, 3) cell, used with pbc to compare every candidate
+    atom's closest periodic image to its reference position.
+    :param pbc: Periodic directions of the cell.
+    :param num_processes: Number of worker processes the references are
+    split between.
+    :param block_size: Approximate number of coordinates aligned at a time;
+    bounds the memory used.
+    :returns: (r, k) RMSDs, or (k,) for a single (n, 3) reference.
+    """
+    refs = np.asarray(ref_positions, dtype=np.float64)
+    stack = np.asarray(positions_stack, dtype=np.float64)
+    single = refs.ndim == 2
+    if single:
+        refs = refs[np.newaxis]
+    if stack.ndim != 3 or refs.ndim != 3 or refs.shape[1:] != stack.shape[1:]:
+        raise ValueError(
+            f"Can't compare positions of shape {stack.shape} to {refs.shape}."
+        )
+    pbc = np.broadcast_to(np.asarray(pbc, dtype=bool), (3,)).copy()
+    if cell is not None:
+        cell = np.asarray(cell, dtype=np.float64)
+
+    initargs = (stack, cell, pbc, block_size)
+    if num_processes == 1 or len(refs) < 2:
+        try:
+            _init_rmsd_worker(*initargs)
+            out = _rmsd_rows(refs)
+        finally:
+            _rmsd_worker.clear()
+    else:
+        chunks = np.array_split(refs, min(num_processes, len(refs)))
+        with Pool(
+            processes=num_processes,
+            initializer=_init_rmsd_worker,
+            initargs=initargs,
+        ) as pool:
+            out = np.concatenate(pool.map(_rmsd_rows, chunks))
+
+    return out[0] if single else out
+
+
+def atoms_rmsd(
+    reference: Union[ase.Atoms, List[ase.Atoms]],
+    atoms_list: List[ase.Atoms],
+    num_processes: int = 1,
+) -> np.ndarray:
+    """
+    batch_rmsd between Atoms objects, using the cell and periodic
+    boundary conditions of the first candidate.
+
+    :param reference: Atoms object, or list of them, to compare to.
+    :param atoms_list: Candidates to compare.
+    :param num_processes: Number of worker processes.
+    :returns: (len(atoms_list),) RMSDs, or (len(reference), len(atoms_list)).
+    """
+    single = isinstance(reference, ase.Atoms)
+    refs = [reference] if single else reference
+    first = atoms_list[0] if len(atoms_list) > 0 else refs[0]
+    m = batch_rmsd(
+        np.stack([a.get_positions() for a in refs]),
+        np.stack([a.get_positions() for a in atoms_list])
+        if len(atoms_list) > 0
+        else np.zeros((0, len(refs[0]), 3)),
+        cell=first.get_cell().array,
+        pbc=first.get_pbc(),
+        num_processes=num_processes,
+    )
+    return m[0] if single else m
+
+
 def align(s1, s2):
     """
     given two ASE atoms objects, `s1` and `s2`,
     aligns the positions of `s2` to `s1`.
     """
 
-    s1c = copy.deepcopy(s1)
-    s2c = copy.deepcopy(s2)
-
-    r1, com1 = center_atom_positions(s1c)
-    r2, com2 = center_atom_positions(s2c)
-
-    R = kabsch(r2, r1)
-    s2c.set_positions(r2 @ R + com2)
+    s2c = s2.copy()
+    s2c.set_positions(
+        batch_align(s1.get_positions(), s2.get_positions()[np.newaxis])[0]
+    )
     return s2c
 
 
 def pure_align(s1, s2):
-    r1, com1 = center_atom_positions(s1)
-    r2, com2 = center_atom_positions(s2)
+    return batch_align(s1.get_positions(), s2.get_positions()[np.newaxis])[0]
 
-    R = kabsch(r2, r1)
-    return r2 @ R + com2
 
+def _pair_fn(fn, i, j, x, y):
+    return fn(x, y)
 
-def distance_matrix(items, fn=lambda x, y: np.linalg.norm(y - x)):
-    m = np.zeros((len(items), len(items)))
-    idxes = np.triu_indices(len(items), k=1)
-    for i, j in tqdm(zip(idxes[0], idxes[1]), total=len(idxes[0])):
-        ri = items[i]
-        rj = items[j]
-        m[i, j] = fn(ri, rj)
-    return m + m.T - np.diag(np.diag(m))
 
+def _wrapper_fn(fn, kwargs, i, j, x, y):
+    return fn((i, j, x, y, kwargs))[2]
 
-def distance_matrix_parallel(
-    d, fn=lambda i, j, x, y: (i, j, np.linalg.norm(y - x)), num_processes=16, **kwargs
+
+def _norm_wrapper(args):
+    i, j, x, y, _ = args
+    return i, j, np.linalg.norm(y - x)
+
+
+def distance_matrix(
+    items,
+    fn=None,
+    num_processes: int = 1,
+    metric: Optional[str] = None,
+    tile_size: int = 256,
+    out_path: Optional[str] = None,
+    landmarks: Optional[int] = None,
+    landmark_method: str = "farthest",
+    seed: Optional[int] = None,
 ):
-    m = np.zeros((len(d), len(d)))
-    idxes = np.triu_indices(len(d), k=1)
-    tasks = [(i, j, d[i], d[j], kwargs) for i, j in zip(idxes[0], idxes[1])]
+    """
+    Builds the symmetric distance matrix between every pair of items;
+    see distance.pairwise_distances.
+
+    :param items: The items to compare.
+    :param fn: Distance function called as fn(x, y); defaults to the norm
+    of the difference between the items, computed with cdist.
+    :param num_processes: Number of worker processes.
+    :param metric: cdist metric to use instead of fn.
+    :param tile_size: Number of rows and columns computed at a time.
+    :param out_path: Optional .npy file to memory-map the result to.
+    :param landmarks: If given, only the distances to this many landmark
+    items are computed, and a distance.ApproximateDistanceMatrix is
+    returned instead; see distance.approximate_distances.
+    :param landmark_method: "farthest" or "random" landmark selection.
+    :param seed: Seed of the landmark selection and error estimate.
+    """
+    if fn is None and metric is None:
+        metric = "euclidean"
+    if landmarks is not None:
+        return distance.approximate_distances(
+            items,
+            landmarks,
+            fn=None if fn is None else functools.partial(_pair_fn, fn),
+            metric=metric,
+            method=landmark_method,
+            num_processes=num_processes,
+            seed=seed,
+        )
+    return distance.pairwise_distances(
+        items,
+        fn=None if fn is None else functools.partial(_pair_fn, fn),
+        metric=metric,
+        num_processes=num_processes,
+        tile_size=tile_size,
+        out_path=out_path,
+    )
 
-    with Pool(processes=num_processes) as pool:
-        pbar = tqdm(pool.imap_unordered(fn, tasks), total=len(tasks))
-        for i, j, distance in pbar:
-            m[i, j] = distance
-            # pbar.set_description(f"{distance}")
 
-    return m + m.T - np.diag(np.diag(m))  # return symmetric matrix
+def distance_matrix_parallel(
+    d,
+    fn=_norm_wrapper,
+    num_processes=16,
+    tile_size: int = 256,
+    out_path=None,
+    **kwargs,
+):
+    """
+    Builds the symmetric distance matrix between every pair of items in
+    parallel; see distance.pairwise_distances.
+
+    :param d: The items to compare.
+    :param fn: Called as fn((i, j, d[i], d[j], kwargs)), returns
+    (i, j, distance), e.g. graphutils.euc_spec_dist_wrapper.
+    :param num_processes: Number of worker processes.
+    :param tile_size: Number of rows and columns computed at a time.
+    :param out_path: Optional .npy file to memory-map the result to.
+    """
+    return distance.pairwise_distances(
+        d,
+        fn=functools.partial(_wrapper_fn, fn, kwargs),
+        num_processes=num_processes,
+        tile_size=tile_size,
+        out_path=out_path,
+    )
 
 
 @typechecked
@@ -533,26 +1010,32 @@ def states_to_graphs(
 def transitions_to_graphs(
     transitions: Iterable[Transition],
     state_graphs: Dict[StateID, StateGraph],
+    chunk_size: int = 256,
 ) -> Dict[Transition, TransitionGraph]:
     """
     Converts a list or set of transitions and an ASE dict containing information
     for each state into a dictionary of graphs and transitions.
 
     :param transitions: List or set of transitions to convert.
-    :param ase_dict: Dictionary of ASE information.
-    :return: Returns a tuple of a graph dictionary and a transition graph dictionary.
+    :param state_graphs: Dictionary of state IDs to their graphs.
+    :param chunk_size: Number of transitions to align at a time.
+    :return: Dictionary of transitions to transition graphs; the second
+    state is aligned to the first.
     """
 
+    transitions = list(transitions)
     d = {}
-    for transition in tqdm(transitions):
-        id1, id2 = transition
-        s1g = state_graphs[id1]
-        s2g = copy.deepcopy(state_graphs[id2])
-
-        s2c = align(s1g.atoms, s2g.atoms)
-        s2g.set_atoms(s2c)
-
-        d[(id1, id2)] = TransitionGraph(s1g, s2g)
+    for start in tqdm(range(0, len(transitions), chunk_size)):
+        chunk = transitions[start : start + chunk_size]
+        aligned = batch_align(
+            np.stack([state_graphs[id1].positions for id1, _ in chunk]),
+            np.stack([state_graphs[id2].positions for _, id2 in chunk]),
+        )
+        for (id1, id2), positions in zip(chunk, aligned):
+            # shares everything but the positions with the state graph
+            s2g = copy.copy(state_graphs[id2])
+            s2g.set_positions(positions)
+            d[(id1, id2)] = TransitionGraph(state_graphs[id1], s2g)
 
     return d
 
@@ -561,6 +1044,9 @@ def transitions_to_graphs(
 def build_graph_distance_matrix(
     graph_dict: Union[Dict[StateID, StateGraph], Dict[Transition, TransitionGraph]],
     weight: Optional[str] = None,
+    landmarks: Optional[int] = None,
+    landmark_method: str = "farthest",
+    seed: Optional[int] = None,
 ):
     """
     Builds a distance matrix based on the dictionary of graph objects provided.
@@ -569,36 +1055,26 @@ def build_graph_distance_matrix(
     :param graph_dict: The graphs to calculate distances for.
     :param weight: The label for the edge weights to use when calculating the distance.
     Providing None uses the connectivity of the graph as weights to the adjacency matrix.
+    :param landmarks: If given, only the distances to this many landmark
+    graphs are computed; see distance.approximate_block.
+    :param landmark_method: "farthest" or "random" landmark selection.
+    :param seed: Seed of the landmark selection and error estimate.
+    :returns: np.ndarray of the distances between the graphs' spectral
+    densities, or a distance.ApproximateDistanceMatrix if landmarks is given.
     """
-    specs = {}
-    m = []
-    dists = {}
-
-    def get_cached_spectrum(id, g):
-        spec = specs.get(id, None)
-        if spec is None:
-            spec = graphutils.im_spectrum(g.graph, weight)
-            specs[id] = spec
-        return spec
-
-    def get_cached_distance(i, j, d1, d2):
-        dist = dists.get((i, j), None)
-        if dist is None:
-            dist = graphutils.im_distance(d1, d2)
-            dists[(i, j)] = dist
-            dists[(j, i)] = dist
-        return dist
-
-    graph_list = graph_dict.values()
-    for i, g in enumerate(graph_list):
-        distances = []
-        d1 = get_cached_spectrum(i, g)
-        for j, g2 in enumerate(graph_list):
-            d2 = get_cached_spectrum(j, g2)
-            d = get_cached_distance(i, j, d1, d2)
-            distances.append(d)
-        m.append(distances)
-    return m
+    spectra = [
+        graphutils.laplacian_spectrum(g.adjacency_matrix(weight))
+        for g in graph_dict.values()
+    ]
+    if landmarks is not None:
+        return distance.approximate_block(
+            functools.partial(graphutils.lorentzian_distances, spectra),
+            len(spectra),
+            landmarks,
+            method=landmark_method,
+            seed=seed,
+        )
+    return graphutils.lorentzian_distance_matrix(spectra)
 
 
 # TODO: perhaps run on build_graph_distance_matrix finish?
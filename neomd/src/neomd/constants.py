@@ -5,3 +5,27 @@
 from typing import Tuple, TypeAlias
 
 Transition: TypeAlias = tuple[int, int]
+
+# per-atom attributes stored on Atom nodes, in the order the columnar
+# readers return them
+ATOM_COLUMNS = [
+    "position_x",
+    "position_y",
+    "position_z",
+    "velocity_x",
+    "velocity_y",
+    "velocity_z",
+    "atom_type",
+    "internal_id",
+]
+
+# values used for ATOM_COLUMNS an Atom node may not have; collect() skips
+# nulls, which would shift the rest of the list onto the wrong atoms
+ATOM_COLUMN_DEFAULTS = {
+    "velocity_x": 0.0,
+    "velocity_y": 0.0,
+    "velocity_z": 0.0,
+}
+
+# prefix for the packed copies of ATOM_COLUMNS stored on State nodes
+PACKED_PREFIX = "packed_"
@@ -7,7 +7,7 @@ This class consumes queries, either user-built or by the query builder and
 converts the data from the database into the given data types / file formats.
 """
 
-from typing import List, Literal, Tuple
+from typing import Any, Dict, Iterator, List, Literal, Optional, Tuple
 
 import ase
 import neo4j
@@ -16,8 +16,9 @@ from ase import Atoms
 from ase.calculators.lammps import convert
 from typeguard import typechecked
 
-from neomd.metadata import get_counter, update_counter
-from neomd.queries import Query
+from neomd.constants import ATOM_COLUMN_DEFAULTS, ATOM_COLUMNS, PACKED_PREFIX
+from neomd.metadata import reserve_counter
+from neomd.queries import Query, atom_column
 
 
 @typechecked
@@ -39,18 +40,47 @@ def query_to_ASE(
 
     :returns: Dict[int, ase.Atoms], a dictionary of state IDs to ASE Atoms.
     """
+    return dict(iter_query_to_ASE(driver, query, dictKey))
+
+
+@typechecked
+def iter_query_to_ASE(
+    driver: neo4j.Driver,
+    query: Query,
+    dictKey: Tuple[Literal["state", "atom", "relation"], str] = (
+        "state",
+        "id",
+    ),
+    fetch_size: int = 100,
+) -> Iterator[Tuple[Any, ase.Atoms]]:
+    """
+    Generator version of query_to_ASE. Converts each record as it
+    arrives from the database, so only fetch_size records and the
+    Atoms object currently being consumed are held in memory.
+
+    :param driver: Neo4j driver object used to execute the query.
+    :param query: Query to convert to ASE format.
+    :param dictKey: What attribute to use as the identifier.
+    :param fetch_size: How many records to pull from the server at a time.
+
+    :raises ValueError: Raised if the query cannot be converted.
+    :returns: Iterator of (identifier, ase.Atoms) tuples.
+    """
     if "ASE" not in query.options:
         raise ValueError("This query cannot be converted to ASE format.")
 
-    with driver.session() as session:
-        result = session.run(query.text)
-        return result_to_ASE(result, dictKey)
+    with driver.session(fetch_size=fetch_size) as session:
+        result = session.run(query.text, query.params)
+        for record in result:
+            yield record_to_ASE(record, dictKey)
 
 
 @typechecked
 def result_to_ASE(result: neo4j.Result, dictKey=("state", "id")):
     """
     Converts a neo4j.Result to a dictionary of IDs to ASE objects.
+    Accepts both results that return a list of Atom nodes per state and
+    columnar results that return one list per attribute in ATOM_COLUMNS.
 
     :param result: The result object to convert.
     :param dictKey: The key from the results to use as the dictionary key.
@@ -60,115 +90,174 @@ def result_to_ASE(result: neo4j.Result, dictKey=("state", "id")):
     :returns: Dict[int, ase.Atoms]
     """
     attr_atom_dict = {}
-
-    states = []
-    atomsList = []
     for record in result:
+        k, atoms = record_to_ASE(record, dictKey)
+        attr_atom_dict[k] = atoms
+
+    return attr_atom_dict
+
+
+@typechecked
+def record_to_ASE(record: neo4j.Record, dictKey=("state", "id")):
+    """
+    Converts a single record containing a State node and its atoms
+    into an ASE Atoms object.
+
+    :param record: The record to convert.
+    :param dictKey: The key from the record to use as the identifier.
+
+    :raises ValueError: Raised if the record contains
+    something other than lists and nodes.
+    :returns: Tuple of (identifier, ase.Atoms)
+    """
+    state, columns = record_to_columns(record)
+    return state[dictKey[1]], columns_to_ASE(state, columns)
+
+
+@typechecked
+def record_to_columns(record: neo4j.Record):
+    """
+    Extracts the State node and the per-atom attribute lists from a
+    record, whichever of the node list, columnar or packed forms it
+    was returned in. No unit conversion or wrapping is applied.
+
+    :param record: The record to convert.
+
+    :raises ValueError: Raised if the record contains
+    something other than lists and nodes.
+    :returns: Tuple of (State node, Dict of ATOM_COLUMNS to lists)
+    """
+    if set(ATOM_COLUMNS).issubset(record.keys()):
+        state = next(
+            v for v in record.values() if isinstance(v, neo4j.graph.Node)
+        )
+        columns = {c: record[c] for c in ATOM_COLUMNS}
+    else:
+        state = None
+        atom_nodes = None
         for node in record:
             if isinstance(node, neo4j.graph.Node):
-                labels = list(node.labels)
-                if "State" in labels:
-                    states.append(node)
+                if "State" in node.labels:
+                    state = node
             elif isinstance(node, list):
-                atomsList.append(node)
+                atom_nodes = node
             else:
                 raise ValueError(f"Unrecognized entity type {type(node)}.")
 
-    for state, atoms in zip(states, atomsList):
-        # eventually, we'll use the boxID from the state to grab the boxInfo
-        k = state[dictKey[1]]
-        cell_x = state["boxhi_x"] - state["boxlo_x"]
-        cell_y = state["boxhi_y"] - state["boxlo_y"]
-        cell_z = state["boxhi_z"] - state["boxlo_z"]
-        xy = state["xy"]
-        xz = state["xz"]
-        yz = state["yz"]
-        periodic_x = state["periodic_x"]
-        periodic_y = state["periodic_y"]
-        periodic_z = state["periodic_z"]
-        atom_count = state["AtomCount"]
-
-        N = atom_count
-
-        # travel corresponds to the last 3 fields in a position line of the lammps file if they exist
-        travel = np.zeros((N, 3), int)
-        types = np.zeros((N), int)
-        for i in range(0, N):
-            types[i] = 1
-
-        velocities = np.zeros((N, 3))
-        positions = np.zeros((N, 3))
-        ids = np.zeros((N))
-        masses = np.zeros((N))
-        cell = np.zeros((3, 3))
-        atomTypes = [""] * N
-        cell[0, 0] = cell_x
-        cell[1, 1] = cell_y
-        cell[2, 2] = cell_z
-        if xy is not None:
-            cell[1, 0] = xy
-        if xz is not None:
-            cell[2, 0] = xz
-        if yz is not None:
-            cell[2, 1] = yz
-
-        for idx, r in enumerate(atoms):
-            positions[idx] = [
-                np.float64(r["position_x"]),
-                np.float64(r["position_y"]),
-                np.float64(r["position_z"]),
-            ]
-            velocities[idx] = [
-                np.float64(r["velocity_x"]),
-                np.float64(r["velocity_y"]),
-                np.float64(r["velocity_z"]),
-            ]
-            atomTypes[idx] = r["atom_type"]
-            ids[idx] = r["internal_id"]
-
-        def shift_positions(positions, cell_size):
-            if all(abs((cell_size / 2) - x) > 1.0 for x in positions):
-                return cell_size / 2
-            return 0
-
-        # this should not be metal
-        positions = convert(positions, "distance", "metal", "ASE")
-        cell = convert(cell, "distance", "metal", "ASE")
-        masses = convert(masses, "mass", "metal", "ASE")
-        velocities = convert(velocities, "velocity", "metal", "ASE")
-
-        atoms = Atoms(
-            positions=positions,
-            symbols=atomTypes,
-            cell=cell,
-            pbc=(periodic_x, periodic_y, periodic_z),
-            tags=ids,
+        if atom_nodes is not None:
+            columns = {
+                c: [
+                    ATOM_COLUMN_DEFAULTS.get(c) if r[c] is None else r[c]
+                    for r in atom_nodes
+                ]
+                for c in ATOM_COLUMNS
+            }
+        else:
+            columns = {c: state[f"{PACKED_PREFIX}{c}"] for c in ATOM_COLUMNS}
+            if any(v is None for v in columns.values()):
+                raise ValueError(
+                    f"State {state['id']} has not been packed. "
+                    "Run converter.pack_states first."
+                )
+
+    return state, columns
+
+
+@typechecked
+def columns_to_ASE(state, columns: Dict[str, Any]) -> ase.Atoms:
+    """
+    Builds an ASE Atoms object from a State node (or any mapping with
+    the same box properties) and parallel per-atom attribute lists.
+
+    :param state: The State node that holds the box information.
+    :param columns: Dictionary of ATOM_COLUMNS to lists or arrays of
+    per-atom values, ordered identically.
+
+    :raises ValueError: Raised if the columns do not match the
+    state's atom count.
+    :returns: ase.Atoms
+    """
+    # eventually, we'll use the boxID from the state to grab the boxInfo
+    cell_x = state["boxhi_x"] - state["boxlo_x"]
+    cell_y = state["boxhi_y"] - state["boxlo_y"]
+    cell_z = state["boxhi_z"] - state["boxlo_z"]
+    xy = state["xy"]
+    xz = state["xz"]
+    yz = state["yz"]
+    periodic_x = state["periodic_x"]
+    periodic_y = state["periodic_y"]
+    periodic_z = state["periodic_z"]
+    N = state["AtomCount"]
+
+    short = {c: len(columns[c]) for c in ATOM_COLUMNS if len(columns[c]) != N}
+    if len(short) > 0:
+        raise ValueError(
+            f"State has {N} atoms, but only {short} values were returned."
         )
-        atoms.set_velocities(velocities)
-        atoms.arrays["travel"] = travel
-        atoms.arrays["id"] = ids
-        atoms.arrays["type"] = types
-
-        xPos = [p[0] for p in atoms.positions]
-        yPos = [p[1] for p in atoms.positions]
-        zPos = [p[2] for p in atoms.positions]
-
-        # shift_positions corrects systems that may have been wrapped around the cell
-        shiftX = shift_positions(xPos, cell_x)
-        shiftY = shift_positions(yPos, cell_y)
-        shiftZ = shift_positions(zPos, cell_z)
-
-        shifted = []
-        for x, y, z in zip(xPos, yPos, zPos):
-            shifted.append([x - shiftX, y - shiftY, z - shiftZ])
-        atoms.positions = shifted
-        atoms.wrap()
-        attr_atom_dict[k] = atoms
 
-    return attr_atom_dict
+    positions = np.column_stack(
+        [
+            np.asarray(columns["position_x"], dtype=np.float64),
+            np.asarray(columns["position_y"], dtype=np.float64),
+            np.asarray(columns["position_z"], dtype=np.float64),
+        ]
+    )
+
+    velocities = np.column_stack(
+        [
+            np.asarray(columns["velocity_x"], dtype=np.float64),
+            np.asarray(columns["velocity_y"], dtype=np.float64),
+            np.asarray(columns["velocity_z"], dtype=np.float64),
+        ]
+    )
+    ids = np.asarray(columns["internal_id"], dtype=np.float64)
+    atomTypes = list(columns["atom_type"])
+
+    # travel corresponds to the last 3 fields in a position line of the
+    # lammps file if they exist
+    travel = np.zeros((N, 3), int)
+    types = np.ones((N), int)
+    masses = np.zeros((N))
+    cell = np.zeros((3, 3))
+    cell[0, 0] = cell_x
+    cell[1, 1] = cell_y
+    cell[2, 2] = cell_z
+    if xy is not None:
+        cell[1, 0] = xy
+    if xz is not None:
+        cell[2, 0] = xz
+    if yz is not None:
+        cell[2, 1] = yz
+
+    # this should not be metal
+    positions = convert(positions, "distance", "metal", "ASE")
+    cell = convert(cell, "distance", "metal", "ASE")
+    masses = convert(masses, "mass", "metal", "ASE")
+    velocities = convert(velocities, "velocity", "metal", "ASE")
+
+    atoms = Atoms(
+        positions=positions,
+        symbols=atomTypes,
+        cell=cell,
+        pbc=(periodic_x, periodic_y, periodic_z),
+        tags=ids,
+    )
+    atoms.set_velocities(velocities)
+    atoms.arrays["travel"] = travel
+    atoms.arrays["id"] = ids
+    atoms.arrays["type"] = types
+
+    # corrects systems that may have been wrapped around the cell;
+    # an axis is shifted by half the cell if no atom lies within
+    # 1.0 of its center
+    half = np.array([cell_x, cell_y, cell_z]) / 2
+    far = np.all(np.abs(half - atoms.positions) > 1.0, axis=0)
+    atoms.positions = atoms.positions - np.where(far, half, 0)
+    atoms.wrap()
+
+    return atoms
 
 
-# TODO: use querybuilder
 def ase_to_neo4j(driver: neo4j.Driver, labels: List[str], atoms: ase.Atoms) -> int:
     """
     Creates a new State node in the neo4j database from an ASE Atoms object.
@@ -179,78 +268,194 @@ def ase_to_neo4j(driver: neo4j.Driver, labels: List[str], atoms: ase.Atoms) -> i
 
     :returns int: The state ID of the new node in the database.
     """
-    cell = atoms.get_cell()
-    cell_x = cell[0, 0]
-    cell_y = cell[1, 1]
-    cell_z = cell[2, 2]
-    xy = cell[1, 0]
-    xz = cell[2, 0]
-    yz = cell[2, 1]
-    px, py, pz = atoms.get_pbc()
-    atom_count = len(atoms)
-
-    stateIDCounter = get_counter(driver, "stateIDCounter")
+    return ase_list_to_neo4j(driver, labels, [atoms])[0]
+
+
+# TODO: use querybuilder
+def ase_list_to_neo4j(
+    driver: neo4j.Driver,
+    labels: List[str],
+    atoms_list: List[ase.Atoms],
+    batch_size: int = 10000,
+    packed: bool = False,
+) -> List[int]:
+    """
+    Creates a new State node for every ASE Atoms object in a single
+    transaction. State IDs are reserved from the counter in one update
+    and atoms are written with UNWIND in batches of at most batch_size.
+
+    :param driver: The neo4j driver to use.
+    :param labels: A list of strings to use to label the new states.
+    :param atoms_list: The ASE atoms objects to insert into the database.
+    :param batch_size: Maximum number of atoms written per query.
+    :param packed: If True, also store the packed atom arrays on each
+    State node (see pack_states).
+
+    :returns: The state IDs of the new nodes, in the same order as atoms_list.
+    """
+    if len(atoms_list) == 0:
+        return []
+    if batch_size < 1:
+        raise ValueError("The batch size must be at least 1.")
+
+    # move elsewhere? not sure
+    stateQ = f"""UNWIND $states AS row
+    CREATE (s:State:{":".join(labels)})
+    SET s += row;"""
+
+    atomQ = """UNWIND $batch AS st
+    MATCH (s:State) WHERE s.id = st.id
+    UNWIND range(0, size(st.atom_type) - 1) AS i
+    CREATE (a:Atom)
+    SET a.atom_type = st.atom_type[i],
+    a.id = toString(st.id) + '_' + toString(st.offset + i + 1),
+    a.internal_id = st.offset + i + 1,
+    a.position_x = st.position_x[i],
+    a.position_y = st.position_y[i],
+    a.position_z = st.position_z[i],
+    a.velocity_x = st.velocity_x[i],
+    a.velocity_y = st.velocity_y[i],
+    a.velocity_z = st.velocity_z[i]
+    CREATE (a)-[:PART_OF]->(s);"""
 
     with driver.session() as session:
         tx = session.begin_transaction()
 
-        # move elsewhere? not sure
-        stateQ = f"""CREATE (s:State:{":".join(labels)})
-        SET s.id = {stateIDCounter},
-        s.boxhi_x = {cell_x},
-        s.boxhi_y = {cell_y},
-        s.boxhi_z = {cell_z},
-        s.boxlo_x = 0.0,
-        s.boxlo_y = 0.0,
-        s.boxlo_z = 0.0,
-        s.xy = {xy},
-        s.xz = {xz},
-        s.yz = {yz},
-        s.periodic_x = {int(px)},
-        s.periodic_y = {int(py)},
-        s.periodic_z = {int(pz)},
-        s.AtomCount = {atom_count};"""
-        tx.run(stateQ)
-
-        positions = atoms.get_positions()
-        velocities = atoms.get_velocities()
-        atomQ = """MATCH (s:State) WHERE s.id = $stateIDCounter
-        CREATE (a:Atom)
-        SET a.atom_type = $symbol,
-        a.id = $atom_id,
-        a.internal_id = $internal_id,
-        a.position_x = $px,
-        a.position_y = $py,
-        a.position_z = $pz,
-        a.velocity_x = $vx,
-        a.velocity_y = $vy,
-        a.velocity_z = $vz
-        MERGE (a)-[:PART_OF]->(s);"""
-
-        atom_counter = 1
-        for atom, position, velocity in zip(atoms, positions, velocities):
-            symbol = atom.symbol
-            px, py, pz = position
-            vx, vy, vz = velocity
-            tx.run(
-                atomQ,
-                stateIDCounter=stateIDCounter,
-                symbol=symbol,
-                atom_id=f"{stateIDCounter}_{atom_counter}",
-                internal_id=atom_counter,
-                px=px,
-                py=py,
-                pz=pz,
-                vx=vx,
-                vy=vy,
-                vz=vz,
+        first = reserve_counter(tx, "stateIDCounter", len(atoms_list))
+        ids = list(range(first, first + len(atoms_list)))
+
+        states = []
+        for stateID, atoms in zip(ids, atoms_list):
+            cell = atoms.get_cell()
+            px, py, pz = atoms.get_pbc()
+            states.append(
+                {
+                    "id": stateID,
+                    "boxhi_x": float(cell[0, 0]),
+                    "boxhi_y": float(cell[1, 1]),
+                    "boxhi_z": float(cell[2, 2]),
+                    "boxlo_x": 0.0,
+                    "boxlo_y": 0.0,
+                    "boxlo_z": 0.0,
+                    "xy": float(cell[1, 0]),
+                    "xz": float(cell[2, 0]),
+                    "yz": float(cell[2, 1]),
+                    "periodic_x": int(px),
+                    "periodic_y": int(py),
+                    "periodic_z": int(pz),
+                    "AtomCount": len(atoms),
+                }
             )
-            atom_counter += 1
+            if packed:
+                states[-1].update(_pack_atoms(atoms))
+        tx.run(stateQ, states=states)
+
+        batch = []
+        room = batch_size  # atoms the current batch can still take
+        for stateID, atoms in zip(ids, atoms_list):
+            positions = atoms.get_positions()
+            velocities = atoms.get_velocities()
+            symbols = atoms.get_chemical_symbols()
+            offset = 0
+            # states are split wherever a batch fills up
+            while offset < len(atoms):
+                sl = slice(offset, offset + room)
+                batch.append(
+                    {
+                        "id": stateID,
+                        "offset": offset,
+                        "atom_type": symbols[sl],
+                        "position_x": positions[sl, 0].tolist(),
+                        "position_y": positions[sl, 1].tolist(),
+                        "position_z": positions[sl, 2].tolist(),
+                        "velocity_x": velocities[sl, 0].tolist(),
+                        "velocity_y": velocities[sl, 1].tolist(),
+                        "velocity_z": velocities[sl, 2].tolist(),
+                    }
+                )
+                room -= len(batch[-1]["atom_type"])
+                offset += len(batch[-1]["atom_type"])
+                if room == 0:
+                    tx.run(atomQ, batch=batch)
+                    batch = []
+                    room = batch_size
+
+        if len(batch) > 0:
+            tx.run(atomQ, batch=batch)
 
-        update_counter(tx, "stateIDCounter", stateIDCounter + 1)
         tx.commit()
 
-    return stateIDCounter
+    return ids
+
+
+def _pack_atoms(atoms: ase.Atoms) -> Dict[str, List[Any]]:
+    """
+    Builds the packed State properties for an Atoms object, numbering
+    atoms the same way ase_list_to_neo4j does.
+    """
+    positions = atoms.get_positions()
+    velocities = atoms.get_velocities()
+    columns = {
+        "position_x": positions[:, 0].tolist(),
+        "position_y": positions[:, 1].tolist(),
+        "position_z": positions[:, 2].tolist(),
+        "velocity_x": velocities[:, 0].tolist(),
+        "velocity_y": velocities[:, 1].tolist(),
+        "velocity_z": velocities[:, 2].tolist(),
+        "atom_type": atoms.get_chemical_symbols(),
+        "internal_id": list(range(1, len(atoms) + 1)),
+    }
+    return {f"{PACKED_PREFIX}{c}": v for c, v in columns.items()}
+
+
+def pack_states(
+    driver: neo4j.Driver,
+    id_list: Optional[List[int]] = None,
+    batch_size: int = 100,
+) -> int:
+    """
+    Migrates states to the packed storage mode. Each State node gets
+    one list property per attribute in ATOM_COLUMNS (prefixed with
+    PACKED_PREFIX), ordered by internal_id, so that it can be read back
+    without touching its Atom nodes. The Atom nodes are left in place.
+    Packing runs on the server; no atom data is sent to the client.
+
+    :param driver: The neo4j driver to use.
+    :param id_list: The states to pack. If None, packs every state that
+    has not been packed yet.
+    :param batch_size: How many states are packed per transaction.
+
+    :returns: The number of states that were packed.
+    """
+    if id_list is None:
+        with driver.session() as session:
+            result = session.run(
+                f"""MATCH (s:State) WHERE s.{PACKED_PREFIX}internal_id IS NULL
+                RETURN s.id;"""
+            )
+            id_list = result.value()
+
+    packed = ",\n    ".join(
+        f"s.{PACKED_PREFIX}{c} = {c}" for c in ATOM_COLUMNS
+    )
+    collected = ", ".join(
+        f"collect({atom_column('a', c)}) AS {c}" for c in ATOM_COLUMNS
+    )
+    q = f"""UNWIND $ids AS id
+    MATCH (s:State) WHERE s.id = id
+    CALL {{
+        WITH s
+        MATCH (a:Atom)-[:PART_OF]->(s)
+        WITH a ORDER BY a.internal_id ASC
+        RETURN {collected}
+    }}
+    SET {packed};"""
+
+    with driver.session() as session:
+        for i in range(0, len(id_list), batch_size):
+            session.run(q, ids=id_list[i : i + batch_size]).consume()
+
+    return len(id_list)
 
 
 # query to get all transforms for a given state
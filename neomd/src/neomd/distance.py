@@ -0,0 +1,560 @@
+#
+# © 2025. Triad National Security, LLC. All rights reserved.
+# This program was produced under U.S. Government contract 89233218CNA000001 for Los Alamos National Laboratory (LANL), which is operated by Triad National Security, LLC for the U.S. Department of Energy/National Nuclear Security Administration. All rights in the program are reserved by Triad National Security, LLC, and the U.S. Department of Energy/National Nuclear Security Administration. The Government is granted for itself and others acting on its behalf a nonexclusive, paid-up, irrevocable worldwide license in this material to reproduce, prepare. derivative works, distribute copies to the public, perform publicly and display publicly, and to permit others to do so.
+#
+"""
+Distance matrices between many items. Numeric items are copied into
+shared memory once; workers are only sent the coordinates of the tiles
+of the upper triangle they compute, and write them straight into a
+shared or memory-mapped output matrix.
+
+For sets too large for every pair to be computed, approximate_distances
+only computes the distances to a few landmark items, and embeds every
+item with landmark multidimensional scaling.
+"""
+
+from multiprocessing import Pool, shared_memory
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+    Union,
+)
+
+import numpy as np
+from scipy.spatial.distance import cdist
+from tqdm import tqdm
+
+Tile = Tuple[int, int, int, int]
+
+# state of the current worker process, set by _init_worker
+_worker: Dict[str, Any] = {}
+
+
+def tiles(n: int, tile_size: int) -> List[Tile]:
+    """
+    Splits the upper triangle of an (n, n) matrix into square tiles.
+
+    :param n: Size of the matrix.
+    :param tile_size: Number of rows and columns per tile.
+    :returns: List of (row start, row end, column start, column end).
+    """
+    starts = range(0, n, tile_size)
+    return [
+        (i, min(i + tile_size, n), j, min(j + tile_size, n))
+        for i in starts
+        for j in starts
+        if j >= i
+    ]
+
+
+def _pack(
+    items: Sequence[Any],
+) -> Optional[Tuple[np.ndarray, np.ndarray, List[Tuple]]]:
+    """
+    Flattens numeric items into one float64 array.
+
+    :param items: The items to flatten.
+    :returns: Tuple of (flat array, offsets of the items, their
+    shapes), or None if any item is not a numeric array.
+    """
+    arrays = []
+    for x in items:
+        try:
+            a = np.asarray(x)
+        except ValueError:
+            # ragged sequences
+            return None
+        if a.dtype.kind not in "biuf":
+            return None
+        arrays.append(a.astype(np.float64, copy=False))
+
+    offsets = np.zeros(len(arrays) + 1, dtype=np.int64)
+    np.cumsum([a.size for a in arrays], out=offsets[1:])
+    flat = (
+        np.concatenate([a.ravel() for a in arrays]) if arrays else np.zeros(0)
+    )
+    return flat, offsets, [a.shape for a in arrays]
+
+
+def _share(array: np.ndarray) -> Tuple[shared_memory.SharedMemory, Tuple]:
+    shm = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+    np.ndarray(array.shape, array.dtype, buffer=shm.buf)[:] = array
+    return shm, ("shm", shm.name, array.shape, array.dtype.str)
+
+
+def _attach(
+    spec: Tuple,
+) -> Tuple[Optional[shared_memory.SharedMemory], np.ndarray]:
+    kind, name, shape, dtype = spec
+    if kind == "memmap":
+        return None, np.load(name, mmap_mode="r+")
+    shm = shared_memory.SharedMemory(name=name)
+    return shm, np.ndarray(shape, np.dtype(dtype), buffer=shm.buf)
+
+
+def _init_worker(items_spec, offsets, shapes, out_spec, fn, metric):
+    items = None
+    if items_spec[0] == "items":
+        # items that are not numeric arrays are sent to each worker once
+        items_shm, flat, items = None, None, items_spec[1]
+    else:
+        items_shm, flat = _attach(items_spec)
+    out_shm, out = _attach(out_spec) if out_spec is not None else (None, None)
+    _worker.update(
+        # keep the SharedMemory objects alive as long as the arrays
+        shm=(items_shm, out_shm),
+        items=items,
+        flat=flat,
+        offsets=offsets,
+        shapes=shapes,
+        out=out,
+        fn=fn,
+        metric=metric,
+    )
+
+
+def _item(i: int) -> Any:
+    if _worker["items"] is not None:
+        return _worker["items"][i]
+    offsets = _worker["offsets"]
+    return _worker["flat"][offsets[i] : offsets[i + 1]].reshape(
+        _worker["shapes"][i]
+    )
+
+
+def _compute_tile(tile: Tile) -> Tile:
+    i0, i1, j0, j1 = tile
+    if _worker["metric"] is not None:
+        size = _worker["offsets"][1] - _worker["offsets"][0]
+        x = _worker["flat"].reshape(-1, size)
+        block = cdist(x[i0:i1], x[j0:j1], _worker["metric"])
+    else:
+        fn = _worker["fn"]
+        block = np.zeros((i1 - i0, j1 - j0))
+        for i in range(i0, i1):
+            xi = _item(i)
+            for j in range(max(j0, i + 1), j1):
+                block[i - i0, j - j0] = fn(i, j, xi, _item(j))
+
+    out = _worker["out"]
+    if i0 == j0:
+        # only the part above the diagonal is used on diagonal tiles
+        block = np.triu(block, 1)
+        block = block + block.T
+    out[i0:i1, j0:j1] = block
+    out[j0:j1, i0:i1] = block.T
+    return tile
+
+
+def _compute_block(block: Tuple[np.ndarray, np.ndarray]) -> np.ndarray:
+    rows, cols = block
+    fn = _worker["fn"]
+    return np.array(
+        [[fn(i, j, _item(i), _item(j)) for j in cols] for i in rows]
+    ).reshape(len(rows), len(cols))
+
+
+def pairwise_distances(
+    items: Sequence[Any],
+    fn: Optional[Callable[[int, int, np.ndarray, np.ndarray], float]] = None,
+    metric: Optional[str] = None,
+    num_processes: int = 1,
+    tile_size: int = 256,
+    out_path: Optional[str] = None,
+) -> np.ndarray:
+    """
+    Computes the symmetric matrix of distances between every pair of items.
+    Items are passed to fn as they are, unless several processes
+    compute the tiles; numeric items are then shared as float64 arrays,
+    and any other items are pickled once for each worker.
+
+    :param items: The items to compare.
+    :param fn: Called as fn(i, j, items[i], items[j]) for every pair with
+    i < j, if metric is None.
+    :param metric: Name of a scipy.spatial.distance.cdist metric to compute
+    tiles with instead of fn; items are flattened to float64 and must
+    all have the same size.
+    :param num_processes: Number of worker processes; 1 computes every tile
+    in this process.
+    :param tile_size: Number of rows and columns per tile.
+    :param out_path: If given, the matrix is written to a .npy file at this
+    path and returned memory-mapped, so it does not need to fit in memory.
+    :returns: (n, n) matrix of distances with a zero diagonal.
+    """
+    if (fn is None) == (metric is None):
+        raise ValueError("Exactly one of fn and metric must be given.")
+
+    n = len(items)
+    packed = None
+    if metric is not None or num_processes > 1:
+        packed = _pack(items)
+    if metric is not None:
+        if packed is None:
+            raise ValueError(f"Items must be numeric arrays to use {metric}.")
+        if len(set(np.diff(packed[1]))) > 1:
+            raise ValueError(f"Items must have the same size to use {metric}.")
+    flat, offsets, shapes = (None, None, None) if packed is None else packed
+
+    work = tiles(n, tile_size)
+    shms = []
+    try:
+        if out_path is not None:
+            np.lib.format.open_memmap(
+                out_path, mode="w+", dtype=np.float64, shape=(n, n)
+            ).flush()
+            out_spec = ("memmap", out_path, (n, n), "<f8")
+        elif num_processes > 1:
+            out_shm = shared_memory.SharedMemory(
+                create=True, size=max(n * n * 8, 1)
+            )
+            shms.append(out_shm)
+            out_spec = ("shm", out_shm.name, (n, n), "<f8")
+
+        if num_processes == 1:
+            out = np.zeros((n, n))
+            if out_path is not None:
+                out = _attach(out_spec)[1]
+            _worker.update(
+                shm=(),
+                items=items if packed is None else None,
+                flat=flat,
+                offsets=offsets,
+                shapes=shapes,
+                out=out,
+                fn=fn,
+                metric=metric,
+            )
+            for tile in tqdm(work):
+                _compute_tile(tile)
+        else:
+            if packed is None:
+                items_spec = ("items", list(items))
+            else:
+                items_shm, items_spec = _share(flat)
+                shms.append(items_shm)
+            with Pool(
+                processes=num_processes,
+                initializer=_init_worker,
+                initargs=(items_spec, offsets, shapes, out_spec, fn, metric),
+            ) as pool:
+                for _ in tqdm(
+                    pool.imap_unordered(_compute_tile, work), total=len(work)
+                ):
+                    pass
+
+            if out_path is None:
+                # copied out, since the shared memory is released below
+                out = np.ndarray((n, n), np.float64, buffer=out_shm.buf).copy()
+            else:
+                out = _attach(out_spec)[1]
+    finally:
+        _worker.clear()
+        for shm in shms:
+            shm.close()
+            shm.unlink()
+
+    if out_path is not None:
+        out.flush()
+    return out
+
+
+# computes the (len(rows), len(cols)) distances between the given items
+BlockFn = Callable[[np.ndarray, np.ndarray], np.ndarray]
+
+
+class ApproximateDistanceMatrix:
+    landmarks: np.ndarray  # indices of the landmark items
+    landmark_distances: np.ndarray  # exact (n, k) distances to the landmarks
+    embedding: np.ndarray  # (n, dim) coordinates of every item
+    error: Dict[str, float]  # error against an exactly computed subset
+
+    def __init__(self, landmarks: np.ndarray, landmark_distances: np.ndarray):
+        """
+        Embeds every item from its distances to the landmarks with landmark
+        multidimensional scaling (de Silva and Tenenbaum, 2004). Distances
+        are the Euclidean distances between embedded items, and are only
+        computed for the entries that are indexed.
+
+        :param landmarks: Indices of the landmark items.
+        :param landmark_distances: (n, k) distances from every item to
+        each landmark.
+        """
+        self.landmarks = np.asarray(landmarks, dtype=np.int64)
+        self.landmark_distances = landmark_distances
+        self.error = {}
+
+        squared = landmark_distances**2
+        delta = squared[self.landmarks]
+        k = len(self.landmarks)
+        center = np.eye(k) - 1 / k
+        values, vectors = np.linalg.eigh(-0.5 * center @ delta @ center)
+        keep = values > max(values.max(initial=0), 0) * 1e-10
+        values, vectors = values[keep], vectors[:, keep]
+        self.embedding = (
+            0.5 * (delta.mean(axis=0) - squared) @ (vectors / np.sqrt(values))
+        )
+
+    @property
+    def shape(self) -> Tuple[int, int]:
+        return (len(self.embedding), len(self.embedding))
+
+    def __len__(self) -> int:
+        return len(self.embedding)
+
+    def __getitem__(self, key) -> Union[float, np.ndarray]:
+        rows, cols = key if isinstance(key, tuple) else (key, slice(None))
+        x = self.embedding[rows]
+        y = self.embedding[cols]
+        m = cdist(np.atleast_2d(x), np.atleast_2d(y))
+        if x.ndim == 1 and y.ndim == 1:
+            return float(m[0, 0])
+        if x.ndim == 1:
+            return m[0]
+        if y.ndim == 1:
+            return m[:, 0]
+        return m
+
+    def __array__(self, dtype=None, copy=None) -> np.ndarray:
+        m = self.to_array()
+        return m if dtype is None else m.astype(dtype)
+
+    def to_array(self) -> np.ndarray:
+        """
+        Evaluates the whole (n, n) approximate distance matrix.
+        """
+        m = cdist(self.embedding, self.embedding)
+        np.fill_diagonal(m, 0)
+        return m
+
+    def estimate_error(
+        self,
+        block: BlockFn,
+        num_samples: int = 100,
+        seed: Optional[int] = None,
+    ) -> Dict[str, float]:
+        """
+        Compares the approximation to the exact distances between a random
+        subset of the items.
+
+        :param block: Computes the exact distances between items.
+        :param num_samples: Number of items in the subset.
+        :param seed: Seed of the random subset.
+        :returns: Dictionary with the root mean squared error, maximum
+        absolute error and relative (Frobenius) error over the pairs of
+        the subset; also stored in error.
+        """
+        rng = np.random.default_rng(seed)
+        n = len(self)
+        subset = np.sort(rng.choice(n, min(num_samples, n), replace=False))
+        upper = np.triu_indices(len(subset), 1)
+        exact = np.asarray(block(subset, subset))[upper]
+        diff = self[subset, subset][upper] - exact
+        norm = np.linalg.norm(exact)
+        self.error = {
+            "num_samples": len(subset),
+            "rmse": float(np.sqrt(np.mean(diff**2))) if len(diff) else 0.0,
+            "max": float(np.abs(diff).max(initial=0)),
+            "relative": (
+                float(np.linalg.norm(diff) / norm) if norm > 0 else 0.0
+            ),
+        }
+        return self.error
+
+
+def select_landmarks(
+    n: int,
+    k: int,
+    block: BlockFn,
+    method: str = "farthest",
+    seed: Optional[int] = None,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Picks k landmark items and computes the distances from every item to
+    them.
+
+    :param n: Number of items.
+    :param k: Number of landmarks.
+    :param block: Computes the distances between items.
+    :param method: "random" picks landmarks uniformly; "farthest" starts
+    from a random item and repeatedly picks the item farthest from every
+    landmark so far.
+    :param seed: Seed of the random choices.
+    :returns: Tuple of (landmark indices, (n, k) distances to them).
+    """
+    if method not in ("random", "farthest"):
+        raise ValueError(f"Unknown landmark selection method {method}.")
+    if k < 2 or k > n:
+        raise ValueError(f"Number of landmarks must be in [2, {n}], not {k}.")
+    rng = np.random.default_rng(seed)
+    everything = np.arange(n)
+
+    if method == "random":
+        landmarks = np.sort(rng.choice(n, k, replace=False))
+        return landmarks, np.asarray(block(everything, landmarks))
+
+    landmarks = []
+    distances = np.zeros((n, k))
+    for c, (i, _, d) in enumerate(
+        farthest_points(n, block, int(rng.integers(n)), k)
+    ):
+        landmarks.append(i)
+        distances[:, c] = d
+    # fewer than k if the other items duplicate the landmarks
+    return np.array(landmarks), distances[:, : len(landmarks)]
+
+
+def farthest_points(
+    n: int, block: BlockFn, start: int = 0, depth: Optional[int] = None
+) -> Iterator[Tuple[int, float, np.ndarray]]:
+    """
+    Greedy k-center traversal: starting from one item, repeatedly picks the
+    item farthest from every item picked so far. The distance from every
+    item to its closest pick is updated in place, so each step computes one
+    column of distances. Items are yielded as soon as they are picked.
+
+    :param n: Number of items.
+    :param block: Computes the distances between items.
+    :param start: Index of the first item.
+    :param depth: Maximum number of items to pick; defaults to all of them.
+    The traversal also stops once every item is at distance 0 of a pick.
+    :returns: Iterator of (index, distance to the closest earlier pick,
+    distances from every item to it); the first distance is inf.
+    """
+    if not 0 <= start < n:
+        raise ValueError(f"Start must be in [0, {n}), not {start}.")
+    depth = n if depth is None else min(depth, n)
+    everything = np.arange(n)
+    nearest = np.full(n, np.inf)
+    current = start
+    for c in range(depth):
+        d = np.asarray(block(everything, np.array([current])))[:, 0]
+        yield current, float(nearest[current]), d
+        np.minimum(nearest, d, out=nearest)
+        nearest[current] = 0
+        if c + 1 == depth:
+            return
+        current = int(nearest.argmax())
+        if nearest[current] <= 0:
+            return
+
+
+def approximate_block(
+    block: BlockFn,
+    n: int,
+    k: int,
+    method: str = "farthest",
+    num_samples: int = 100,
+    seed: Optional[int] = None,
+) -> ApproximateDistanceMatrix:
+    """
+    Approximates the distance matrix of n items from the distances to k
+    landmarks, computing n * k distances instead of n * n.
+
+    :param block: Computes the exact distances between items.
+    :param n: Number of items.
+    :param k: Number of landmarks.
+    :param method: Landmark selection method; see select_landmarks.
+    :param num_samples: Number of items the error is estimated on; 0 skips
+    the estimate.
+    :param seed: Seed of the random choices.
+    """
+    landmarks, distances = select_landmarks(n, k, block, method, seed)
+    m = ApproximateDistanceMatrix(landmarks, distances)
+    if num_samples > 0:
+        m.estimate_error(block, num_samples, seed)
+    return m
+
+
+def approximate_distances(
+    items: Sequence[Any],
+    k: int,
+    fn: Optional[Callable[[int, int, np.ndarray, np.ndarray], float]] = None,
+    metric: Optional[str] = None,
+    method: str = "farthest",
+    num_samples: int = 100,
+    num_processes: int = 1,
+    seed: Optional[int] = None,
+) -> ApproximateDistanceMatrix:
+    """
+    Approximates pairwise_distances(items, fn, metric) from the distances
+    to k landmark items; see approximate_block.
+
+    :param items: The items to compare.
+    :param k: Number of landmarks.
+    :param fn: Called as fn(i, j, items[i], items[j]), if metric is
+    None; items are passed as in pairwise_distances.
+    :param metric: Name of a scipy.spatial.distance.cdist metric to use
+    instead of fn; items must be numeric and all have the same size.
+    :param method: Landmark selection method; see select_landmarks.
+    :param num_samples: Number of items the error is estimated on.
+    :param num_processes: Number of worker processes evaluating fn.
+    :param seed: Seed of the random choices.
+    """
+    if (fn is None) == (metric is None):
+        raise ValueError("Exactly one of fn and metric must be given.")
+
+    n = len(items)
+    if metric is not None:
+        packed = _pack(items)
+        if packed is None:
+            raise ValueError(f"Items must be numeric arrays to use {metric}.")
+        if len(set(np.diff(packed[1]))) > 1:
+            raise ValueError(f"Items must have the same size to use {metric}.")
+        flat = packed[0].reshape(n, -1)
+        return approximate_block(
+            lambda rows, cols: cdist(flat[rows], flat[cols], metric),
+            n,
+            k,
+            method,
+            num_samples,
+            seed,
+        )
+
+    try:
+        if num_processes == 1:
+            _worker.update(shm=(), items=items, fn=fn)
+            return approximate_block(
+                lambda rows, cols: _compute_block((rows, cols)),
+                n,
+                k,
+                method,
+                num_samples,
+                seed,
+            )
+
+        packed = _pack(items)
+        items_shm = None
+        if packed is None:
+            flat, offsets, shapes = None, None, None
+            items_spec = ("items", list(items))
+        else:
+            flat, offsets, shapes = packed
+            items_shm, items_spec = _share(flat)
+        try:
+            with Pool(
+                processes=num_processes,
+                initializer=_init_worker,
+                initargs=(items_spec, offsets, shapes, None, fn, None),
+            ) as pool:
+
+                def block(rows, cols):
+                    chunks = np.array_split(rows, num_processes)
+                    return np.concatenate(
+                        pool.map(_compute_block, [(c, cols) for c in chunks])
+                    )
+
+                return approximate_block(
+                    block, n, k, method, num_samples, seed
+                )
+        finally:
+            if items_shm is not None:
+                items_shm.close()
+                items_shm.unlink()
+    finally:
+        _worker.clear()
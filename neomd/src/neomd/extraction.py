@@ -61,8 +61,8 @@ try:
         driver,
         fc: FeatureCalculator,
         dm_items_fn=None,
-        norm=lambda x, y: np.linalg.norm(y - x),
-        num_processes=16,
+        norm=None,
+        num_processes=1,
         **kwargs,
     ):
         qb = Neo4jQueryBuilder.infer_db_structure(driver)
@@ -70,7 +70,7 @@ try:
         canonical, states = calculator.simplify_transitions(transition_list)
 
         print("Finished loading transitions.")
-        q = qb.get_states(states, True)
+        q = qb.get_states(states, True, columnar=True)
         ase_dict = converter.query_to_ASE(driver, q)
 
         os.makedirs(folder, exist_ok=True)
@@ -191,11 +191,14 @@ def ovito_modifier(states, ase_dict, modifier, preprocess_fn=lambda x: x):
 def calculate_tij_dm(
     t_list,
     items,
-    norm=lambda x, y: np.linalg.norm(y - x),
+    norm=None,
     rcond=1e-7,
-    num_processes=16,
+    num_processes=1,
+    landmarks=None,
 ):
     evs = calculate_ev(t_list, items, rcond=rcond)
-    m = calculator.distance_matrix(evs, fn=norm)
+    m = calculator.distance_matrix(
+        evs, fn=norm, num_processes=num_processes, landmarks=landmarks
+    )
 
     return m
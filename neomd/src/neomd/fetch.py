@@ -0,0 +1,146 @@
+#
+# © 2025. Triad National Security, LLC. All rights reserved.
+# This program was produced under U.S. Government contract 89233218CNA000001 for Los Alamos National Laboratory (LANL), which is operated by Triad National Security, LLC for the U.S. Department of Energy/National Nuclear Security Administration. All rights in the program are reserved by Triad National Security, LLC, and the U.S. Department of Energy/National Nuclear Security Administration. The Government is granted for itself and others acting on its behalf a nonexclusive, paid-up, irrevocable worldwide license in this material to reproduce, prepare. derivative works, distribute copies to the public, perform publicly and display publicly, and to permit others to do so.
+#
+"""
+Fetches large lists of states by splitting them into shards and running
+each shard on its own session from a thread pool.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List
+
+import neo4j
+from ase import Atoms
+from typeguard import typechecked
+
+from neomd import converter
+from neomd.queries import Neo4jQueryBuilder, Query
+
+
+def shard(id_list: List[int], shard_size: int) -> List[List[int]]:
+    """
+    Splits a list of IDs into consecutive shards of at most shard_size.
+
+    :param id_list: The IDs to split.
+    :param shard_size: Maximum size of each shard.
+    """
+    if shard_size < 1:
+        raise ValueError("shard_size must be at least 1.")
+    return [
+        id_list[i : i + shard_size] for i in range(0, len(id_list), shard_size)
+    ]
+
+
+@typechecked
+def fetch_sharded(
+    driver: neo4j.Driver,
+    id_list: List[int],
+    build_query: Callable[[List[int]], Query],
+    consume: Callable[[neo4j.Result], Any] = lambda r: r.data(),
+    shard_size: int = 1000,
+    max_workers: int = 4,
+) -> List[Any]:
+    """
+    Runs one query per shard of id_list on concurrent sessions.
+    Queries are built up front on the calling thread, since query
+    builders keep state; only the driver is shared between threads.
+
+    :param driver: Neo4j driver to run the queries with.
+    :param id_list: The IDs to fetch.
+    :param build_query: Builds the query for a shard of IDs.
+    :param consume: Converts a shard's result; runs inside its session.
+    :param shard_size: Maximum number of IDs per query.
+    :param max_workers: Maximum number of concurrent sessions.
+
+    :returns: The consumed result of each shard, in shard order.
+    """
+    queries = [build_query(s) for s in shard(id_list, shard_size)]
+
+    def run(q: Query):
+        with driver.session() as session:
+            return consume(session.run(q.text, q.params))
+
+    if len(queries) <= 1 or max_workers <= 1:
+        return [run(q) for q in queries]
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        return list(pool.map(run, queries))
+
+
+@typechecked
+def fetch_ASE(
+    driver: neo4j.Driver,
+    id_list: List[int],
+    order_by: str = "internal_id",
+    packed: bool = False,
+    shard_size: int = 1000,
+    max_workers: int = 4,
+) -> Dict[int, Atoms]:
+    """
+    Sharded equivalent of building a get_states query and running
+    converter.query_to_ASE on it.
+
+    :param driver: Neo4j driver to run the queries with.
+    :param id_list: The states to fetch.
+    :param order_by: The attribute to order each state's atoms by.
+    :param packed: Read the packed arrays stored on the State nodes.
+    :param shard_size: Maximum number of states per query.
+    :param max_workers: Maximum number of concurrent sessions.
+
+    :returns: Dict[int, ase.Atoms], a dictionary of state IDs to ASE Atoms.
+    """
+    qb = Neo4jQueryBuilder([("Atom", "PART_OF", "State", "MANY-TO-ONE")])
+
+    def build_query(ids):
+        return qb.get_states(
+            ids, True, order_by=order_by, columnar=True, packed=packed
+        )
+
+    ase_dict = {}
+    for d in fetch_sharded(
+        driver,
+        id_list,
+        build_query,
+        converter.result_to_ASE,
+        shard_size,
+        max_workers,
+    ):
+        ase_dict.update(d)
+    return ase_dict
+
+
+@typechecked
+def fetch_attributes(
+    driver: neo4j.Driver,
+    id_list: List[int],
+    attribute_list: List[str],
+    shard_size: int = 1000,
+    max_workers: int = 4,
+) -> List[Dict[str, Any]]:
+    """
+    Sharded equivalent of get_states with an attribute_list.
+
+    :param driver: Neo4j driver to run the queries with.
+    :param id_list: The states to fetch.
+    :param attribute_list: The State attributes to return.
+    :param shard_size: Maximum number of states per query.
+    :param max_workers: Maximum number of concurrent sessions.
+
+    :returns: A list of dictionaries of attribute names to values.
+    """
+    qb = Neo4jQueryBuilder(nodes=["State"])
+
+    def build_query(ids):
+        return qb.get_states(id_list=ids, attribute_list=attribute_list)
+
+    data = []
+    for d in fetch_sharded(
+        driver,
+        id_list,
+        build_query,
+        shard_size=shard_size,
+        max_workers=max_workers,
+    ):
+        data += d
+    return data
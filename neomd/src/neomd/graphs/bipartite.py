@@ -3,31 +3,48 @@
 # This program was produced under U.S. Government contract 89233218CNA000001 for Los Alamos National Laboratory (LANL), which is operated by Triad National Security, LLC for the U.S. Department of Energy/National Nuclear Security Administration. All rights in the program are reserved by Triad National Security, LLC, and the U.S. Department of Energy/National Nuclear Security Administration. The Government is granted for itself and others acting on its behalf a nonexclusive, paid-up, irrevocable worldwide license in this material to reproduce, prepare. derivative works, distribute copies to the public, perform publicly and display publicly, and to permit others to do so.
 #
 """
-Wrapper over networkx.graph that builds an n-partite graph from n StateGraphs.
+n-partite graph built from n StateGraphs.
 Each "layer" of the n-partite graph corresponds to one StateGraph,
 so each node is an atom.
 Atoms between layers are connected iff the difference in the bond
 lengths is above the threshold set.
+Edges are kept in arrays; a networkx graph is exported on demand.
 """
 import networkx as nx
+import numpy as np
 from neomd.graphs import StateGraph, graphutils
 import copy
-from typing import Set, List, Union, Tuple
-import math
+from scipy import sparse
+from typing import Set, List, Optional, Union, Tuple
+
 
 class TransitionGraph:
+    graphs: List[StateGraph]
+    offsets: np.ndarray  # index of the first node of each layer
+    edges: np.ndarray  # (m, 2) intra-layer edges between global node indices
+    bond_weight: np.ndarray  # bond weight of each intra-layer edge
+    # bond_delta[k][i] weighs the edge between atom i in layers k and k + 1
+    bond_delta: List[np.ndarray]
+
     def __init__(self, *args: StateGraph, threshold=0.1):
-        self.graph = nx.Graph()
-        for i, sg in enumerate(args):
-            self.__stack_graph(sg)
+        self.graphs = []
+        self.threshold = threshold
+        self.offsets = np.zeros(1, dtype=np.int64)
+        self.edges = np.zeros((0, 2), dtype=np.int64)
+        self.bond_weight = np.zeros(0)
+        self.weighted_distance = None
+        self.bond_delta = []
 
-        for i in range(0, len(args) - 1):
-            g1 = args[i]
-            g2 = args[i + 1]
-            self.__connect_edges(g1, g2, threshold)
+        # removed nodes and edges are masked out
+        self.node_mask = np.zeros(0, dtype=bool)
+        self.edge_mask = np.zeros(0, dtype=bool)
+        self.delta_mask = []
+        self._graph = None
 
-        self.graphs = [a for a in args]
-        self.threshold = threshold
+        if len(args) > 0:
+            self.__stack_graph(args[0])
+            self.graphs.append(args[0])
+            self.stack_graphs(*args[1:])
 
     def __connect_edges(self, g1: StateGraph, g2: StateGraph, threshold):
         """
@@ -37,57 +54,30 @@ class TransitionGraph:
         :param g2: Second state graph to connect.
         :param threshold: Relative bond delta threshold.
         """
-        bond_delta = graphutils.calculate_rel_bond_delta(g1, g2)
-
-        def get_graph_nodes(g):
-            return list(
-                map(
-                    lambda e: e[0],
-                    filter(
-                        lambda n: n[1]["bipartite"] == g.id,
-                        self.graph.nodes(data=True),
-                    ),
-                )
-            )
-
-        g1_nodes = get_graph_nodes(g1)
-        g2_nodes = get_graph_nodes(g2)
-
-        for n1, n2 in zip(g1_nodes, g2_nodes):
-            atom_number = self.graph.nodes[n1]["atom_number"]
-
-            # find neighbor max delta
-            n1n = list(nx.neighbors(g1.graph, atom_number))
-            n2n = list(nx.neighbors(g2.graph, atom_number))
-
-            delta = list(
-                map(lambda n: bond_delta[atom_number][n], list(set(n1n + n2n)))
-            )
-
-            bd = max(delta)
-            bd = max(0, bd - threshold)
-
-            self.graph.add_edge(
-                n1,
-                n2,
-                bond_delta=bd,
-            )
+        # each atom is weighed by the largest delta among its neighbors
+        bond_delta = graphutils.sparse_rel_bond_delta(g1, g2)
+        max_delta = bond_delta.max(axis=1).toarray().ravel()
+        self.bond_delta.append(np.maximum(0, max_delta - threshold))
+        self.delta_mask.append(np.ones(g1.size(), dtype=bool))
 
         self.__calculate_weights()
 
-    # adds a graph layer without edges
+    # adds a graph layer without edges to other layers
     def __stack_graph(self, sg: StateGraph):
-        for n in sg.graph.nodes:
-            key = f"{str(n)}_{sg.id}"
-            self.graph.add_node(key, bipartite=sg.id, atom_number=n)
-
-        for u, v in sg.graph.edges:
-            bl = sg.graph[u][v]["bond_weight"]
-            self.graph.add_edge(
-                f"{str(u)}_{sg.id}",
-                f"{str(v)}_{sg.id}",
-                bond_weight=bl,
-            )
+        start = self.offsets[-1]
+        w = sparse.triu(sg.bond_weights).tocoo()
+        self.edges = np.concatenate(
+            [self.edges, np.column_stack([w.row, w.col]) + start]
+        )
+        self.bond_weight = np.concatenate([self.bond_weight, w.data])
+        self.offsets = np.append(self.offsets, start + sg.size())
+        self.node_mask = np.concatenate(
+            [self.node_mask, np.ones(sg.size(), dtype=bool)]
+        )
+        self.edge_mask = np.concatenate(
+            [self.edge_mask, np.ones(len(w.data), dtype=bool)]
+        )
+        self._graph = None
 
     def stack_graphs(self, *args: StateGraph):
         """
@@ -112,75 +102,106 @@ class TransitionGraph:
         """
         return list(map(lambda g: g.id, self.graphs))
 
+    def layer(self, nodes: np.ndarray) -> np.ndarray:
+        """
+        Returns the layer each of the given global node indices belongs to.
+
+        :param nodes: Global node indices.
+        """
+        return np.searchsorted(self.offsets, nodes, side="right") - 1
+
+    def atom_number(self, nodes: np.ndarray) -> np.ndarray:
+        """
+        Returns the atom number of each of the given global node indices.
+
+        :param nodes: Global node indices.
+        """
+        return nodes - self.offsets[self.layer(nodes)]
+
+    def _copy(self):
+        # the state graphs are shared; only the masks change
+        g = copy.copy(self)
+        g.node_mask = self.node_mask.copy()
+        g.edge_mask = self.edge_mask.copy()
+        g.delta_mask = [m.copy() for m in self.delta_mask]
+        g._graph = None
+        return g
+
     def reduce(self):
         """
         Reduces the transition graph to only the atoms that moved.
         """
-        g = copy.deepcopy(self)
-        moved = self.get_moved()
-        for n in self.graph.nodes:
-            if n["atom_number"] not in moved:
-                g.graph.remove_node(n)
+        g = self._copy()
+        moved = np.zeros(self.graphs[0].size(), dtype=bool)
+        moved[list(self.get_moved())] = True
+        g.node_mask &= moved[self.atom_number(np.arange(len(self.node_mask)))]
+        g._drop_dangling()
         g.remove_unconnected()
         return g
 
     def reduce_by_edge(self):
-        g = copy.deepcopy(self)
+        g = self._copy()
         g.remove_null_edges()
         g.remove_unconnected()
         return g
 
     def __calculate_weights(self):
         """
-        Calculates the weights for each edge. Each inter-state edge
+        Calculates the weights for each edge. Each intra-layer edge
         is weighed by how much the bond length changes between its
         bipartite equivalent in the graph.
         """
-        inner_edges = list(
-            filter(
-                lambda e: "bond_delta" not in self.graph.edges[e], self.graph.edges
-            )
+        # each node uses its edge to the previous layer, or to the next
+        # layer for the first one
+        node_delta = np.concatenate(
+            [self.bond_delta[0]]
+            + self.bond_delta[: len(self.offsets) - 2]
         )
+        u, v = self.edges[:, 0], self.edges[:, 1]
+        self.weighted_distance = np.sqrt(
+            self.bond_weight * np.sqrt(node_delta[u] * node_delta[v])
+        )
+        self._graph = None
+
+    def _drop_dangling(self):
+        # removes edges whose nodes were removed
+        self.edge_mask &= (
+            self.node_mask[self.edges[:, 0]] & self.node_mask[self.edges[:, 1]]
+        )
+        for k, m in enumerate(self.delta_mask):
+            start, end = self.offsets[k], self.offsets[k + 1]
+            m &= self.node_mask[start:end] & self.node_mask[end : end + len(m)]
+        self._graph = None
+
+    def degree(self) -> np.ndarray:
+        """
+        Returns the degree of every node, counting only kept edges.
+        """
+        degree = np.bincount(
+            self.edges[self.edge_mask].ravel(), minlength=len(self.node_mask)
+        )
+        for k, m in enumerate(self.delta_mask):
+            start, end = self.offsets[k], self.offsets[k + 1]
+            degree[start:end] += m
+            degree[end : end + len(m)] += m
+        return degree
 
-        for u, v in inner_edges:
-            edge = self.graph[u][v]
-            # get the bipartite edge for each node
-            bp1 = list(filter(lambda e: "bond_delta" in self.graph.edges[e], self.graph.edges(u)))[0]
-            bp2 = list(filter(lambda e: "bond_delta" in self.graph.edges[e], self.graph.edges(v)))[0]
-            edge["weighted_distance"] = math.sqrt(edge["bond_weight"] * math.sqrt(self.graph.edges[bp1]["bond_delta"] * self.graph.edges[bp2]["bond_delta"]))
-            self.graph.edges[bp1]["weighted_distance"] = self.graph.edges[bp1]["bond_delta"]  
-            self.graph.edges[bp2]["weighted_distance"] = self.graph.edges[bp2]["bond_delta"]
-    
     def remove_unconnected(self):
         """
         Removes any nodes from that graph that are not connected
         """
-        g = copy.deepcopy(self.graph)
-        for n in self.graph.nodes:
-            if self.graph.degree[n] == 0:
-                g.remove_node(n)
-        self.graph = g
+        self.node_mask &= self.degree() > 0
+        self._graph = None
 
     def remove_null_edges(self):
         """
         Removes edges that have 0 weight.
         """
-        graph_edges = list(
-            filter(
-                lambda e: "weighted_distance" in self.graph.edges[e]
-                and self.graph.edges[e]["weighted_distance"] == 0.0,
-                self.graph.edges,
-            )
-        )
-        self.graph.remove_edges_from(graph_edges)
-        graph_edges = list(
-            filter(
-                lambda e: "bond_delta" in self.graph.edges[e]
-                and self.graph.edges[e]["bond_delta"] == 0.0,
-                self.graph.edges,
-            )
-        )
-        self.graph.remove_edges_from(graph_edges)
+        if self.weighted_distance is not None:
+            self.edge_mask &= self.weighted_distance != 0.0
+        for m, d in zip(self.delta_mask, self.bond_delta):
+            m &= d != 0.0
+        self._graph = None
 
     def get_transitions(self) -> Union[Tuple[int, int], List[Tuple[int, int]]]:
         """
@@ -205,12 +226,93 @@ class TransitionGraph:
         :return: A set of atom ids that moved during the transition.
         """
         moved = set()
-        for e in self.graph.edges:
-            edge = self.graph.edges[e]
-            if "bond_delta" in edge and edge["bond_delta"] > 0:
-                moved.add(self.graph.nodes[e[0]]["atom_number"])
+        for m, d in zip(self.delta_mask, self.bond_delta):
+            moved.update(np.nonzero(m & (d > 0))[0].tolist())
         return moved
 
+    def adjacency_matrix(
+        self, weight: Optional[str] = None
+    ) -> sparse.csr_matrix:
+        """
+        Returns the adjacency matrix of the kept nodes, in the order of the
+        nodes of self.graph, as nx.to_numpy_array(self.graph, weight)
+        would, without building the networkx graph.
+
+        :param weight: Edge attribute to use as weights; edges are weighed
+        1 if None or if they don't have it.
+        """
+        n = len(self.node_mask)
+        ones = np.ones(len(self.bond_weight))
+        intra = {"bond_weight": self.bond_weight}
+        if self.weighted_distance is not None:
+            intra["weighted_distance"] = self.weighted_distance
+        rows = [self.edges[self.edge_mask, 0]]
+        cols = [self.edges[self.edge_mask, 1]]
+        data = [intra.get(weight, ones)[self.edge_mask]]
+
+        for k, (m, d) in enumerate(zip(self.delta_mask, self.bond_delta)):
+            nodes = np.nonzero(m)[0]
+            rows.append(nodes + self.offsets[k])
+            cols.append(nodes + self.offsets[k + 1])
+            if weight in ("bond_delta", "weighted_distance"):
+                data.append(d[nodes])
+            else:
+                data.append(np.ones(len(nodes)))
+
+        rows, cols, data = map(np.concatenate, (rows, cols, data))
+        a = sparse.csr_matrix(
+            (
+                np.concatenate([data, data]),
+                (np.concatenate([rows, cols]), np.concatenate([cols, rows])),
+            ),
+            shape=(n, n),
+        )
+        keep = np.nonzero(self.node_mask)[0]
+        return a[keep][:, keep]
+
+    def _key(self, node: int) -> str:
+        k = self.layer(node)
+        return f"{node - self.offsets[k]}_{self.graphs[k].id}"
+
+    @property
+    def graph(self) -> nx.Graph:
+        """
+        networkx export of the graph. Nodes are named "{atom}_{state ID}"
+        and have "bipartite" and "atom_number" attributes. Intra-layer edges
+        have a "bond_weight", edges between layers a "bond_delta", and both
+        a "weighted_distance". Built on first use; changes to it are not
+        reflected in the TransitionGraph.
+        """
+        if self._graph is not None:
+            return self._graph
+
+        g = nx.Graph()
+        for k, sg in enumerate(self.graphs):
+            start = self.offsets[k]
+            kept = np.nonzero(self.node_mask[start : self.offsets[k + 1]])[0]
+            for n in kept:
+                g.add_node(f"{n}_{sg.id}", bipartite=sg.id, atom_number=int(n))
+
+        for i in np.nonzero(self.edge_mask)[0]:
+            u, v = self.edges[i]
+            attributes = {"bond_weight": self.bond_weight[i]}
+            if self.weighted_distance is not None:
+                attributes["weighted_distance"] = self.weighted_distance[i]
+            g.add_edge(self._key(u), self._key(v), **attributes)
+
+        for k, (m, d) in enumerate(zip(self.delta_mask, self.bond_delta)):
+            id1, id2 = self.graphs[k].id, self.graphs[k + 1].id
+            for n in np.nonzero(m)[0]:
+                g.add_edge(
+                    f"{n}_{id1}",
+                    f"{n}_{id2}",
+                    bond_delta=d[n],
+                    weighted_distance=d[n],
+                )
+
+        self._graph = g
+        return g
+
     def draw(self, x_gap: int = 10, y_gap: int = 5):
         """
         Rendering function for debugging, only really works inside
@@ -10,12 +10,13 @@ import scipy.sparse as sp
 from ase import neighborlist
 from netrd.distance import distributional_nbd
 from scipy.integrate import quad
-from scipy.linalg import eigh
+from scipy.linalg import eigh, eigvalsh
 from scipy.sparse.csgraph import laplacian
 from scipy.special import erf
 from tqdm import tqdm
 from typeguard import typechecked
 from scipy.linalg import subspace_angles
+from typing import List
 from neomd.graphs import StateGraph
 
 
@@ -83,6 +84,65 @@ def calculate_rel_bond_delta(s1: StateGraph, s2: StateGraph):
     return delta / avg
 
 
+def bonded_pairs(s1: StateGraph, s2: StateGraph) -> sp.csr_matrix:
+    """
+    Returns the pairs of atoms that are bonded in either state graph, as
+    the sparsity pattern of a CSR matrix.
+
+    :param s1: State graph 1
+    :param s2: State graph 2
+    """
+    if s1.size() != s2.size():
+        raise ValueError(
+            f"""Graphs must be the same size!
+            S1 size: {s1.size()} / S2 size: {s2.size()}."""
+        )
+    pairs = (s1.adjacency + s2.adjacency).tocsr()
+    pairs.sort_indices()
+    return pairs
+
+
+def _pair_distances(s: StateGraph, pairs: sp.csr_matrix) -> sp.csr_matrix:
+    # same distances as get_distance_matrix, only for the given pairs
+    i = np.repeat(np.arange(pairs.shape[0]), np.diff(pairs.indptr))
+    d = np.linalg.norm(s.positions[pairs.indices] - s.positions[i], axis=1)
+    return sp.csr_matrix((d, pairs.indices, pairs.indptr), shape=pairs.shape)
+
+
+@typechecked
+def sparse_bond_delta(s1: StateGraph, s2: StateGraph) -> sp.csr_matrix:
+    """
+    Sparse equivalent of calculate_bond_delta; only the pairs bonded in
+    either state graph are stored.
+
+    :param s1: State graph 1
+    :param s2: State graph 2
+    """
+    pairs = bonded_pairs(s1, s2)
+    d1 = _pair_distances(s1, pairs)
+    d2 = _pair_distances(s2, pairs)
+    return sp.csr_matrix(
+        (np.absolute(d2.data - d1.data), pairs.indices, pairs.indptr),
+        shape=pairs.shape,
+    )
+
+
+@typechecked
+def sparse_rel_bond_delta(s1: StateGraph, s2: StateGraph) -> sp.csr_matrix:
+    """
+    Sparse equivalent of calculate_rel_bond_delta; only the pairs bonded in
+    either state graph are stored.
+
+    :param s1: State graph 1
+    :param s2: State graph 2
+    """
+    pairs = bonded_pairs(s1, s2)
+    d1 = _pair_distances(s1, pairs)
+    d2 = _pair_distances(s2, pairs)
+    rel = np.absolute(d2.data - d1.data) / ((d1.data + d2.data) / 2.0)
+    return sp.csr_matrix((rel, pairs.indices, pairs.indptr), shape=pairs.shape)
+
+
 # adapted from netrd - added ability to get weighted adjacency matrix
 def pseudo_hashimoto(graph, weight=None):
     """
@@ -159,6 +219,135 @@ def im_distance(density1, density2):
     return np.sqrt(quad(func, -np.inf, np.inf, limit=100)[0])
 
 
+def laplacian_spectrum(adjacency) -> np.ndarray:
+    """
+    Returns the square roots of the non-zero Laplacian eigenvalues of a
+    graph, the peaks of the density used by im_spectrum.
+
+    :param adjacency: Dense or sparse (weighted) adjacency matrix.
+    """
+    if sp.issparse(adjacency):
+        adjacency = adjacency.toarray()
+    laplace = laplacian(np.asarray(adjacency, dtype=np.float64), normed=False)
+    return np.sqrt(np.abs(eigvalsh(laplace)[1:]))
+
+
+# padding for spectra shorter than the longest; far enough from every peak
+# that padded peaks contribute nothing
+_PAD = 1e12
+
+
+def _lorentzian_overlaps(a, b, hwhm):
+    # sum over peaks i, j of the integral of L(w - a[i]) * L(w - b[j]) for
+    # normalized Lorentzians L, which is a Lorentzian of twice the width
+    k = a[:, np.newaxis, :, np.newaxis] - b[np.newaxis, :, np.newaxis, :]
+    np.square(k, out=k)
+    k += 4 * hwhm**2
+    np.reciprocal(k, out=k)
+    return k.sum(axis=(2, 3)) * (2 * hwhm / np.pi)
+
+
+def _padded_peaks(spectra):
+    width = max([len(x) for x in spectra] + [1])
+    peaks = np.full((len(spectra), width), _PAD)
+    for i, x in enumerate(spectra):
+        peaks[i, : len(x)] = x
+    # the padding is on opposite sides for the two sides of each pair
+    other = np.where(peaks == _PAD, -_PAD, peaks)
+    # im_spectrum divides by (n - 1) * pi / 2, with n - 1 == len(x)
+    weights = np.array([2 / len(x) if len(x) > 0 else 0 for x in spectra])
+    return peaks, other, weights
+
+
+def lorentzian_distance_matrix(
+    spectra: List[np.ndarray], hwhm: float = 0.08, block_size: int = 1 << 24
+) -> np.ndarray:
+    """
+    Computes im_distance between the densities of every pair of spectra in
+    closed form. The densities are sums of Lorentzians, so the integral of
+    their squared difference is a sum of Lorentzians of the differences
+    between peaks; no quadrature is needed. Only the upper triangle is
+    computed, in blocks.
+
+    :param spectra: Spectra as returned by laplacian_spectrum.
+    :param hwhm: Half-width at half-maximum of the Lorentzians.
+    :param block_size: Approximate number of peak pairs evaluated at a time;
+    bounds the memory used.
+    :returns: Symmetric (n, n) distance matrix.
+    """
+    n = len(spectra)
+    peaks, other, weights = _padded_peaks(spectra)
+    width = peaks.shape[1]
+
+    rows = max(1, int(np.sqrt(block_size)) // width)
+    overlaps = np.zeros((n, n))
+    for i in range(0, n, rows):
+        for j in range(i, n, rows):
+            overlaps[i : i + rows, j : j + rows] = _lorentzian_overlaps(
+                peaks[i : i + rows], other[j : j + rows], hwhm
+            )
+    overlaps = np.triu(overlaps) + np.triu(overlaps, 1).T
+    overlaps *= np.outer(weights, weights)
+
+    self_overlap = np.diag(overlaps)
+    m = self_overlap[:, np.newaxis] + self_overlap[np.newaxis] - 2 * overlaps
+    m = np.sqrt(np.maximum(m, 0))
+    np.fill_diagonal(m, 0)
+    return m
+
+
+def lorentzian_distances(
+    spectra: List[np.ndarray],
+    rows,
+    cols,
+    hwhm: float = 0.08,
+    block_size: int = 1 << 24,
+) -> np.ndarray:
+    """
+    Computes the same distances as lorentzian_distance_matrix, only between
+    the spectra at the given row and column indices.
+
+    :param spectra: Spectra as returned by laplacian_spectrum.
+    :param rows: Indices of the spectra of each row.
+    :param cols: Indices of the spectra of each column.
+    :param hwhm: Half-width at half-maximum of the Lorentzians.
+    :param block_size: Approximate number of peak pairs evaluated at a time.
+    :returns: (len(rows), len(cols)) distance matrix.
+    """
+    rows = np.asarray(rows, dtype=np.int64)
+    cols = np.asarray(cols, dtype=np.int64)
+    used = np.union1d(rows, cols)
+    peaks, other, weights = _padded_peaks([spectra[i] for i in used])
+    width = peaks.shape[1]
+    rows = np.searchsorted(used, rows)
+    cols = np.searchsorted(used, cols)
+
+    # overlap of each spectrum with itself
+    k = peaks[:, :, np.newaxis] - other[:, np.newaxis, :]
+    self_overlap = (1 / (k**2 + 4 * hwhm**2)).sum(axis=(1, 2))
+    self_overlap *= weights**2 * (2 * hwhm / np.pi)
+
+    step = max(1, block_size // (width * width * max(len(cols), 1)))
+
+    overlaps = np.concatenate(
+        [
+            _lorentzian_overlaps(peaks[rows[i : i + step]], other[cols], hwhm)
+            for i in range(0, len(rows), step)
+        ]
+        or [np.zeros((0, len(cols)))]
+    )
+    overlaps *= np.outer(weights[rows], weights[cols])
+
+    m = (
+        self_overlap[rows, np.newaxis]
+        + self_overlap[np.newaxis, cols]
+        - 2 * overlaps
+    )
+    m = np.sqrt(np.maximum(m, 0))
+    m[rows[:, np.newaxis] == cols[np.newaxis]] = 0
+    return m
+
+
 def euclidean_spectra_comp(density1, density2, a=0, b=2):
     integrand = lambda x: (density1(x) - density2(x)) ** 2
     return np.sqrt(quad(integrand, a, b)[0])
@@ -2,53 +2,257 @@
 # © 2025. Triad National Security, LLC. All rights reserved.
 # This program was produced under U.S. Government contract 89233218CNA000001 for Los Alamos National Laboratory (LANL), which is operated by Triad National Security, LLC for the U.S. Department of Energy/National Nuclear Security Administration. All rights in the program are reserved by Triad National Security, LLC, and the U.S. Department of Energy/National Nuclear Security Administration. The Government is granted for itself and others acting on its behalf a nonexclusive, paid-up, irrevocable worldwide license in this material to reproduce, prepare. derivative works, distribute copies to the public, perform publicly and display publicly, and to permit others to do so.
 #
+import hashlib
 import networkx as nx
 from ase import Atoms, neighborlist
 import numpy as np
-from typing import Dict, Any
+from scipy import sparse
+from scipy.spatial import cKDTree
+from scipy.spatial.distance import cdist
+from typing import Dict, Any, Optional, Tuple
 
 """
-StateGraphs are networkx representations of Atoms objects.
+StateGraphs are graph representations of Atoms objects. Bonds are kept as
+sparse matrices; a networkx view is built on demand.
 """
 
 
-def _update_nodes(g, atoms):
-    for idx, a in enumerate(atoms):
-        g.nodes[idx]["id"] = a.tag
+def neighbor_pairs(
+    atoms: Atoms, cutoff: float
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Finds every pair of atoms closer than cutoff, in both directions.
+    Non-periodic structures are searched with a KD-tree; periodic ones
+    with ASE's neighbor list, using minimum image distances.
 
-        x, y, z = a.position
-        g.nodes[idx]["p_x"] = x
-        g.nodes[idx]["p_y"] = y
-        g.nodes[idx]["p_z"] = z
+    :param atoms: The structure to search.
+    :param cutoff: Distance in Angstroms below which atoms are bonded.
+    :returns: Tuple of (first atoms, second atoms, distances).
+    """
+    positions = atoms.get_positions()
+    if not atoms.pbc.any():
+        pairs = cKDTree(positions).query_pairs(cutoff, output_type="ndarray")
+        i, j = pairs[:, 0], pairs[:, 1]
+        d = np.linalg.norm(positions[j] - positions[i], axis=1)
+        keep = d < cutoff
+        i, j, d = i[keep], j[keep], d[keep]
+        return np.concatenate([i, j]), np.concatenate([j, i]), np.tile(d, 2)
 
+    i, j, d = neighborlist.neighbor_list("ijd", atoms, cutoff)
+    # small cells can see several images of the same atom; keep the closest
+    order = np.lexsort((d, j, i))
+    i, j, d = i[order], j[order], d[order]
+    first = np.ones(len(i), dtype=bool)
+    first[1:] = (i[1:] != i[:-1]) | (j[1:] != j[:-1])
+    keep = first & (i != j)
+    return i[keep], j[keep], d[keep]
 
-class StateGraph:
-    def __init__(self, atoms: Atoms, id: int):
-        # will break when fed something other than Pt atoms
-        an = neighborlist.build_neighbor_list(
-            atoms, [1.5] * len(atoms), skin=0, bothways=True
+
+def _mix(x: np.ndarray) -> np.ndarray:
+    # splitmix64 finalizer; the same input always gives the same output,
+    # unlike hash(), so colors can be compared between processes
+    x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return x ^ (x >> np.uint64(31))
+
+
+def refine_colors(adjacency: sparse.csr_matrix) -> np.ndarray:
+    """
+    Color refinement (1-dimensional Weisfeiler-Lehman). Every node starts
+    colored by its degree and is recolored by its color and the colors of
+    its neighbors until the partition into colors stops changing. Colors
+    only depend on the structure of the graph, so they can be compared
+    between graphs; isomorphisms always map nodes to nodes of the same color.
+
+    :param adjacency: Adjacency matrix of the graph to color.
+    :returns: The color of each node.
+    """
+    indptr, indices = adjacency.indptr, adjacency.indices
+    degrees = np.diff(indptr)
+    nonempty = degrees > 0
+    colors = _mix(degrees.astype(np.uint64) + np.uint64(1))
+    classes = len(np.unique(colors))
+    while True:
+        # sum of mixed neighbor colors identifies the multiset of them
+        neighbors = np.zeros(len(colors), dtype=np.uint64)
+        if len(indices) > 0:
+            neighbors[nonempty] = np.add.reduceat(
+                _mix(colors[indices] ^ np.uint64(0x9E3779B97F4A7C15)),
+                indptr[:-1][nonempty],
+            )
+        colors = _mix(colors ^ _mix(neighbors))
+        refined = len(np.unique(colors))
+        if refined == classes:
+            return colors
+        classes = refined
+
+
+def colors_hash(colors: np.ndarray) -> str:
+    """
+    Weisfeiler-Lehman hash of a graph from its refined colors.
+
+    :param colors: Colors returned by refine_colors.
+    """
+    return hashlib.blake2b(
+        str(sorted(colors.tolist())).encode(), digest_size=16
+    ).hexdigest()
+
+
+def annotate(g: nx.Graph) -> str:
+    """
+    Stores the refined colors of a graph's nodes as their "color" attribute
+    and its Weisfeiler-Lehman hash as the "wl_hash" graph attribute, unless
+    they were already computed. Both are kept when the nodes are relabelled.
+
+    :param g: The graph to annotate.
+    :returns: The Weisfeiler-Lehman hash of the graph.
+    """
+    if "wl_hash" not in g.graph:
+        nodes = list(g)
+        colors = refine_colors(
+            nx.to_scipy_sparse_array(g, nodelist=nodes, format="csr")
         )
+        nx.set_node_attributes(g, dict(zip(nodes, colors.tolist())), "color")
+        g.graph["wl_hash"] = colors_hash(colors)
+    return g.graph["wl_hash"]
 
-        cm = an.get_connectivity_matrix()
-        g = nx.from_numpy_array(cm)
-        m = atoms.get_all_distances()
 
-        # calculate once to save time
-        _update_nodes(g, atoms)
+def match_graphs(g1: nx.Graph, g2: nx.Graph) -> Optional[Dict[Any, Any]]:
+    """
+    Finds an isomorphism from g1 to g2. Graphs with different hashes are
+    rejected without searching, and VF2 only pairs nodes of the same color.
 
-        # remove self-loops
-        for u, v in g.edges:
-            if u == v:
-                g.remove_edge(u, v)
-            else:
-                # 1/3 is the threshold, make this a parameter
-                # 5 is bond_weight scaling factor
-                g[u][v]["bond_weight"] = max(1 / m[u][v] - 1 / 3.0, 0) * 5
+    :param g1: Graph to map from.
+    :param g2: Graph to map to.
+    :returns: Dictionary of g1's nodes to g2's nodes, or None if the graphs
+    are not isomorphic.
+    """
+    if annotate(g1) != annotate(g2):
+        return None
+    matcher = nx.isomorphism.GraphMatcher(
+        g1, g2, node_match=nx.isomorphism.categorical_node_match("color", None)
+    )
+    if not matcher.is_isomorphic():
+        return None
+    return matcher.mapping
+
+
+class StateGraph:
+    atoms: Atoms
+    id: int
+    positions: np.ndarray  # (n, 3) positions, in node order
+    tags: np.ndarray  # atom IDs, in node order
+    bond_lengths: sparse.csr_matrix  # distance between bonded atoms
+    bond_weights: sparse.csr_matrix  # same sparsity as bond_lengths
+
+    def __init__(self, atoms: Atoms, id: int, cutoff: float = 3.0):
+        """
+        Builds the graph of the bonds in a structure.
+
+        :param atoms: The structure.
+        :param id: ID of the state.
+        :param cutoff: Distance in Angstroms below which atoms are bonded.
+        """
+        # will break when fed something other than Pt atoms
+        n = len(atoms)
+        i, j, _ = neighbor_pairs(atoms, cutoff)
+        # bonds are found across periodic boundaries, but their lengths are
+        # the direct distances between the positions, as in
+        # get_distance_matrix and the bond deltas
+        positions = atoms.get_positions()
+        d = np.linalg.norm(positions[j] - positions[i], axis=1)
+        self.bond_lengths = sparse.csr_matrix((d, (i, j)), shape=(n, n))
+        self.bond_lengths.sort_indices()
+        # 1/3 is the threshold, make this a parameter
+        # 5 is bond_weight scaling factor
+        self.bond_weights = self.bond_lengths.copy()
+        self.bond_weights.data = (
+            np.maximum(1 / self.bond_lengths.data - 1 / 3.0, 0) * 5
+        )
 
-        self.graph = g
         self.atoms = atoms
         self.id = id
-        self.dm = m
+        self.positions = positions
+        self.tags = atoms.get_tags()
+        self._colors = None
+        self._graph = None
+
+    @property
+    def adjacency(self) -> sparse.csr_matrix:
+        """
+        Boolean adjacency matrix of the graph.
+        """
+        return self.bond_lengths.astype(bool)
+
+    def adjacency_matrix(
+        self, weight: Optional[str] = None
+    ) -> sparse.csr_matrix:
+        """
+        Returns the adjacency matrix as nx.to_numpy_array(self.graph, weight)
+        would, without building the networkx view.
+
+        :param weight: Edge attribute to use as weights; edges are weighed
+        1 if None or if they don't have it.
+        """
+        if weight == "bond_weight":
+            return self.bond_weights
+        return self.adjacency.astype(np.float64)
+
+    @property
+    def colors(self) -> np.ndarray:
+        """
+        Refined color of every node; see refine_colors.
+        """
+        if self._colors is None:
+            self._colors = refine_colors(self.bond_lengths)
+        return self._colors
+
+    @property
+    def wl_hash(self) -> str:
+        """
+        Weisfeiler-Lehman hash of the graph; graphs with different hashes
+        are not isomorphic.
+        """
+        return colors_hash(self.colors)
+
+    @property
+    def graph(self) -> nx.Graph:
+        """
+        networkx view of the graph. Nodes are atom indices with "id",
+        "p_x", "p_y", "p_z" and "color" attributes, and edges have a
+        "bond_weight". Built on first use; changes to it are not
+        reflected in the StateGraph.
+        """
+        if self._graph is None:
+            g = nx.Graph(wl_hash=self.wl_hash)
+            g.add_nodes_from(
+                (
+                    n,
+                    {
+                        "id": tag,
+                        "p_x": x,
+                        "p_y": y,
+                        "p_z": z,
+                        "color": color,
+                    },
+                )
+                for n, (tag, (x, y, z), color) in enumerate(
+                    zip(
+                        self.tags.tolist(),
+                        self.positions.tolist(),
+                        self.colors.tolist(),
+                    )
+                )
+            )
+            w = sparse.triu(self.bond_weights).tocoo()
+            g.add_edges_from(
+                (u, v, {"bond_weight": b})
+                for u, v, b in zip(
+                    w.row.tolist(), w.col.tolist(), w.data.tolist()
+                )
+            )
+            self._graph = g
+        return self._graph
 
     # overload subtraction to get difference between two states
     def __sub__(self, other) -> Dict[int, Dict[str, Any]]:
@@ -59,13 +263,11 @@ class StateGraph:
         :param other: A StateGraph
         :returns: A dictionary of differences, keyed by atom number.
         """
-        transform = {}
-        for n in self.graph.nodes:
-            dx = self.graph.nodes[n]["p_x"] - other.graph.nodes[n]["p_x"]
-            dy = self.graph.nodes[n]["p_y"] - other.graph.nodes[n]["p_y"]
-            dz = self.graph.nodes[n]["p_z"] - other.graph.nodes[n]["p_z"]
-            transform[n] = {"dx": dx, "dy": dy, "dz": dz}
-        return transform
+        diff = (self.positions - other.positions).tolist()
+        return {
+            n: {"dx": dx, "dy": dy, "dz": dz}
+            for n, (dx, dy, dz) in enumerate(diff)
+        }
 
     def __lshift__(self, other):
         """
@@ -74,7 +276,19 @@ class StateGraph:
         :returns: The mapping used to relabel self.
         """
         mapping = self.map_from(other)
-        self.graph = nx.relabel_nodes(self.graph, mapping)
+        # node x becomes node mapping[x]
+        inverse = np.empty(self.size(), dtype=np.int64)
+        inverse[[mapping[x] for x in range(self.size())]] = np.arange(
+            self.size()
+        )
+        self.bond_lengths = self.bond_lengths[inverse][:, inverse]
+        self.bond_weights = self.bond_weights[inverse][:, inverse]
+        self.positions = self.positions[inverse]
+        self.tags = self.tags[inverse]
+        if self._colors is not None:
+            self._colors = self._colors[inverse]
+        self._graph = None
+
         self.atoms = self.remap_atoms(mapping)
         return mapping
 
@@ -91,8 +305,20 @@ class StateGraph:
         return atoms
 
     def set_atoms(self, atoms):
-        _update_nodes(self.graph, atoms)
+        self.positions = atoms.get_positions()
+        self.tags = atoms.get_tags()
         self.atoms = atoms
+        self._graph = None
+
+    def set_positions(self, positions: np.ndarray):
+        """
+        Replaces the positions of the nodes, e.g. after aligning them,
+        without touching the Atoms object.
+
+        :param positions: (n, 3) positions in node order.
+        """
+        self.positions = positions
+        self._graph = None
 
     # TODO: turn Dict[str, Any] into a type for better checks
     def __add__(self, transform: Dict[int, Dict[str, Any]]):
@@ -103,10 +329,13 @@ class StateGraph:
 
         :param transform: Dictionary of transformations.
         """
-        for n in self.graph.nodes:
-            self.graph.nodes[n]["p_x"] += transform[n]["dx"]
-            self.graph.nodes[n]["p_y"] += transform[n]["dy"]
-            self.graph.nodes[n]["p_z"] += transform[n]["dz"]
+        self.positions = self.positions + np.array(
+            [
+                [transform[n]["dx"], transform[n]["dy"], transform[n]["dz"]]
+                for n in range(self.size())
+            ]
+        )
+        self._graph = None
 
     def map_from(self, other) -> Dict[Any, Any]:
         """
@@ -115,27 +344,29 @@ class StateGraph:
         :param other: StateGraph to map to.
         :raises ValueError: Raised if self and other are not isomorphic.
         """
-        graph = nx.isomorphism.GraphMatcher(self.graph, other.graph)
-        iso = graph.is_isomorphic()
-        if not iso:
+        mapping = None
+        if self.wl_hash == other.wl_hash:
+            mapping = match_graphs(self.graph, other.graph)
+        if mapping is None:
             raise ValueError(f"Graphs {self.id} and {other.id} are not isomorphic.")
-        return graph.mapping
+        return mapping
 
     def get_distance_matrix(self):
         """
-        Returns the distance matrix of the graph.
+        Returns the dense distance matrix between every pair of atoms.
+        This is N x N; bond_lengths holds the distances between bonded
+        atoms. Distances are between the positions as stored, not minimum
+        image.
         """
-        return self.dm
+        return cdist(self.positions, self.positions)
 
     def size(self):
-        return len(self.graph.nodes)
+        return self.bond_lengths.shape[0]
 
     def draw(self):
         """
         Draws a representation of the graph with labels. Best in Jupyter
         notebooks.
         """
-        xy = {}
-        for n in self.graph:
-            xy[n] = [self.graph.nodes[n]["p_x"], self.graph.nodes[n]["p_y"]]
+        xy = {n: p[:2] for n, p in enumerate(self.positions.tolist())}
         nx.draw_networkx(self.graph, pos=xy, with_labels=True)
@@ -6,7 +6,10 @@
 Module that retrieves and manages metadata for each trajectory in the database.
 """
 
-from typing import Any, Dict, List
+import copy
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
 from typing_extensions import LiteralString
 
 import neo4j
@@ -50,30 +53,125 @@ def metadata_to_cmds(metadata_dict: Dict[str, Any]) -> List[str]:
     return parameters
 
 
+# seconds that cached runs and metadata stay valid; None keeps them
+# until invalidate_metadata is called. This bounds how long changes
+# made by other processes go unseen.
+METADATA_TTL: Optional[float] = 300.0
+
+_cache: Dict[Any, Tuple[float, Any]] = {}
+_cache_lock = threading.Lock()
+
+
+def _cached(key, load: Callable[[], Any]) -> Any:
+    """
+    Returns the cached value for key, calling load if it is missing or
+    has expired.
+
+    :param key: Cache key.
+    :param load: Function that reads the value from the database.
+    """
+    now = time.monotonic()
+    with _cache_lock:
+        entry = _cache.get(key, None)
+    if entry is not None and (
+        METADATA_TTL is None or now - entry[0] < METADATA_TTL
+    ):
+        return entry[1]
+
+    value = load()
+    with _cache_lock:
+        _cache[key] = (now, value)
+    return value
+
+
+def invalidate_metadata(run: Optional[str] = None):
+    """
+    Drops cached metadata. Must be called whenever a trajectory is added
+    or its Metadata node is changed.
+
+    :param run: Trajectory whose metadata changed. The list of runs is
+    always dropped; if None, everything is.
+    """
+    with _cache_lock:
+        if run is None:
+            _cache.clear()
+        else:
+            _cache.pop(("metadata", run), None)
+            _cache.pop(("runs",), None)
+
+
+@typechecked
+def get_runs(driver: neo4j.Driver, use_cache: bool = True) -> List[str]:
+    """
+    Get the names of every trajectory in the database.
+
+    :param driver: Neo4j Driver to query.
+    :param use_cache: Whether or not to use the process-wide cache.
+
+    :returns: List of trajectory names.
+    """
+
+    def load():
+        runs = []
+        with driver.session() as session:
+            result = session.run("MATCH (m:Metadata) RETURN DISTINCT m.run;")
+            for r in result.values():
+                for record in r:
+                    runs.append(record)
+        return runs
+
+    if not use_cache:
+        return load()
+    return list(_cached(("runs",), load))
+
+
 @typechecked
-def get_metadata(driver: neo4j.Driver, run: str) -> Dict[str, Any]:
+def get_metadata(
+    driver: neo4j.Driver, run: str, use_cache: bool = True
+) -> Dict[str, Any]:
     """
     Get the metadata for a trajectory as a Python-readable dictionary.
 
+    The cache is per process: invalidate_metadata only drops entries in
+    the process that calls it. Metadata changed by another process (e.g.
+    a Celery worker) can be served stale for up to METADATA_TTL seconds
+    unless this process invalidates it as well, or use_cache is False.
+
     :param driver neo4j.Driver: Neo4j Driver to query.
     :param run str: Name of the trajectory
+    :param use_cache: Whether or not to use the process-wide cache.
 
     :returns: Dictionary of metadata information
     """
 
-    metadata = {}
-    with driver.session() as session:
-        result = session.run(f"MATCH (m:Metadata WHERE m.run = '{run}') RETURN m;")
-        record = result.single()
-        for n in record.values():
-            for key, value in n.items():
-                if key == "LAMMPSBootstrapScript":
-                    params = metadata_to_parameters(value)
-                    cmds = metadata_to_cmds(params)
-                    metadata.update({"parameters": params})
-                    metadata.update({"cmds": cmds})
-                metadata.update({key: value})
-    return metadata
+    def load():
+        metadata = {}
+        with driver.session() as session:
+            result = session.run(
+                "MATCH (m:Metadata WHERE m.run = $run) RETURN m;", run=run
+            )
+            record = result.single()
+            for n in record.values():
+                for key, value in n.items():
+                    if key == "LAMMPSBootstrapScript":
+                        params = metadata_to_parameters(value)
+                        cmds = metadata_to_cmds(params)
+                        metadata.update({"parameters": params})
+                        metadata.update({"cmds": cmds})
+                    metadata.update({key: value})
+        return metadata
+
+    if not use_cache:
+        return load()
+
+    metadata = _cached(("metadata", run), load)
+    with _cache_lock:
+        runs = _cache.get(("runs",), None)
+        if runs is not None and run not in runs[1]:
+            # the trajectory was added after the runs were cached
+            del _cache[("runs",)]
+    # callers are free to modify what they get back
+    return copy.deepcopy(metadata)
 
 
 def get_server_metadata(field: str) -> str:
@@ -98,6 +196,27 @@ def update_counter(tx: neo4j.Transaction, name: str, value: int):
     tx.run(update_metadata(name), value=value)
 
 
+def reserve_counter(tx: neo4j.Transaction, name: str, count: int) -> int:
+    """
+    Reserves a block of count values from a counter in a single update.
+
+    :param tx: Transaction to run the update in.
+    :param name: Name of the counter.
+    :param count: How many values to reserve.
+
+    :returns: The first value of the reserved block.
+    """
+    result = tx.run(
+        f"""MATCH (m:ServerMetadata)
+        WITH m, coalesce(m.{name}, 0) AS start
+        SET m.{name} = start + $count
+        RETURN start""",
+        count=count,
+    )
+    record = result.single()
+    return record["start"] if record is not None else 0
+
+
 def retrieve_potentials_file(driver: neo4j.Driver, run: str):
     """
     Grabs the potentials file from the database, dumps it into a file,
@@ -114,7 +233,7 @@ def retrieve_potentials_file(driver: neo4j.Driver, run: str):
     filename = None
     raw = None
     with driver.session() as session:
-        result = session.run(q.text)
+        result = session.run(q.text, q.params)
         for record in result.data():
             filename = record["potentialFileName"]
             raw = record["potentialFileRaw"]
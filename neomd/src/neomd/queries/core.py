@@ -7,8 +7,6 @@ from typing import Any, Callable, Dict, List, Optional, Tuple, TypeAlias, Union
 
 from typeguard import typechecked
 
-from neomd.utils import stringify
-
 from .neo4j_types import (
     Neo4jAlias,
     Neo4jEntity,
@@ -29,6 +27,7 @@ class Neo4jQueryBuilderCore:
     entities: List[Neo4jEntity]  # entities in the current statement
     options: List[str]  # options passed to final Query object
     statements: List[Statement]  # list of statements for the current query
+    params: Dict[str, Any]  # parameters for the current query
     id_to_entity: Dict[int, Neo4jEntity]  # id to entity dictionary
 
     @typechecked
@@ -47,6 +46,7 @@ class Neo4jQueryBuilderCore:
         self.entities = []
         self.options = []
         self.statements = []
+        self.params = {}
         self.id_to_entity = {}
 
         for relation in relations:
@@ -62,19 +62,18 @@ class Neo4jQueryBuilderCore:
             self.add_node("Metadata")
 
     @classmethod
-    def infer_db_structure(cls, driver):
+    def infer_db_structure(cls, driver, use_cache: bool = True):
         """
         Probes the Neo4j server and builds a query builder based on the contents of the database.
         :param driver: The Neo4j connection to use
+        :param use_cache: Use the cached list of runs (see metadata.get_runs).
 
         :returns: Query builder object with an inferred schema
         """
-        runs = []
-        with driver.session() as session:
-            result = session.run("MATCH (m:Metadata) RETURN DISTINCT m.run;")
-            for r in result.values():
-                for record in r:
-                    runs.append(record)
+        # metadata imports the query builder
+        from neomd.metadata import get_runs
+
+        runs = get_runs(driver, use_cache)
 
         relations = [("Atom", "PART_OF", "State", "MANY-TO-ONE")]
         for r in runs:
@@ -93,6 +92,26 @@ class Neo4jQueryBuilderCore:
         self.entities = []
         self.options = []
         self.statements = []
+        self.params = {}
+
+    def add_param(self, name: str, value: Any) -> str:
+        """
+        Adds a parameter to the current query. Values are sent alongside
+        the query text rather than rendered into it, so queries that only
+        differ in their values share the same text and compiled plan.
+
+        :param name: Preferred name of the parameter; a suffix is added
+        if it is already used in the current query.
+        :param value: The value of the parameter.
+        :return: The parameter as it appears in the query, e.g. $id.
+        """
+        param = name
+        i = 1
+        while param in self.params:
+            param = f"{name}_{i}"
+            i += 1
+        self.params[param] = value
+        return f"${param}"
 
     @typechecked
     def get_free_var(self, label: str) -> str:
@@ -185,7 +204,7 @@ class Neo4jQueryBuilderCore:
 
         text = "\n".join(statements)
         text += ";"
-        q = Query(text, self.options)
+        q = Query(text, self.options, self.params)
 
         self.clear()
         return q
@@ -265,15 +284,21 @@ class Neo4jQueryBuilderCore:
 
     # TODO: these should be fragments of WHERE statements
     def where_in(self, entity, attribute, attributeList):
-        render = (
-            lambda entity: f"WHERE {entity[0].variable}.{attribute} IN {attributeList}"
-        )
+        values = self.add_param(attribute, attributeList)
+
+        def render(entity):
+            return f"WHERE {entity[0].variable}.{attribute} IN {values}"
+
         self.__add_statement(entity, render)
 
     def where_between(self, entity, attribute, v1, v2):
-        render = (
-            lambda entity: f"WHERE {entity[0].variable}.{attribute} >= {v1} AND {entity[0].variable}.{attribute} <= {v2}"
-        )
+        start = self.add_param(f"{attribute}_start", v1)
+        end = self.add_param(f"{attribute}_end", v2)
+
+        def render(entity):
+            v = f"{entity[0].variable}.{attribute}"
+            return f"WHERE {v} >= {start} AND {v} <= {end}"
+
         self.__add_statement(entity, render)
 
     @typechecked
@@ -329,18 +354,26 @@ class Neo4jQueryBuilderCore:
 
         :param label: The label of the node.
         :param match_on: The attribute to match on.
-        :param match_on_value: The value to match on.
+        :param match_on_value: The value to match on. Strings starting
+        with $ are used as a parameter name as-is, e.g. for templates.
         :raises ValueError: Raised if label does not correspond to a node or does not exist.
 
         :returns: Neo4jNode according to the label, can be used in further queries.
         """
         node = self.schema[label]
         if isinstance(node, Neo4jNode):
+            if isinstance(match_on_value, str) and match_on_value[:1] == "$":
+                value = match_on_value
+            else:
+                value = self.add_param(match_on, match_on_value)
 
             def render(entities):
                 node = entities[0]
                 print_var = node.variable if node.bound else ""
-                return f"MATCH ({print_var}:{node.label} {{ {match_on}:{stringify(match_on_value)} }})"
+                return (
+                    f"MATCH ({print_var}:{node.label} "
+                    f"{{ {match_on}:{value} }})"
+                )
 
             self.__match_statement(node, render)
         else:
@@ -2,13 +2,15 @@
 # © 2025. Triad National Security, LLC. All rights reserved.
 # This program was produced under U.S. Government contract 89233218CNA000001 for Los Alamos National Laboratory (LANL), which is operated by Triad National Security, LLC for the U.S. Department of Energy/National Nuclear Security Administration. All rights in the program are reserved by Triad National Security, LLC, and the U.S. Department of Energy/National Nuclear Security Administration. The Government is granted for itself and others acting on its behalf a nonexclusive, paid-up, irrevocable worldwide license in this material to reproduce, prepare. derivative works, distribute copies to the public, perform publicly and display publicly, and to permit others to do so.
 #
-from typing import List
+from typing import Any, Dict, List, Optional
 
 
 class Query:
     text: str
     options: List[str]
+    params: Dict[str, Any]  # values for the $parameters in text
 
-    def __init__(self, text, options):
+    def __init__(self, text, options, params: Optional[Dict[str, Any]] = None):
         self.text = text
         self.options = options
+        self.params = {} if params is None else params
@@ -11,17 +11,36 @@ from typing import Any, Dict, List, Optional
 
 from typeguard import typechecked
 
+from neomd.constants import ATOM_COLUMN_DEFAULTS, ATOM_COLUMNS
+
 from .core import Neo4jQueryBuilderCore
 from .neo4j_types import OrderType
 from .query import Query
+from .template import cached_template
 
 # TODO: get rid of generate_ everywhere
 # TODO: use map projection when getting atoms
 # https://neo4j.com/docs/cypher-manual/current/syntax/maps/
 
 
+def atom_column(variable: str, column: str) -> str:
+    """
+    Returns the Cypher expression for one of the ATOM_COLUMNS of an Atom,
+    with a missing optional value replaced by its ATOM_COLUMN_DEFAULTS
+    entry so that collected lists stay aligned.
+
+    :param variable: Variable the Atom node is bound to.
+    :param column: One of ATOM_COLUMNS.
+    """
+    if column in ATOM_COLUMN_DEFAULTS:
+        default = ATOM_COLUMN_DEFAULTS[column]
+        return f"coalesce({variable}.{column}, {default})"
+    return f"{variable}.{column}"
+
+
 class Neo4jQueryBuilder(Neo4jQueryBuilderCore):
     @typechecked
+    @cached_template()
     def generate_update_entity(
         self,
         attributes: Dict[str, Any],
@@ -52,12 +71,15 @@ class Neo4jQueryBuilder(Neo4jQueryBuilderCore):
 
     # TODO: these should all be just query fragments that you put together
     @typechecked
+    @cached_template("id_list")
     def get_states(
         self,
         id_list: List[int],
         include_atoms: Optional[bool] = False,
         attribute_list: Optional[List[str]] = None,
         order_by: Optional[str] = "internal_id",
+        columnar: bool = False,
+        packed: bool = False,
     ):
         """
         Get nodes from the database corresponding to the list of ids
@@ -69,17 +91,32 @@ class Neo4jQueryBuilder(Neo4jQueryBuilderCore):
         :param include_atoms: TODO
         :param attribute_list: The attributes to retrieve for each node.
         :param order_by: If supplied, orders the atoms by the given attribute.
+        :param columnar: If True, atoms are returned as parallel lists of
+        attributes (see ATOM_COLUMNS) instead of a list of Atom nodes.
+        :param packed: If True, atoms are read from the packed arrays
+        stored on each State node (see converter.pack_states) instead of
+        the Atom nodes. Packed arrays are always ordered by internal_id.
 
+        :raises ValueError: Raised if packed is used with another ordering.
         :returns: Neo4j Query object.
         """
+        if include_atoms and packed and order_by != "internal_id":
+            raise ValueError(
+                "Packed states are ordered by internal_id and cannot be "
+                f"ordered by {order_by}."
+            )
 
         self.options = ["NODE", "DF"]
         s1 = self.match_node("State")
         self.where_in(s1, "id", id_list)
 
         # realistically is never anything but include atoms
-        if include_atoms:
-            self.__include_atoms(s1, order_by)
+        if include_atoms and packed:
+            # atoms live on the state node, nothing to traverse
+            self.options.append("ASE")
+            self.return_entities(s1)
+        elif include_atoms:
+            self.__include_atoms(s1, order_by, columnar)
         else:
             if not attribute_list:
                 self.return_entities(s1)
@@ -92,6 +129,7 @@ class Neo4jQueryBuilder(Neo4jQueryBuilderCore):
     # for multiple different entities
 
     @typechecked
+    @cached_template("start", "end")
     def generate_get_path(
         self,
         start: int,
@@ -101,6 +139,7 @@ class Neo4jQueryBuilder(Neo4jQueryBuilderCore):
         include_atoms: bool = True,
         order_by: OrderType = "ASC",
         optional: bool = False,
+        columnar: bool = False,
     ):
         """
         Given a start and end timestep, finds all the states between.
@@ -110,24 +149,36 @@ class Neo4jQueryBuilder(Neo4jQueryBuilderCore):
         :param match_on: The attribute to match on.
         :param include_atoms: Whether or not to include Atoms objects.
         :param order_by: How the results should be ordered.
+        :param columnar: If True, atoms are returned as parallel lists of
+        attributes instead of a list of Atom nodes.
         """
 
         s1, r, _ = self.match_relation(relation, optional=optional)
         self.where_between(r, match_on, start, end)
 
         if include_atoms:
-            self.__include_atoms(s1)
+            self.__include_atoms(s1, columnar=columnar)
         else:
             self.return_entities(s1)
         self.order_by(r, match_on, order_by)
 
         return self.build()
 
-    def __include_atoms(self, s, order_by="internal_id"):
+    def __include_atoms(self, s, order_by="internal_id", columnar=False):
         a, _, _ = self.match_relation("PART_OF", varB=s)
         self.with_statement()
         self.order_by(a, order_by)
-        w = self.with_statement(self.collect(a))
+        if columnar:
+            # one list per attribute instead of one node per atom,
+            # so the converter can build arrays without touching nodes
+            w = self.with_statement(
+                *[
+                    self.custom_collect(atom_column(a.variable, c), c)
+                    for c in ATOM_COLUMNS
+                ]
+            )
+        else:
+            w = self.with_statement(self.collect(a))
         self.options.append("ASE")
         self.return_entities(s, *w)
 
@@ -147,15 +198,16 @@ class Neo4jQueryBuilder(Neo4jQueryBuilderCore):
         # call calculate
         q = f"""MATCH (s:{run})-[r:{run}]->(:{run})
         WITH count(DISTINCT r) AS r_count, s
-        MATCH (m:Metadata {{ run: '{run}'}})
+        MATCH (m:Metadata {{ run: $run }})
         WITH r_count, s, m
         SET s.{run}_occurrences = r_count, m.{run}_occurrences = True
         RETURN s.{run}_occurrences AS occurrences;
         """
 
-        return Query(q, [])
+        return Query(q, [], {"run": run})
 
     @typechecked
+    @cached_template()
     def transition_matrix(self, relation: str, occurrenceString: str) -> Query:
         """
         Given a relation string and occurrence string,
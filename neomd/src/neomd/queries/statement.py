@@ -72,20 +72,18 @@ class WithStatement(Statement):
         next = []
         if len(previous) > 0:
             prevIDs = get_entity_ids(previous)
+            # dict keeps the first occurrence of each ID in order, so
+            # the same statements always render the same text
             prevIDs = list(
-                set([x for x in prevIDs if x not in self.entityIDs])
+                dict.fromkeys([x for x in prevIDs if x not in self.entityIDs])
             )
 
         if len(following) > 0:
             nextIDs = get_entity_ids(following)
-            nextIDs = list(
-                set(
-                    [
-                        x
-                        for x in nextIDs
-                        if x not in self.entityIDs and x in prevIDs
-                    ]
-                )
-            )
+            nextIDs = [
+                x
+                for x in prevIDs
+                if x not in self.entityIDs and x in nextIDs
+            ]
             next = list(map(lambda id: entities[id], nextIDs))
         return self.render_func(entity_list, next)
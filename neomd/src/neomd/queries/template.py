@@ -0,0 +1,135 @@
+#
+# © 2025. Triad National Security, LLC. All rights reserved.
+# This program was produced under U.S. Government contract 89233218CNA000001 for Los Alamos National Laboratory (LANL), which is operated by Triad National Security, LLC for the U.S. Department of Energy/National Nuclear Security Administration. All rights in the program are reserved by Triad National Security, LLC, and the U.S. Department of Energy/National Nuclear Security Administration. The Government is granted for itself and others acting on its behalf a nonexclusive, paid-up, irrevocable worldwide license in this material to reproduce, prepare. derivative works, distribute copies to the public, perform publicly and display publicly, and to permit others to do so.
+#
+"""
+LRU cache of rendered query templates. Since values are sent as
+parameters, the text of a query only depends on the builder's schema,
+the method that built it and the arguments that change its shape.
+"""
+
+import functools
+import inspect
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Hashable
+
+from .neo4j_types import Neo4jAlias, Neo4jRelation
+from .query import Query
+
+TEMPLATE_CACHE_SIZE = 256
+
+_templates: "OrderedDict[Hashable, Any]" = OrderedDict()
+_lock = threading.Lock()
+
+
+def freeze(value: Any) -> Hashable:
+    """
+    Converts an argument into a hashable cache key. Lists become tuples
+    and dictionaries contribute only their keys, since the values of
+    dictionary arguments are filled in as parameters.
+
+    :param value: The argument to convert.
+    """
+    if isinstance(value, dict):
+        return tuple(value.keys())
+    if isinstance(value, (list, tuple)):
+        return tuple(freeze(v) for v in value)
+    return value
+
+
+def entity_key(entity) -> Hashable:
+    """
+    Returns everything about an entity that affects how it is rendered.
+
+    :param entity: Node or relation from the builder's schema.
+    """
+    key = (entity.variable, entity.label, entity.bound)
+    if isinstance(entity, Neo4jRelation):
+        key += (entity.nodeA.variable, entity.nodeB.variable)
+    return key
+
+
+def clear_template_cache():
+    """
+    Removes every cached template.
+    """
+    with _lock:
+        _templates.clear()
+
+
+def cached_template(*value_args: str) -> Callable:
+    """
+    Caches the Query built by a query builder method. Arguments listed in
+    value_args must each be registered as exactly one parameter, in
+    order, and are left out of the cache key; every other argument is
+    part of it. On a cache hit the statements are neither built nor
+    rendered, and only the parameters are filled in.
+
+    Calls made while the builder already has pending statements are
+    never cached, since the result depends on them.
+
+    :param value_args: Names of the arguments sent as parameters.
+    """
+
+    def decorator(method):
+        signature = inspect.signature(method)
+
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            if len(self.statements) > 0:
+                return method(self, *args, **kwargs)
+
+            bound = signature.bind(self, *args, **kwargs)
+            bound.apply_defaults()
+            arguments = bound.arguments
+            entities = [
+                e
+                for e in self.id_to_entity.values()
+                if not isinstance(e, Neo4jAlias)
+            ]
+            key = (
+                method.__qualname__,
+                tuple(entity_key(e) for e in entities),
+                tuple(
+                    (name, freeze(value))
+                    for name, value in list(arguments.items())[1:]
+                    if name not in value_args
+                ),
+            )
+
+            with _lock:
+                template = _templates.get(key, None)
+                if template is not None:
+                    _templates.move_to_end(key)
+
+            if template is None:
+                q = method(self, *args, **kwargs)
+                if len(q.params) != len(value_args):
+                    # the parameters can't be refilled from the arguments
+                    return q
+                template = (
+                    q.text,
+                    list(q.options),
+                    list(q.params.keys()),
+                    [e.bound for e in entities],
+                )
+                with _lock:
+                    _templates[key] = template
+                    if len(_templates) > TEMPLATE_CACHE_SIZE:
+                        _templates.popitem(last=False)
+                return q
+
+            text, options, names, bound_after = template
+            # rendering binds entities; keep later queries consistent
+            for e, b in zip(entities, bound_after):
+                e.bound = b
+            return Query(
+                text,
+                list(options),
+                {n: arguments[a] for n, a in zip(names, value_args)},
+            )
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,183 @@
+#
+# © 2025. Triad National Security, LLC. All rights reserved.
+# This program was produced under U.S. Government contract 89233218CNA000001 for Los Alamos National Laboratory (LANL), which is operated by Triad National Security, LLC for the U.S. Department of Energy/National Nuclear Security Administration. All rights in the program are reserved by Triad National Security, LLC, and the U.S. Department of Energy/National Nuclear Security Administration. The Government is granted for itself and others acting on its behalf a nonexclusive, paid-up, irrevocable worldwide license in this material to reproduce, prepare. derivative works, distribute copies to the public, perform publicly and display publicly, and to permit others to do so.
+#
+"""
+Module that provisions the indexes and constraints neomd's queries rely on.
+"""
+
+import logging
+from typing import Any, Dict, List, Optional, Tuple
+
+import neo4j
+from typeguard import typechecked
+
+from neomd.metadata import get_runs
+from neomd.queries import Neo4jQueryBuilder
+from neomd.utils import sanitize_neo4j_string
+
+# (name, constraint, index) for uniqueness constraints; if the constraint
+# can't be created, e.g. existing data violates it, the index is used instead
+CONSTRAINTS = [
+    (
+        "state_id",
+        "CREATE CONSTRAINT state_id IF NOT EXISTS "
+        "FOR (s:State) REQUIRE s.id IS UNIQUE",
+        "CREATE INDEX state_id IF NOT EXISTS FOR (s:State) ON (s.id)",
+    ),
+    (
+        "metadata_run",
+        "CREATE CONSTRAINT metadata_run IF NOT EXISTS "
+        "FOR (m:Metadata) REQUIRE m.run IS UNIQUE",
+        "CREATE INDEX metadata_run IF NOT EXISTS FOR (m:Metadata) ON (m.run)",
+    ),
+]
+
+INDEXES = [
+    (
+        "atom_internal_id",
+        "CREATE INDEX atom_internal_id IF NOT EXISTS "
+        "FOR (a:Atom) ON (a.internal_id)",
+    ),
+]
+
+
+def timestep_index(run: str) -> Tuple[str, str]:
+    """
+    Returns the name and statement of the relationship index on the
+    timestep of a trajectory.
+
+    :param run: Name of the trajectory.
+    """
+    name = f"{sanitize_neo4j_string(run)}_timestep"
+    return (
+        name,
+        f"CREATE INDEX {name} IF NOT EXISTS "
+        f"FOR ()-[r:{run}]-() ON (r.timestep)",
+    )
+
+
+def plan_operators(plan: Dict[str, Any]) -> List[str]:
+    """
+    Flattens a query plan into the list of its operator types.
+
+    :param plan: Plan as returned by ResultSummary.plan.
+    """
+    operators = [plan["operatorType"].split("@")[0]]
+    for child in plan.get("children", []):
+        operators += plan_operators(child)
+    return operators
+
+
+def sample_queries(runs: List[str]) -> Dict[str, Tuple[str, Dict[str, Any]]]:
+    """
+    Builds the lookups that the indexes are meant for, with sample
+    parameters; only their plans are inspected.
+
+    :param runs: The trajectories to build path queries for.
+    :returns: Dictionary of names to (query text, parameters).
+    """
+    relations = [("Atom", "PART_OF", "State", "MANY-TO-ONE")]
+    relations += [("State", r, "State", "ONE-TO-ONE") for r in runs]
+    qb = Neo4jQueryBuilder(relations, ["State"])
+
+    q = qb.get_states([1], True, columnar=True)
+    queries = {"get_states": (q.text, q.params)}
+    q = qb.get_potential_file("")
+    queries["get_metadata"] = (q.text, q.params)
+    queries["atom_label"] = (
+        "MATCH (a:Atom {internal_id: $id})-[:PART_OF]->(:State {id: $state}) "
+        "RETURN a;",
+        {"id": 1, "state": 1},
+    )
+    for r in runs:
+        q = qb.generate_get_path(0, 1, r, include_atoms=False)
+        queries[f"{r}_path"] = (q.text, q.params)
+    return queries
+
+
+@typechecked
+def explain(driver: neo4j.Driver, runs: List[str]) -> Dict[str, List[str]]:
+    """
+    Gets the plan operators of each sample query without running it.
+
+    :param driver: Neo4j driver to query.
+    :param runs: The trajectories to build path queries for.
+    :returns: Dictionary of query names to operator types.
+    """
+    operators = {}
+    with driver.session() as session:
+        for name, (text, params) in sample_queries(runs).items():
+            summary = session.run(f"EXPLAIN {text}", params).consume()
+            operators[name] = plan_operators(summary.plan)
+    return operators
+
+
+@typechecked
+def ensure_indexes(
+    driver: neo4j.Driver,
+    runs: Optional[List[str]] = None,
+    report: bool = False,
+    timeout: int = 300,
+) -> Dict[str, Dict[str, List[str]]]:
+    """
+    Creates the indexes and uniqueness constraints on State.id,
+    Atom.internal_id, Metadata.run and the timestep of every
+    trajectory's relationships, if they do not exist yet.
+    Waits for new indexes to come online before returning, unless
+    timeout is 0.
+
+    :param driver: Neo4j driver to query.
+    :param runs: Trajectories to index; defaults to every trajectory.
+    :param report: If True, explain the sample queries before and after.
+    :param timeout: Seconds to wait for the indexes to be populated; 0
+    returns while they are still being populated.
+
+    :returns: Dictionary of query names to {"before": operators,
+    "after": operators}; empty unless report is True.
+    """
+    if runs is None:
+        runs = get_runs(driver, use_cache=False)
+
+    before = explain(driver, runs) if report else {}
+
+    with driver.session() as session:
+        for name, constraint, index in CONSTRAINTS:
+            try:
+                session.run(constraint).consume()
+            except neo4j.exceptions.ClientError as e:
+                logging.warning(
+                    f"Could not create constraint {name}, "
+                    f"falling back to an index: {e.message}"
+                )
+                session.run(index).consume()
+
+        for name, index in INDEXES + [timestep_index(r) for r in runs]:
+            session.run(index).consume()
+
+        if timeout > 0:
+            session.run("CALL db.awaitIndexes($timeout)", timeout=timeout)
+
+    if not report:
+        return {}
+
+    after = explain(driver, runs)
+    return {
+        name: {"before": before[name], "after": after[name]}
+        for name in after
+    }
+
+
+def index_seeks(report: Dict[str, Dict[str, List[str]]]) -> Dict[str, Any]:
+    """
+    Summarizes a report from ensure_indexes as whether each query used
+    an index seek before and after.
+
+    :param report: Report returned by ensure_indexes.
+    """
+    return {
+        name: {
+            k: any("Seek" in op for op in ops) for k, ops in plans.items()
+        }
+        for name, plans in report.items()
+    }
@@ -0,0 +1,271 @@
+#
+# © 2025. Triad National Security, LLC. All rights reserved.
+# This program was produced under U.S. Government contract 89233218CNA000001 for Los Alamos National Laboratory (LANL), which is operated by Triad National Security, LLC for the U.S. Department of Energy/National Nuclear Security Administration. All rights in the program are reserved by Triad National Security, LLC, and the U.S. Department of Energy/National Nuclear Security Administration. The Government is granted for itself and others acting on its behalf a nonexclusive, paid-up, irrevocable worldwide license in this material to reproduce, prepare. derivative works, distribute copies to the public, perform publicly and display publicly, and to permit others to do so.
+#
+"""
+Nearest-neighbour search over states. Every state is summarized by a
+fixed-length descriptor, and the descriptors are kept in a ball tree, so
+the states most similar to a given one are found without comparing it to
+every other state.
+"""
+
+from typing import (
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Tuple,
+    Union,
+)
+
+import numpy as np
+from ase import Atoms
+from ovito.io.ase import ase_to_ovito
+from ovito.modifiers import CommonNeighborAnalysisModifier
+from ovito.pipeline import Pipeline, StaticSource
+from scipy.spatial.distance import cdist
+from sklearn.neighbors import BallTree
+
+from neomd.distance import farthest_points
+from neomd.graphs import StateGraph, graphutils
+
+SPECTRUM_GRID = np.linspace(0, 6, 97)
+
+
+def spectral_density(
+    spectrum: np.ndarray, grid: np.ndarray = SPECTRUM_GRID, hwhm: float = 0.08
+) -> np.ndarray:
+    """
+    Samples the density of graphutils.im_spectrum on a grid. Samples are
+    scaled by the square root of the grid spacing, so the Euclidean distance
+    between two densities approximates their im_distance over the grid.
+
+    :param spectrum: Spectrum as returned by graphutils.laplacian_spectrum.
+    :param grid: Evenly spaced points to sample the density at.
+    :param hwhm: Half-width at half-maximum of the Lorentzians.
+    """
+    if len(spectrum) == 0:
+        return np.zeros(len(grid))
+    density = hwhm / ((grid[:, np.newaxis] - spectrum) ** 2 + hwhm**2)
+    density = density.sum(axis=1) / (len(spectrum) * np.pi / 2)
+    return density * np.sqrt(grid[1] - grid[0])
+
+
+def spectrum_descriptor(
+    atoms: Atoms,
+    cutoff: float = 3.0,
+    grid: np.ndarray = SPECTRUM_GRID,
+    hwhm: float = 0.08,
+) -> np.ndarray:
+    """
+    Describes a structure by the Laplacian spectral density of its bond
+    graph, sampled on a grid; see spectral_density.
+
+    :param atoms: The structure.
+    :param cutoff: Distance in Angstroms below which atoms are bonded.
+    :param grid: Evenly spaced points to sample the density at.
+    :param hwhm: Half-width at half-maximum of the Lorentzians.
+    """
+    adjacency = StateGraph(atoms, 0, cutoff=cutoff).adjacency_matrix()
+    return spectral_density(
+        graphutils.laplacian_spectrum(adjacency), grid, hwhm
+    )
+
+
+def structure_type_descriptor(atoms: Atoms) -> np.ndarray:
+    """
+    Describes a structure by the fraction of its atoms of each common
+    neighbor analysis structure type (other, FCC, HCP, BCC, icosahedral).
+
+    :param atoms: The structure.
+    """
+    pipeline = Pipeline(source=StaticSource(data=ase_to_ovito(atoms)))
+    pipeline.modifiers.append(CommonNeighborAnalysisModifier())
+    types = np.asarray(pipeline.compute().particles["Structure Type"][:])
+    return np.bincount(types, minlength=5)[:5] / max(len(types), 1)
+
+
+DESCRIPTORS: Dict[str, Callable[[Atoms], np.ndarray]] = {
+    "spectrum": spectrum_descriptor,
+    "structure_types": structure_type_descriptor,
+}
+
+
+def farthest_states(
+    ids: List[int], descriptors: np.ndarray, depth: Optional[int] = None
+) -> Iterator[Tuple[int, float]]:
+    """
+    Farthest-point traversal of states by their descriptors, starting from
+    the first state; see distance.farthest_points. Each state is as
+    different as possible from the ones picked before it.
+
+    :param ids: State IDs.
+    :param descriptors: (len(ids), d) descriptors of the states.
+    :param depth: Maximum number of states to pick, including the first.
+    :returns: Iterator of (state ID, distance to the closest earlier pick).
+    """
+    if len(ids) == 0:
+        return
+    x = np.asarray(descriptors, dtype=np.float64).reshape(len(ids), -1)
+    for i, d, _ in farthest_points(
+        len(ids), lambda rows, cols: cdist(x[rows], x[cols]), 0, depth
+    ):
+        yield ids[i], d
+
+
+class SimilarityIndex:
+    descriptor: str  # name of the descriptor the index was built with
+    ids: np.ndarray  # state ID of each row of descriptors
+    descriptors: np.ndarray
+
+    def __init__(
+        self,
+        descriptor: str,
+        ids: Optional[Iterable[int]] = None,
+        descriptors: Optional[np.ndarray] = None,
+        leaf_size: int = 40,
+    ):
+        """
+        Creates a ball tree index over the descriptors of states.
+
+        :param descriptor: Name of the descriptor, a key of DESCRIPTORS
+        unless descriptors are always given explicitly.
+        :param ids: State IDs to index.
+        :param descriptors: (len(ids), d) descriptors of the states.
+        :param leaf_size: Leaf size of the ball tree.
+        """
+        self.descriptor = descriptor
+        self.leaf_size = leaf_size
+        self.ids = np.zeros(0, dtype=np.int64)
+        self.descriptors = np.zeros((0, 0))
+        self.id_to_idx = {}
+        self.tree = None
+        if ids is not None:
+            self.add(ids, descriptors)
+
+    def describe(self, atoms: Atoms) -> np.ndarray:
+        """
+        Computes the descriptor of a structure.
+
+        :param atoms: The structure.
+        """
+        if self.descriptor not in DESCRIPTORS:
+            raise ValueError(f"Unknown descriptor {self.descriptor}.")
+        return DESCRIPTORS[self.descriptor](atoms)
+
+    def add(
+        self,
+        ids: Iterable[int],
+        descriptors: Optional[np.ndarray] = None,
+        atoms: Optional[Dict[int, Atoms]] = None,
+    ) -> int:
+        """
+        Adds states to the index and rebuilds the tree. States that are
+        already indexed are skipped.
+
+        :param ids: State IDs to add.
+        :param descriptors: Descriptors of the states, in the same order.
+        :param atoms: Structures of the states, to compute the descriptors
+        of if they are not given.
+        :returns: The number of states added.
+        """
+        ids = [int(i) for i in ids]
+        if descriptors is None:
+            if atoms is None:
+                raise ValueError("Either descriptors or atoms must be given.")
+            descriptors = [self.describe(atoms[i]) for i in ids]
+        descriptors = np.asarray(descriptors, dtype=np.float64)
+        if len(descriptors) != len(ids):
+            raise ValueError("Every state needs exactly one descriptor.")
+
+        new = []
+        seen = set(self.id_to_idx)
+        for k, i in enumerate(ids):
+            if i not in seen:
+                seen.add(i)
+                new.append(k)
+        if len(new) == 0:
+            return 0
+
+        descriptors = descriptors[new].reshape(len(new), -1)
+        if len(self) > 0 and descriptors.shape[1] != self.descriptors.shape[1]:
+            raise ValueError("Descriptors must all have the same length.")
+        for k in new:
+            self.id_to_idx[ids[k]] = len(self.id_to_idx)
+        self.ids = np.concatenate([self.ids, np.array(ids)[new]])
+        self.descriptors = (
+            np.concatenate([self.descriptors, descriptors])
+            if len(self.descriptors) > 0
+            else descriptors
+        )
+        self.tree = BallTree(self.descriptors, leaf_size=self.leaf_size)
+        return len(new)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def __contains__(self, state_id: int) -> bool:
+        return state_id in self.id_to_idx
+
+    def query_descriptor(
+        self, descriptor: np.ndarray, k: int = 10
+    ) -> List[Tuple[int, float]]:
+        """
+        Finds the indexed states closest to a descriptor.
+
+        :param descriptor: The descriptor to search for.
+        :param k: Number of states to return.
+        :returns: List of (state ID, distance) tuples, closest first.
+        """
+        if self.tree is None or k < 1:
+            return []
+        k = min(k, len(self))
+        dist, idx = self.tree.query(
+            np.asarray(descriptor, dtype=np.float64).reshape(1, -1), k=k
+        )
+        return [(int(self.ids[i]), float(d)) for i, d in zip(idx[0], dist[0])]
+
+    def query(
+        self, state_id: Union[int, Atoms], k: int = 10
+    ) -> List[Tuple[int, float]]:
+        """
+        Finds the k states most similar to a state, excluding itself.
+
+        :param state_id: An indexed state ID, or a structure to describe.
+        :param k: Number of states to return.
+        :returns: List of (state ID, distance) tuples, closest first.
+        """
+        if isinstance(state_id, Atoms):
+            return self.query_descriptor(self.describe(state_id), k)
+        if state_id not in self.id_to_idx:
+            raise ValueError(f"State {state_id} is not indexed.")
+        descriptor = self.descriptors[self.id_to_idx[state_id]]
+        neighbors = self.query_descriptor(descriptor, k + 1)
+        return [n for n in neighbors if n[0] != state_id][:k]
+
+    def save(self, path: str):
+        """
+        Saves the descriptors to a .npz file; the tree is rebuilt by load.
+
+        :param path: Path of the file.
+        """
+        np.savez(
+            path,
+            descriptor=self.descriptor,
+            ids=self.ids,
+            descriptors=self.descriptors,
+        )
+
+    @classmethod
+    def load(cls, path: str) -> "SimilarityIndex":
+        """
+        Loads an index saved with save.
+
+        :param path: Path of the file.
+        """
+        with np.load(path) as data:
+            return cls(
+                str(data["descriptor"]), data["ids"], data["descriptors"]
+            )
@@ -0,0 +1,335 @@
+#
+# © 2025. Triad National Security, LLC. All rights reserved.
+# This program was produced under U.S. Government contract 89233218CNA000001 for Los Alamos National Laboratory (LANL), which is operated by Triad National Security, LLC for the U.S. Department of Energy/National Nuclear Security Administration. All rights in the program are reserved by Triad National Security, LLC, and the U.S. Department of Energy/National Nuclear Security Administration. The Government is granted for itself and others acting on its behalf a nonexclusive, paid-up, irrevocable worldwide license in this material to reproduce, prepare. derivative works, distribute copies to the public, perform publicly and display publicly, and to permit others to do so.
+#
+"""
+On-disk, memory-mapped store of state configurations. Each per-atom field
+is one contiguous array for every state in the store, and an offset index
+keyed by state ID locates a state's slice. Reading a state from the store
+does not touch the database.
+"""
+
+import os
+import shutil
+import tempfile
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import neo4j
+import numpy as np
+from ase import Atoms
+from ase.data import atomic_numbers, chemical_symbols
+from typeguard import typechecked
+
+from neomd import converter, fetch
+from neomd.queries import Neo4jQueryBuilder
+
+# box attributes of a State node, in the order they are stored
+BOX_FIELDS = [
+    "boxlo_x",
+    "boxlo_y",
+    "boxlo_z",
+    "boxhi_x",
+    "boxhi_y",
+    "boxhi_z",
+    "xy",
+    "xz",
+    "yz",
+]
+PERIODIC_FIELDS = ["periodic_x", "periodic_y", "periodic_z"]
+
+# per-atom arrays, filename: (dtype, columns per atom)
+FIELDS = {
+    "positions": (np.float64, 3),
+    "velocities": (np.float64, 3),
+    "internal_id": (np.int64, 1),
+    "numbers": (np.int16, 1),
+}
+
+
+class ConfigurationStore:
+    def __init__(self, path: str):
+        """
+        Opens a store previously written with ConfigurationStore.write or
+        ConfigurationStore.materialize. The per-atom arrays are memory
+        mapped read-only.
+
+        :param path: Directory containing the store.
+        """
+        index = np.load(os.path.join(path, "index.npz"))
+        self.path = path
+        self.ids = index["ids"]
+        self.offsets = index["offsets"]
+        self.box = index["box"]
+        self.periodic = index["periodic"]
+        self.id_to_idx = {int(id): idx for idx, id in enumerate(self.ids)}
+
+        total = int(self.offsets[-1])
+        self.arrays = {}
+        for name, (dtype, width) in FIELDS.items():
+            shape = (total, width) if width > 1 else (total,)
+            if total == 0:
+                self.arrays[name] = np.zeros(shape, dtype=dtype)
+            else:
+                self.arrays[name] = np.memmap(
+                    os.path.join(path, f"{name}.bin"),
+                    dtype=dtype,
+                    mode="r",
+                    shape=shape,
+                )
+
+    @classmethod
+    def write(
+        cls,
+        path: str,
+        states: Iterable[Tuple[Any, Dict[str, Any]]],
+    ):
+        """
+        Writes a new store from (State, columns) pairs, as returned by
+        converter.record_to_columns. States are streamed to disk, so
+        memory use does not depend on the number of states. An existing
+        store at path is replaced once the new one is complete.
+
+        :param path: Directory to write the store to.
+        :param states: Iterable of (State node or dict, columns dict).
+
+        :returns: The opened ConfigurationStore.
+        """
+        parent = os.path.dirname(os.path.abspath(path))
+        os.makedirs(parent, exist_ok=True)
+        tmp = tempfile.mkdtemp(dir=parent)
+
+        ids = []
+        counts = []
+        box = []
+        periodic = []
+        files = {
+            name: open(os.path.join(tmp, f"{name}.bin"), "wb")
+            for name in FIELDS
+        }
+        try:
+            for state, columns in states:
+                positions = np.column_stack(
+                    [columns[f"position_{d}"] for d in "xyz"]
+                ).astype(np.float64)
+                velocities = np.column_stack(
+                    [columns[f"velocity_{d}"] for d in "xyz"]
+                ).astype(np.float64)
+                symbols, inverse = np.unique(
+                    np.asarray(columns["atom_type"]), return_inverse=True
+                )
+                numbers = np.array(
+                    [atomic_numbers[s] for s in symbols], dtype=np.int16
+                )[inverse]
+                internal_id = np.asarray(columns["internal_id"], np.int64)
+
+                files["positions"].write(positions.tobytes())
+                files["velocities"].write(velocities.tobytes())
+                files["internal_id"].write(internal_id.tobytes())
+                files["numbers"].write(numbers.tobytes())
+
+                ids.append(state["id"])
+                counts.append(len(internal_id))
+                box.append(
+                    [
+                        np.nan if state[f] is None else state[f]
+                        for f in BOX_FIELDS
+                    ]
+                )
+                periodic.append([state[f] for f in PERIODIC_FIELDS])
+        finally:
+            for f in files.values():
+                f.close()
+
+        offsets = np.zeros(len(counts) + 1, dtype=np.int64)
+        np.cumsum(counts, out=offsets[1:])
+        np.savez(
+            os.path.join(tmp, "index.npz"),
+            ids=np.array(ids, dtype=np.int64),
+            offsets=offsets,
+            box=np.array(box, dtype=np.float64).reshape(-1, len(BOX_FIELDS)),
+            periodic=np.array(periodic, dtype=np.int8).reshape(
+                -1, len(PERIODIC_FIELDS)
+            ),
+        )
+
+        if os.path.exists(path):
+            shutil.rmtree(path)
+        os.replace(tmp, path)
+
+        return cls(path)
+
+    @classmethod
+    @typechecked
+    def materialize(
+        cls,
+        driver: neo4j.Driver,
+        id_list: List[int],
+        path: str,
+        fetch_size: int = 100,
+    ):
+        """
+        Reads the configurations of the states in id_list from the
+        database and writes them to a new store at path.
+
+        :param driver: Neo4j driver to read the states with.
+        :param id_list: The states to store; duplicates are ignored.
+        :param path: Directory to write the store to.
+        :param fetch_size: How many records to pull from the server at a time.
+
+        :returns: The opened ConfigurationStore.
+        """
+        qb = Neo4jQueryBuilder([("Atom", "PART_OF", "State", "MANY-TO-ONE")])
+        q = qb.get_states(list(set(id_list)), True, columnar=True)
+
+        with driver.session(fetch_size=fetch_size) as session:
+            result = session.run(q.text, q.params)
+            return cls.write(
+                path, (converter.record_to_columns(r) for r in result)
+            )
+
+    def __contains__(self, id) -> bool:
+        return id in self.id_to_idx
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def get_columns(self, id: int) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+        """
+        Returns the State attributes and the per-atom columns for a state.
+        The columns are views into the memory-mapped arrays.
+
+        :param id: The state ID.
+        :raises KeyError: Raised if the state is not in the store.
+        :returns: Tuple of (State attribute dict, columns dict)
+        """
+        idx = self.id_to_idx[id]
+        start, end = self.offsets[idx], self.offsets[idx + 1]
+
+        state = {"id": id, "AtomCount": int(end - start)}
+        for f, v in zip(BOX_FIELDS, self.box[idx]):
+            state[f] = None if np.isnan(v) else float(v)
+        for f, v in zip(PERIODIC_FIELDS, self.periodic[idx]):
+            state[f] = int(v)
+
+        positions = self.arrays["positions"][start:end]
+        velocities = self.arrays["velocities"][start:end]
+        numbers = self.arrays["numbers"][start:end]
+        columns = {
+            "position_x": positions[:, 0],
+            "position_y": positions[:, 1],
+            "position_z": positions[:, 2],
+            "velocity_x": velocities[:, 0],
+            "velocity_y": velocities[:, 1],
+            "velocity_z": velocities[:, 2],
+            "atom_type": [chemical_symbols[n] for n in numbers],
+            "internal_id": self.arrays["internal_id"][start:end],
+        }
+        return state, columns
+
+    def get_positions(self, id: int) -> np.ndarray:
+        """
+        Returns a read-only view of the stored (unwrapped) positions of
+        a state, ordered by internal_id.
+
+        :param id: The state ID.
+        """
+        idx = self.id_to_idx[id]
+        return self.arrays["positions"][
+            self.offsets[idx] : self.offsets[idx + 1]
+        ]
+
+    def get_atoms(self, id: int) -> Atoms:
+        """
+        Builds the ASE Atoms object for a state exactly as
+        converter.query_to_ASE would.
+
+        :param id: The state ID.
+        """
+        state, columns = self.get_columns(id)
+        return converter.columns_to_ASE(state, columns)
+
+    def iter_ASE(self, id_list: Iterable[int]) -> Iterator[Tuple[int, Atoms]]:
+        """
+        Yields (state ID, Atoms) for every state in id_list.
+
+        :param id_list: The states to read.
+        """
+        for id in id_list:
+            yield id, self.get_atoms(id)
+
+
+@typechecked
+def load_ASE(
+    driver: neo4j.Driver,
+    id_list: List[int],
+    stores: Optional[List[ConfigurationStore]] = None,
+    shard_size: int = 1000,
+    max_workers: int = 4,
+) -> Dict[int, Atoms]:
+    """
+    Returns a dictionary of state IDs to ASE Atoms, serving every state
+    it can from the stores and reading the rest from the database.
+
+    :param driver: Neo4j driver used for states that are not stored.
+    :param id_list: The states to load.
+    :param stores: Stores to check before querying the database.
+    :param shard_size: Maximum number of states per database query.
+    :param max_workers: Maximum number of concurrent database sessions.
+    """
+    stores = [] if stores is None else stores
+    ase_dict = {}
+    missing = []
+    for id in set(id_list):
+        store = next((s for s in stores if id in s), None)
+        if store is not None:
+            ase_dict[id] = store.get_atoms(id)
+        else:
+            missing.append(id)
+
+    if len(missing) > 0:
+        ase_dict.update(
+            fetch.fetch_ASE(
+                driver,
+                missing,
+                shard_size=shard_size,
+                max_workers=max_workers,
+            )
+        )
+
+    return ase_dict
+
+
+@typechecked
+def iter_load_ASE(
+    driver: neo4j.Driver,
+    id_list: List[int],
+    stores: Optional[List[ConfigurationStore]] = None,
+    fetch_size: int = 100,
+) -> Iterator[Tuple[int, Atoms]]:
+    """
+    Generator version of load_ASE. Stored states are read one at a time
+    and the rest are streamed with converter.iter_query_to_ASE, so only
+    the configuration currently being consumed is held in memory.
+
+    :param driver: Neo4j driver used for states that are not stored.
+    :param id_list: The states to load; duplicates are yielded once.
+    :param stores: Stores to check before querying the database.
+    :param fetch_size: Records to pull from the server at a time.
+    :returns: Iterator of (state ID, ase.Atoms) tuples.
+    """
+    stores = [] if stores is None else stores
+    missing = []
+    for id in dict.fromkeys(id_list):
+        store = next((s for s in stores if id in s), None)
+        if store is not None:
+            yield id, store.get_atoms(id)
+        else:
+            missing.append(id)
+
+    if len(missing) > 0:
+        qb = Neo4jQueryBuilder([("Atom", "PART_OF", "State", "MANY-TO-ONE")])
+        yield from converter.iter_query_to_ASE(
+            driver,
+            qb.get_states(missing, True, columnar=True),
+            fetch_size=fetch_size,
+        )
@@ -31,7 +31,9 @@ class Trajectory:
         # TODO: how do we guarantee labels are correct for each trajectory?
         calculator.relabel_trajectory(driver, qb, name)
 
-        q = qb.get_states(unique_states, True, order_by=f"{name}_label")
+        q = qb.get_states(
+            unique_states, True, order_by=f"{name}_label", columnar=True
+        )
 
         self.ase_atoms = converter.query_to_ASE(driver, q)
         graph_dict, transition_dict = calculator.transitions_to_graphs(
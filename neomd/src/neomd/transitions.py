@@ -0,0 +1,164 @@
+#
+# © 2025. Triad National Security, LLC. All rights reserved.
+# This program was produced under U.S. Government contract 89233218CNA000001 for Los Alamos National Laboratory (LANL), which is operated by Triad National Security, LLC for the U.S. Department of Energy/National Nuclear Security Administration. All rights in the program are reserved by Triad National Security, LLC, and the U.S. Department of Energy/National Nuclear Security Administration. The Government is granted for itself and others acting on its behalf a nonexclusive, paid-up, irrevocable worldwide license in this material to reproduce, prepare. derivative works, distribute copies to the public, perform publicly and display publicly, and to permit others to do so.
+#
+"""
+Transition counts that are kept up to date as a trajectory grows.
+"""
+
+from typing import List, Optional, Tuple, Union
+
+import neo4j
+import numpy as np
+from scipy import sparse
+from typeguard import typechecked
+
+from neomd import calculator
+from neomd.metadata import invalidate_metadata
+
+
+class TransitionCounts:
+    run: str
+    lag: int
+    last_timestep: Optional[int]  # last timestep folded into the counts
+    length: int  # number of states of the sequence folded into the counts
+    idx_to_id: List[int]  # state ID of each row / column
+    occurrences: np.ndarray  # transitions out of each state
+
+    def __init__(self, run: str, lag: int = 1):
+        """
+        Creates empty transition counts for a trajectory. States get an
+        index the first time they are seen, so indices stay valid as
+        the trajectory grows.
+
+        :param run: Name of the trajectory.
+        :param lag: Number of steps between the two states of a transition.
+        """
+        if lag < 1:
+            raise ValueError("Lags must be at least 1.")
+        self.run = run
+        self.lag = lag
+        self.last_timestep = None
+        self.length = 0
+        self.idx_to_id = []
+        self.id_to_idx = {}
+        self.occurrences = np.zeros(0, dtype=np.int64)
+        self.tail = []  # last lag states, the start of the next transitions
+        self.changed = set()  # states whose occurrences were not written
+
+        self._counts = sparse.csr_matrix((0, 0), dtype=np.int64)
+        self._pending = []  # (rows, cols) not yet added to _counts
+
+    def extend(self, sequence: Union[List[int], np.ndarray]) -> int:
+        """
+        Folds the transitions of states appended to the sequence into the
+        counts. Work is proportional to the number of new states.
+
+        :param sequence: The states that follow the ones already counted.
+        :returns: The number of new transitions.
+        """
+        sequence = np.asarray(sequence, dtype=np.int64)
+        if len(sequence) == 0:
+            return 0
+        self.length += len(sequence)
+
+        ids, inverse = np.unique(sequence, return_inverse=True)
+        for i in ids.tolist():
+            if i not in self.id_to_idx:
+                self.id_to_idx[i] = len(self.idx_to_id)
+                self.idx_to_id.append(i)
+        indices = np.array([self.id_to_idx[i] for i in ids.tolist()])[inverse]
+        indices = np.concatenate(
+            [np.array(self.tail, dtype=np.int64), indices]
+        )
+
+        n = len(self.idx_to_id)
+        if len(self.occurrences) < n:
+            self.occurrences = np.pad(
+                self.occurrences, (0, n - len(self.occurrences))
+            )
+
+        rows = indices[: -self.lag] if len(indices) > self.lag else []
+        cols = indices[self.lag :]
+        if len(rows) > 0:
+            self._pending.append((rows, cols))
+            np.add.at(self.occurrences, rows, 1)
+            self.changed.update(np.unique(rows).tolist())
+        self.tail = indices[-self.lag :].tolist()
+
+        return len(rows)
+
+    @typechecked
+    def update(self, driver: neo4j.Driver) -> List[int]:
+        """
+        Reads the part of the trajectory after the last processed
+        timestep and folds it into the counts.
+
+        :param driver: Neo4j driver to query.
+        :returns: The new part of the sequence.
+        """
+        sequence, last = calculator.get_sequence_after(
+            driver, self.run, self.last_timestep
+        )
+        self.extend(sequence)
+        self.last_timestep = last
+        return sequence
+
+    @property
+    def counts(self) -> sparse.csr_matrix:
+        """
+        The [i][j]th element is the number of transitions from
+        idx_to_id[i] to idx_to_id[j].
+        """
+        n = len(self.idx_to_id)
+        if self._counts.shape != (n, n):
+            self._counts.resize((n, n))
+        if len(self._pending) > 0:
+            rows = np.concatenate([r for r, _ in self._pending])
+            cols = np.concatenate([c for _, c in self._pending])
+            self._counts = self._counts + sparse.csr_matrix(
+                (np.ones(len(rows), dtype=np.int64), (rows, cols)),
+                shape=(n, n),
+            )
+            self._pending = []
+        return self._counts
+
+    def transition_matrix(self) -> Tuple[sparse.csc_matrix, List[int]]:
+        """
+        Returns the transition matrix of the trajectory, as in
+        calculator.transition_matrix_from_sequence, but indexed in the
+        order states were first seen.
+
+        :returns: a tuple of (sparse.csc_matrix of transition probabilities,
+                              List where the index retrieves the state id)
+        """
+        return calculator.normalize_counts(self.counts), list(self.idx_to_id)
+
+    @typechecked
+    def write_occurrences(self, driver: neo4j.Driver) -> int:
+        """
+        Stores the occurrences of the states that changed since the last
+        write on their State nodes, as calculate_trajectory_occurrences
+        does for the whole trajectory.
+
+        :param driver: Neo4j driver to query.
+        :returns: The number of states written.
+        """
+        rows = [
+            {"id": self.idx_to_id[i], "count": int(self.occurrences[i])}
+            for i in sorted(self.changed)
+        ]
+        q = f"""UNWIND $rows AS row
+        MATCH (s:State {{id: row.id}})
+        SET s.{self.run}_occurrences = row.count;"""
+        with driver.session() as session:
+            session.run(q, rows=rows).consume()
+            session.run(
+                f"MATCH (m:Metadata {{run: $run}}) "
+                f"SET m.{self.run}_occurrences = True;",
+                run=self.run,
+            ).consume()
+        invalidate_metadata(self.run)
+
+        self.changed = set()
+        return len(rows)
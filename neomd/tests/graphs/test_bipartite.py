@@ -2,7 +2,10 @@
 # © 2025. Triad National Security, LLC. All rights reserved.
 # This program was produced under U.S. Government contract 89233218CNA000001 for Los Alamos National Laboratory (LANL), which is operated by Triad National Security, LLC for the U.S. Department of Energy/National Nuclear Security Administration. All rights in the program are reserved by Triad National Security, LLC, and the U.S. Department of Energy/National Nuclear Security Administration. The Government is granted for itself and others acting on its behalf a nonexclusive, paid-up, irrevocable worldwide license in this material to reproduce, prepare. derivative works, distribute copies to the public, perform publicly and display publicly, and to permit others to do so.
 #
+import networkx as nx
+import numpy as np
 import pytest
+from ase.cluster import Icosahedron
 
 from neomd.graphs import StateGraph
 from neomd.graphs import TransitionGraph
@@ -29,3 +32,43 @@ def test_build_graph_multi(g, g2, g3, g4):
     assert len(b.graph.nodes) == len(g.graph.nodes) + len(
         g2.graph.nodes
     ) + len(g3.graph.nodes) + len(g4.graph.nodes)
+
+
+def test_weighted_distance():
+    atoms = Icosahedron("Pt", 4)
+    layers = [StateGraph(atoms, 0)]
+    for i in range(1, 3):
+        moved = atoms.copy()
+        moved.rattle(0.2, seed=i)
+        layers.append(StateGraph(moved, i))
+    b = TransitionGraph(*layers)
+
+    g = b.graph
+    assert len(g) == 3 * len(atoms)
+    for u, v, edge in g.edges(data=True):
+        if "bond_delta" in edge:
+            continue
+        # each atom's edge to the previous layer, or the next for the first
+        deltas = []
+        for n in (u, v):
+            atom, layer = map(int, n.split("_"))
+            other = f"{atom}_{layer - 1 if layer > 0 else 1}"
+            deltas.append(g.edges[n, other]["bond_delta"])
+        expected = np.sqrt(
+            edge["bond_weight"] * np.sqrt(deltas[0] * deltas[1])
+        )
+        assert np.isclose(edge["weighted_distance"], expected)
+
+    reduced = b.reduce_by_edge().graph
+    for weight in (None, "bond_weight", "bond_delta", "weighted_distance"):
+        assert np.allclose(
+            b.reduce_by_edge().adjacency_matrix(weight).toarray(),
+            nx.to_numpy_array(reduced, weight=weight),
+        )
+    assert all(
+        d["weighted_distance"] != 0 for _, _, d in reduced.edges(data=True)
+    )
+    assert all(reduced.degree[n] > 0 for n in reduced)
+
+    reduced = b.reduce().graph
+    assert {reduced.nodes[n]["atom_number"] for n in reduced} <= b.get_moved()
@@ -2,8 +2,13 @@
 # © 2025. Triad National Security, LLC. All rights reserved.
 # This program was produced under U.S. Government contract 89233218CNA000001 for Los Alamos National Laboratory (LANL), which is operated by Triad National Security, LLC for the U.S. Department of Energy/National Nuclear Security Administration. All rights in the program are reserved by Triad National Security, LLC, and the U.S. Department of Energy/National Nuclear Security Administration. The Government is granted for itself and others acting on its behalf a nonexclusive, paid-up, irrevocable worldwide license in this material to reproduce, prepare. derivative works, distribute copies to the public, perform publicly and display publicly, and to permit others to do so.
 #
-from neomd.graphs import graphutils
+import networkx as nx
+import numpy as np
 import pytest
+from ase.build import bulk
+from ase.cluster import Icosahedron
+
+from neomd.graphs import StateGraph, graphutils
 
 
 @pytest.mark.usefixtures("g", "g2")
@@ -19,3 +24,62 @@ def test_calculate_connectivity_difference(g, g2):
 @pytest.mark.usefixtures("g", "g2")
 def test_calculate_rel_bond_delta(g, g2):
     print(graphutils.calculate_rel_bond_delta(g, g2))
+
+
+def test_sparse_rel_bond_delta():
+    atoms = Icosahedron("Pt", 4)
+    moved = atoms.copy()
+    moved.rattle(0.3, seed=0)
+    s1 = StateGraph(atoms, 1)
+    s2 = StateGraph(moved, 2)
+
+    pairs = (s1.adjacency + s2.adjacency).toarray()
+    dense = graphutils.calculate_rel_bond_delta(s1, s2)
+    sparse = graphutils.sparse_rel_bond_delta(s1, s2)
+    assert sparse.nnz == pairs.sum()
+    assert np.allclose(sparse.toarray()[pairs], dense[pairs])
+
+    dense = graphutils.calculate_bond_delta(s1, s2)
+    sparse = graphutils.sparse_bond_delta(s1, s2)
+    assert np.allclose(sparse.toarray()[pairs], dense[pairs])
+
+
+def test_sparse_bond_delta_periodic():
+    atoms = bulk("Pt", "fcc", a=3.92, cubic=True).repeat((3, 3, 3))
+    moved = atoms.copy()
+    moved.rattle(0.05, seed=0)
+    s1 = StateGraph(atoms, 1)
+    s2 = StateGraph(moved, 2)
+
+    # bonds across the boundary are in the graph, with direct lengths
+    d = atoms.get_all_distances()
+    i, j = s1.adjacency.nonzero()
+    assert (d[i, j] > 3.0).any()
+    assert np.allclose(s1.bond_lengths[i, j], d[i, j])
+
+    pairs = (s1.adjacency + s2.adjacency).toarray()
+    dense = graphutils.calculate_rel_bond_delta(s1, s2)
+    sparse = graphutils.sparse_rel_bond_delta(s1, s2)
+    assert np.allclose(sparse.toarray()[pairs], dense[pairs])
+
+
+def test_lorentzian_distance_matrix():
+    graphs = [nx.gnm_random_graph(n, 3 * n, seed=n) for n in (20, 25, 25, 30)]
+    spectra = [
+        graphutils.laplacian_spectrum(nx.to_numpy_array(g)) for g in graphs
+    ]
+    densities = [graphutils.im_spectrum(g) for g in graphs]
+
+    # small blocks to cover the blocking
+    m = graphutils.lorentzian_distance_matrix(spectra, block_size=1000)
+    for i, d1 in enumerate(densities):
+        for j, d2 in enumerate(densities):
+            assert np.isclose(
+                m[i, j], graphutils.im_distance(d1, d2), atol=1e-8
+            )
+
+    rows, cols = [3, 0, 3], [1, 3]
+    assert np.allclose(
+        graphutils.lorentzian_distances(spectra, rows, cols, block_size=1000),
+        m[np.ix_(rows, cols)],
+    )
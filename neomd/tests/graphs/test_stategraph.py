@@ -2,7 +2,14 @@
 # © 2025. Triad National Security, LLC. All rights reserved.
 # This program was produced under U.S. Government contract 89233218CNA000001 for Los Alamos National Laboratory (LANL), which is operated by Triad National Security, LLC for the U.S. Department of Energy/National Nuclear Security Administration. All rights in the program are reserved by Triad National Security, LLC, and the U.S. Department of Energy/National Nuclear Security Administration. The Government is granted for itself and others acting on its behalf a nonexclusive, paid-up, irrevocable worldwide license in this material to reproduce, prepare. derivative works, distribute copies to the public, perform publicly and display publicly, and to permit others to do so.
 #
+import networkx as nx
+import numpy as np
 import pytest
+from ase.build import bulk
+from ase.cluster import Icosahedron
+
+from neomd.graphs import StateGraph
+from neomd.graphs.stategraph import annotate, match_graphs
 
 
 @pytest.mark.usefixtures("g", "g2")
@@ -42,3 +49,41 @@ def test_size(g):
 @pytest.mark.usefixtures("g")
 def test_distance_matrix(g):
     print(g.get_distance_matrix())
+
+
+def test_match_graphs():
+    g = StateGraph(Icosahedron("Pt", 3), 0).graph
+    order = np.random.default_rng(0).permutation(len(g))
+    permuted = nx.relabel_nodes(g, dict(enumerate(order)))
+    assert annotate(permuted) == annotate(g)
+
+    mapping = match_graphs(permuted, g)
+    assert nx.utils.edges_equal(
+        nx.relabel_nodes(permuted, mapping).edges, g.edges
+    )
+
+    # recomputed, since the copy has no cached hash
+    broken = nx.Graph(g.edges)
+    broken.remove_edge(*next(iter(g.edges)))
+    assert annotate(broken) != annotate(g)
+    assert match_graphs(broken, g) is None
+
+
+@pytest.mark.parametrize("pbc", [False, True])
+def test_neighbor_pairs(pbc):
+    atoms = bulk("Pt", "fcc", a=3.92, cubic=True).repeat((3, 3, 3))
+    atoms.rattle(0.05, seed=0)
+    atoms.pbc = pbc
+    sg = StateGraph(atoms, 0)
+
+    d = atoms.get_all_distances(mic=pbc)
+    np.fill_diagonal(d, np.inf)
+    i, j = np.nonzero(d < 3.0)
+    assert sg.size() == len(atoms)
+    assert np.array_equal(sg.adjacency.toarray(), d < 3.0)
+    assert np.allclose(
+        sg.bond_lengths[i, j], sg.get_distance_matrix()[i, j]
+    )
+    assert nx.utils.edges_equal(
+        sg.graph.edges, zip(*np.nonzero(np.triu(d < 3.0)))
+    )
@@ -35,7 +35,8 @@ def test_match_node_bound(qb):
     q = qb.build()
 
     v = s.variable
-    assert q.text == f"MATCH ({v}:State)\nWHERE {v}.foo IN ['bar', 'baz'];"
+    assert q.text == f"MATCH ({v}:State)\nWHERE {v}.foo IN $foo;"
+    assert q.params == {"foo": ["bar", "baz"]}
 
 
 def test_match_missing_node(qb):
@@ -51,7 +52,8 @@ def test_match_node_with_wrong_type(qb):
 def test_match_node_with(qb):
     qb.match_node_with("State", "id", 4)
     q = qb.build()
-    assert q.text == """MATCH (:State { id:4 });"""
+    assert q.text == """MATCH (:State { id:$id });"""
+    assert q.params == {"id": 4}
 
 
 def test_match_relation(qb):
@@ -139,7 +141,7 @@ def test_return_entities(qb):
     q = qb.build()
 
     v = s.variable
-    assert q.text == f"""MATCH ({v}:State {{ id:4 }})\nRETURN {v};"""
+    assert q.text == f"""MATCH ({v}:State {{ id:$id }})\nRETURN {v};"""
 
 
 def test_return_entities_no_entities(qb):
@@ -171,7 +173,19 @@ def test_where_in(qb):
     q = qb.build()
 
     v = s.variable
-    assert q.text == f"""MATCH ({v}:State)\nWHERE {v}.id IN [1, 2, 3];"""
+    assert q.text == f"""MATCH ({v}:State)\nWHERE {v}.id IN $id;"""
+    assert q.params == {"id": [1, 2, 3]}
+
+
+def test_params_are_unique(qb):
+    s = qb.match_node("State")
+    qb.where_in(s, "id", [1, 2])
+    qb.where_in(s, "id", [3])
+    q = qb.build()
+
+    assert q.text.endswith("IN $id_1;")
+    assert q.params == {"id": [1, 2], "id_1": [3]}
+    assert qb.build().params == {}
 
 
 def test_where_between(qb):
@@ -180,9 +194,11 @@ def test_where_between(qb):
     q = qb.build()
 
     v = s.variable
-    assert (
-        q.text == f"""MATCH ({v}:State)\nWHERE {v}.id >= 1 AND {v}.id <= 3;"""
+    assert q.text == (
+        f"MATCH ({v}:State)\n"
+        f"WHERE {v}.id >= $id_start AND {v}.id <= $id_end;"
     )
+    assert q.params == {"id_start": 1, "id_end": 3}
 
 
 def test_set_value(qb):
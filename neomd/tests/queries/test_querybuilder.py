@@ -2,11 +2,14 @@
 # © 2025. Triad National Security, LLC. All rights reserved.
 # This program was produced under U.S. Government contract 89233218CNA000001 for Los Alamos National Laboratory (LANL), which is operated by Triad National Security, LLC for the U.S. Department of Energy/National Nuclear Security Administration. All rights in the program are reserved by Triad National Security, LLC, and the U.S. Department of Energy/National Nuclear Security Administration. The Government is granted for itself and others acting on its behalf a nonexclusive, paid-up, irrevocable worldwide license in this material to reproduce, prepare. derivative works, distribute copies to the public, perform publicly and display publicly, and to permit others to do so.
 #
+import pytest
+
+
 def test_get_states_with_atoms(qb):
     q = qb.get_states([1, 2, 3], True)
     assert (
         q.text
-        == """MATCH (s111:State)\nWHERE s111.id IN [1, 2, 3]\nMATCH (a:Atom)-[:PART_OF]->(s111)\nWITH s111,a\nORDER BY a.internal_id ASC\nWITH collect(DISTINCT a) AS a_list,s111\nRETURN s111,a_list;"""
+        == """MATCH (s111:State)\nWHERE s111.id IN $id\nMATCH (a:Atom)-[:PART_OF]->(s111)\nWITH s111,a\nORDER BY a.internal_id ASC\nWITH collect(DISTINCT a) AS a_list,s111\nRETURN s111,a_list;"""
     )
 
 
@@ -14,16 +17,16 @@ def test_get_states_with_attributes(qb):
     q = qb.get_states([1, 2, 3], attributeList=["foo", "bar", "id"])
     assert (
         q.text
-        == """MATCH (s111:State)\nWHERE s111.id IN [1, 2, 3]\nRETURN s111.foo AS foo, s111.bar AS bar, s111.id AS id;"""
+        == """MATCH (s111:State)\nWHERE s111.id IN $id\nRETURN s111.foo AS foo, s111.bar AS bar, s111.id AS id;"""
     )
 
 
-# also somehow stochastic - WITH doesn't always return things in the same order
+# WITH carries variables over in the order they were first matched
 def test_generate_path(qb):
     q = qb.generate_get_path(0, 100, "nano_pt", "timestep")
     assert (
         q.text
-        == """MATCH (s:State)-[n:nano_pt]->(:State)\nWHERE n.timestep >= 0 AND n.timestep <= 100\nMATCH (a:Atom)-[:PART_OF]->(s)\nWITH a,n,s\nORDER BY a.internal_id ASC\nWITH collect(DISTINCT a) AS a_list,s,n\nRETURN s,a_list\nORDER BY n.timestep ASC;"""
+        == """MATCH (s:State)-[n:nano_pt]->(:State)\nWHERE n.timestep >= $timestep_start AND n.timestep <= $timestep_end\nMATCH (a:Atom)-[:PART_OF]->(s)\nWITH s,n,a\nORDER BY a.internal_id ASC\nWITH collect(DISTINCT a) AS a_list,s,n\nRETURN s,a_list\nORDER BY n.timestep ASC;"""
     )
 
 
@@ -57,5 +60,64 @@ def test_get_potential_file(qb):
     q = qb.get_potential_file("nano_pt")
     assert (
         q.text
-        == "MATCH (m:Metadata { run:'nano_pt' })\nRETURN m.potentialFileName AS potentialFileName, m.potentialFileRaw AS potentialFileRaw;"
+        == "MATCH (m:Metadata { run:$run })\nRETURN m.potentialFileName AS potentialFileName, m.potentialFileRaw AS potentialFileRaw;"
+    )
+    assert q.params == {"run": "nano_pt"}
+
+
+def test_get_states_reuses_text(qb):
+    q1 = qb.get_states([1, 2, 3], True, columnar=True)
+    q2 = qb.get_states([4, 5], True, columnar=True)
+    assert q1.text == q2.text
+    assert q1.params == {"id": [1, 2, 3]}
+    assert q2.params == {"id": [4, 5]}
+
+
+def test_get_states_columnar(qb):
+    q = qb.get_states([1, 2, 3], True, columnar=True)
+    assert "ORDER BY a.internal_id ASC" in q.text
+    assert "collect(a.position_x) AS position_x" in q.text
+    # collect() skips nulls, so optional columns need a default
+    assert "collect(coalesce(a.velocity_x, 0.0)) AS velocity_x" in q.text
+    assert "collect(DISTINCT a)" not in q.text
+    assert q.text.splitlines()[-1].endswith(
+        "position_x,position_y,position_z,velocity_x,velocity_y,"
+        "velocity_z,atom_type,internal_id;"
     )
+
+
+def test_get_states_packed(qb):
+    q = qb.get_states([1, 2, 3], True, packed=True)
+    assert "Atom" not in q.text
+    assert "ASE" in q.options
+
+    with pytest.raises(ValueError):
+        qb.get_states([1, 2, 3], True, order_by="nano_pt_label", packed=True)
+
+
+def test_template_cache(qb):
+    from neomd.queries import template
+
+    template.clear_template_cache()
+    # building binds entities, so the first call may leave the builder
+    # in a different state than the one it started in
+    qb.generate_get_path(0, 100, "nano_pt", "timestep")
+    q1 = qb.generate_get_path(0, 100, "nano_pt", "timestep")
+    size = len(template._templates)
+
+    q2 = qb.generate_get_path(5, 10, "nano_pt", "timestep")
+    assert len(template._templates) == size
+    assert q2.text == q1.text
+    assert q2.options == q1.options
+    assert q2.params == {"timestep_start": 5, "timestep_end": 10}
+
+    # a different shape is a different template
+    qb.generate_get_path(5, 10, "nano_pt", "timestep", include_atoms=False)
+    assert len(template._templates) > size
+    size = len(template._templates)
+
+    # pending statements are never cached
+    qb.match_node("State")
+    q3 = qb.get_states([1], attribute_list=["id"])
+    assert len(template._templates) == size
+    assert q3.text.startswith("MATCH")
@@ -4,7 +4,12 @@
 #
 import copy
 
+import networkx as nx
+import numpy as np
 import pytest
+from ase import Atoms
+from ase.cluster import Icosahedron
+from scipy.spatial.transform import Rotation
 
 from neomd import calculator, converter
 from neomd.graphs import StateGraph, bipartite
@@ -39,6 +44,83 @@ def test_calculate_transition_matrix(driver):
     assert allOne
 
 
+def test_transition_matrix_from_sequence():
+    m, idx_to_id = calculator.transition_matrix_from_sequence(
+        [1, 2, 1, 3, 3, 2, 4]
+    )
+    assert idx_to_id == [1, 2, 3, 4]
+    assert np.allclose(
+        m.toarray(),
+        [
+            [0, 0.5, 0.5, 0],
+            [0.5, 0, 0, 0.5],
+            [0, 0.5, 0.5, 0],
+            [0, 0, 0, 1],
+        ],
+    )
+
+    # 3 is a copy of 1
+    m, idx_to_id = calculator.transition_matrix_from_sequence(
+        [1, 2, 1, 3, 3, 2, 4], {3: 1}
+    )
+    assert idx_to_id == [1, 2, 4]
+    assert np.allclose(m.sum(axis=1), 1)
+    assert np.isclose(m[0, 0], 0.5)
+
+
+def test_lagged_count_matrices():
+    sequence = [1, 2, 1, 3, 3, 2, 4]
+    counts, idx_to_id = calculator.lagged_count_matrices(sequence, [1, 2, 10])
+    assert idx_to_id == [1, 2, 3, 4]
+    assert counts[1].sum() == 6
+    assert counts[2].sum() == 5
+    assert counts[10].sum() == 0
+    # 1 -> 1 and 1 -> 3 two steps later
+    assert counts[2][0, 0] == 1 and counts[2][0, 2] == 1
+
+    m, _ = calculator.transition_matrix_from_sequence(sequence, lag=2)
+    assert np.allclose(m.sum(axis=1), 1)
+
+
+def test_windowed_count_matrices():
+    sequence = np.random.default_rng(0).integers(0, 5, 100)
+    windows, idx_to_id = calculator.windowed_count_matrices(sequence, 20, 5)
+    counts, _ = calculator.lagged_count_matrices(sequence, [1])
+
+    assert [start for start, _ in windows] == list(range(0, 81, 5))
+    for start, w in windows:
+        expected = np.zeros(counts[1].shape)
+        for i in range(start, min(start + 20, len(sequence) - 1)):
+            expected[sequence[i], sequence[i + 1]] += 1
+        assert np.array_equal(w.toarray(), expected)
+
+    with pytest.raises(ValueError):
+        calculator.windowed_count_matrices(sequence, 20, 3)
+
+
+@pytest.mark.parametrize(
+    "length, window, step", [(3, 4, 1), (1, 4, 2), (7, 6, 3), (11, 4, 2)]
+)
+def test_windowed_count_matrices_short(length, window, step):
+    sequence = np.random.default_rng(length).integers(0, 3, length)
+    windows, idx_to_id = calculator.windowed_count_matrices(
+        sequence, window, step
+    )
+    index = {s: i for i, s in enumerate(idx_to_id)}
+
+    # the first window is returned even if the sequence is shorter
+    starts = list(range(0, max(length - window, 0) + 1, step))
+    assert [start for start, _ in windows] == starts
+    for start, w in windows:
+        expected = np.zeros((len(idx_to_id), len(idx_to_id)))
+        for i in range(start, min(start + window, length - 1)):
+            expected[index[sequence[i]], index[sequence[i + 1]]] += 1
+        assert np.array_equal(w.toarray(), expected)
+
+    with pytest.raises(ValueError):
+        calculator.windowed_count_matrices(sequence, window + 1, step + 1)
+
+
 @pytest.mark.usefixtures("driver")
 def test_canonical_path(driver):
     path, _ = calculator.canonical_path(driver, "nano_pt", 308, 310)
@@ -55,6 +137,29 @@ def test_canonical_path(driver):
     assert path[310]["symmetry"] == 6
 
 
+def test_compose_labels():
+    # 1 -> 2 is symmetric, 2 -> 3 is not
+    parents = {2: 1, 3: 2, 4: 1}
+    mappings = {2: np.array([1, 2, 0]), 4: np.array([2, 1, 0])}
+    labels = calculator.compose_labels(1, parents, mappings, 3)
+
+    assert labels[1].tolist() == [0, 1, 2]
+    assert labels[2].tolist() == [1, 2, 0]
+    assert labels[3].tolist() == [1, 2, 0]
+    assert labels[4].tolist() == [2, 1, 0]
+
+
+def test_map_pair():
+    g = StateGraph(Icosahedron("Pt", 3), 0).graph
+    order = np.random.default_rng(0).permutation(len(g))
+    permuted = nx.relabel_nodes(g, dict(enumerate(order)))
+
+    child, m = calculator._map_pair((1, 0, permuted, g))
+    assert child == 1
+    relabelled = nx.relabel_nodes(permuted, dict(enumerate(m)))
+    assert nx.utils.edges_equal(relabelled.edges, g.edges)
+
+
 # add test to compare with original transitions
 @pytest.mark.usefixtures("driver")
 def test_relabel_trajectory(driver, qb):
@@ -116,3 +221,82 @@ def test_relabel_trajectory(driver, qb):
             no_full += 1
 
     assert len(counts) == no_full
+
+
+def test_batch_align():
+    rng = np.random.default_rng(0)
+    ref = rng.normal(size=(50, 3))
+    rotations = [Rotation.random(random_state=i).as_matrix() for i in range(8)]
+    stack = np.stack([ref @ r.T + rng.normal(size=3) for r in rotations])
+
+    aligned = calculator.batch_align(ref, stack, keep_centroid=False)
+    assert np.allclose(aligned, ref)
+
+    # rotated about their own centroids, like align
+    aligned = calculator.batch_align(ref, stack)
+    for a, s in zip(aligned, stack):
+        assert np.allclose(a.mean(axis=0), s.mean(axis=0))
+        assert np.allclose(a - a.mean(axis=0), ref - ref.mean(axis=0))
+
+    s1 = Atoms("Pt50", positions=ref)
+    s2 = Atoms("Pt50", positions=stack[0])
+    assert np.allclose(calculator.align(s1, s2).positions, aligned[0])
+    assert np.allclose(calculator.pure_align(s1, s2), aligned[0])
+
+
+@pytest.mark.parametrize("num_processes", [1, 2])
+def test_batch_rmsd(num_processes):
+    rng = np.random.default_rng(0)
+    refs = rng.normal(size=(3, 40, 3))
+    noise = rng.normal(scale=0.1, size=(5, 40, 3))
+    stack = np.stack(
+        [
+            Rotation.random(random_state=i).apply(refs[i % 3] + noise[i]) + i
+            for i in range(5)
+        ]
+    )
+
+    m = calculator.batch_rmsd(
+        refs, stack, num_processes=num_processes, block_size=1000
+    )
+    assert m.shape == (3, 5)
+    for i in range(5):
+        aligned = calculator.batch_align(refs[i % 3], stack[i : i + 1], False)
+        diff = aligned[0] - refs[i % 3]
+        expected = np.sqrt((diff**2).sum(axis=1).mean())
+        assert np.isclose(m[i % 3, i], expected)
+        assert m[i % 3, i] <= np.sqrt((noise[i] ** 2).sum(axis=1).mean())
+    assert np.allclose(calculator.batch_rmsd(refs[0], stack), m[0])
+
+
+def test_atoms_rmsd_atom_order():
+    # the same structure with its atoms stored in another order, as two
+    # states read in internal_id order can be
+    atoms = Icosahedron("Pt", 3)
+    order = np.random.default_rng(2).permutation(len(atoms))
+    shuffled = atoms[order]
+    assert calculator.atoms_rmsd(atoms, [shuffled])[0] > 0.5
+
+    # ordering both states by their labels pairs the atoms again
+    labels = np.arange(len(atoms))
+    relabelled = shuffled[np.argsort(labels[order])]
+    assert np.isclose(calculator.atoms_rmsd(atoms, [relabelled])[0], 0)
+
+
+def test_batch_rmsd_minimum_image():
+    cell = np.diag([10.0, 10.0, 10.0])
+    rng = np.random.default_rng(1)
+    ref = rng.uniform(0, 10, size=(20, 3))
+    moved = ref + rng.normal(scale=0.05, size=(20, 3))
+    moved[:5] += cell[0]  # same atoms, another periodic image
+
+    periodic = calculator.batch_rmsd(ref, moved[np.newaxis], cell, True)
+    assert periodic[0] < 0.1
+    assert calculator.batch_rmsd(ref, moved[np.newaxis])[0] > 1
+
+    atoms = [
+        Atoms("Pt20", positions=p, cell=cell, pbc=True) for p in (ref, moved)
+    ]
+    assert np.allclose(
+        calculator.atoms_rmsd(atoms[0], atoms), [0, periodic[0]]
+    )
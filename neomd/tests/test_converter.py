@@ -2,7 +2,9 @@
 # © 2025. Triad National Security, LLC. All rights reserved.
 # This program was produced under U.S. Government contract 89233218CNA000001 for Los Alamos National Laboratory (LANL), which is operated by Triad National Security, LLC for the U.S. Department of Energy/National Nuclear Security Administration. All rights in the program are reserved by Triad National Security, LLC, and the U.S. Department of Energy/National Nuclear Security Administration. The Government is granted for itself and others acting on its behalf a nonexclusive, paid-up, irrevocable worldwide license in this material to reproduce, prepare. derivative works, distribute copies to the public, perform publicly and display publicly, and to permit others to do so.
 #
+import numpy as np
 import pytest
+from ase import Atoms
 
 from neomd import converter
 
@@ -47,3 +49,171 @@ def test_ase_to_query(driver, qb):
     atom2 = list(state_atom_dict2.values())[0]
 
     assert (atom.symbols == atom2.symbols).all()
+
+
+@pytest.mark.usefixtures("driver", "qb")
+def test_query_to_ASE_columnar(driver, qb):
+    q = qb.get_states([1, 2, 3], True)
+    nodes = converter.query_to_ASE(driver, q)
+
+    q = qb.get_states([1, 2, 3], True, columnar=True)
+    columns = converter.query_to_ASE(driver, q)
+
+    assert nodes.keys() == columns.keys()
+    for k in nodes:
+        assert (nodes[k].positions == columns[k].positions).all()
+        assert (nodes[k].arrays["id"] == columns[k].arrays["id"]).all()
+
+
+def test_columns_to_ASE_shifts_wrapped_axis():
+    state = {
+        "boxlo_x": 0.0,
+        "boxlo_y": 0.0,
+        "boxlo_z": 0.0,
+        "boxhi_x": 20.0,
+        "boxhi_y": 20.0,
+        "boxhi_z": 20.0,
+        "xy": None,
+        "xz": None,
+        "yz": None,
+        "periodic_x": 1,
+        "periodic_y": 1,
+        "periodic_z": 1,
+        "AtomCount": 2,
+    }
+    columns = {
+        "position_x": [1.0, 19.0],
+        "position_y": [9.5, 10.5],
+        "position_z": [2.0, 3.0],
+        "velocity_x": [0.0, 0.0],
+        "velocity_y": [0.0, 0.0],
+        "velocity_z": [0.0, 0.0],
+        "atom_type": ["Pt", "Pt"],
+        "internal_id": [1, 2],
+    }
+    atoms = converter.columns_to_ASE(state, columns)
+
+    # x and z have no atoms near the center of the box and are shifted,
+    # y has atoms near the center and is left alone
+    assert atoms.positions[:, 0].tolist() == [11.0, 9.0]
+    assert atoms.positions[:, 1].tolist() == [9.5, 10.5]
+    assert atoms.positions[:, 2].tolist() == [12.0, 13.0]
+    assert atoms.get_tags().tolist() == [1, 2]
+
+    columns["internal_id"] = [1]
+    columns["position_x"] = [1.0]
+    with pytest.raises(ValueError):
+        converter.columns_to_ASE(state, columns)
+
+    # a column shortened by a skipped null no longer lines up with the atoms
+    columns["internal_id"] = [1, 2]
+    columns["position_x"] = [1.0, 19.0]
+    columns["velocity_x"] = [0.0]
+    with pytest.raises(ValueError):
+        converter.columns_to_ASE(state, columns)
+
+
+@pytest.mark.usefixtures("driver", "qb")
+def test_iter_query_to_ASE(driver, qb):
+    q = qb.get_states([1, 2, 3], True, columnar=True)
+    state_atom_dict = converter.query_to_ASE(driver, q)
+
+    seen = []
+    for id, atoms in converter.iter_query_to_ASE(driver, q, fetch_size=1):
+        seen.append(id)
+        assert (atoms.positions == state_atom_dict[id].positions).all()
+
+    assert sorted(seen) == sorted(state_atom_dict.keys())
+
+
+@pytest.mark.usefixtures("driver", "qb")
+def test_ase_list_to_neo4j(driver, qb):
+    q = qb.get_states([1, 2, 3], True, columnar=True)
+    state_atom_dict = converter.query_to_ASE(driver, q)
+    atoms_list = list(state_atom_dict.values())
+
+    # small batches force each state to be split over several queries
+    ids = converter.ase_list_to_neo4j(driver, ["NEB"], atoms_list, 50)
+    assert ids == list(range(ids[0], ids[0] + len(atoms_list)))
+
+    q = qb.get_states(ids, True, columnar=True)
+    inserted = converter.query_to_ASE(driver, q)
+    for id, atoms in zip(ids, atoms_list):
+        assert (inserted[id].symbols == atoms.symbols).all()
+        assert inserted[id].get_tags().tolist() == list(
+            range(1, len(atoms) + 1)
+        )
+
+
+class RecordingTransaction:
+    def __init__(self):
+        self.batches = []
+
+    def run(self, query, **params):
+        if "batch" in params:
+            self.batches.append(params["batch"])
+        return self
+
+    def single(self):
+        return {"start": 10}
+
+    def commit(self):
+        pass
+
+
+class RecordingDriver:
+    def __init__(self):
+        self.tx = RecordingTransaction()
+
+    def session(self):
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    def begin_transaction(self):
+        return self.tx
+
+
+def test_ase_list_to_neo4j_batches():
+    sizes = [3, 12, 0, 5, 7, 30]
+    atoms_list = [
+        Atoms(f"Pt{n}", positions=np.arange(3 * n).reshape(n, 3))
+        for n in sizes
+    ]
+    driver = RecordingDriver()
+    ids = converter.ase_list_to_neo4j(driver, ["NEB"], atoms_list, 10)
+    assert ids == list(range(10, 10 + len(sizes)))
+
+    batches = driver.tx.batches
+    counts = [sum(len(st["atom_type"]) for st in b) for b in batches]
+    assert all(c <= 10 for c in counts)
+    assert counts == [10, 10, 10, 10, 10, 7]
+
+    # every atom is written exactly once, at its own offset
+    for stateID, atoms in zip(ids, atoms_list):
+        parts = [st for b in batches for st in b if st["id"] == stateID]
+        assert [st["offset"] for st in parts] == list(
+            np.cumsum([0] + [len(st["atom_type"]) for st in parts])[:-1]
+        )
+        x = [x for st in parts for x in st["position_x"]]
+        assert x == atoms.positions[:, 0].tolist()
+
+
+@pytest.mark.usefixtures("driver", "qb")
+def test_pack_states(driver, qb):
+    assert converter.pack_states(driver, [1, 2, 3]) == 3
+
+    q = qb.get_states([1, 2, 3], True, columnar=True)
+    columns = converter.query_to_ASE(driver, q)
+
+    q = qb.get_states([1, 2, 3], True, packed=True)
+    packed = converter.query_to_ASE(driver, q)
+
+    assert columns.keys() == packed.keys()
+    for k in columns:
+        assert (columns[k].positions == packed[k].positions).all()
+        assert (columns[k].symbols == packed[k].symbols).all()
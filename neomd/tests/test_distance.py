@@ -0,0 +1,148 @@
+#
+# © 2025. Triad National Security, LLC. All rights reserved.
+# This program was produced under U.S. Government contract 89233218CNA000001 for Los Alamos National Laboratory (LANL), which is operated by Triad National Security, LLC for the U.S. Department of Energy/National Nuclear Security Administration. All rights in the program are reserved by Triad National Security, LLC, and the U.S. Department of Energy/National Nuclear Security Administration. The Government is granted for itself and others acting on its behalf a nonexclusive, paid-up, irrevocable worldwide license in this material to reproduce, prepare. derivative works, distribute copies to the public, perform publicly and display publicly, and to permit others to do so.
+#
+import numpy as np
+import pytest
+from scipy.spatial.distance import cdist
+
+from neomd import calculator, distance
+
+
+@pytest.fixture
+def items():
+    rng = np.random.default_rng(0)
+    return [rng.normal(size=(4, 3)) for _ in range(23)]
+
+
+def manhattan(i, j, x, y):
+    return np.abs(y - x).sum()
+
+
+def jaccard(i, j, x, y):
+    return 1 - len(x & y) / len(x | y)
+
+
+def test_tiles():
+    work = distance.tiles(10, 4)
+    assert len(work) == 6
+    covered = np.zeros((10, 10), dtype=int)
+    for i0, i1, j0, j1 in work:
+        assert j0 >= i0
+        covered[i0:i1, j0:j1] += 1
+    # every pair above the diagonal is computed exactly once
+    assert np.array_equal(np.triu(covered, 1), np.triu(np.ones((10, 10)), 1))
+
+
+@pytest.mark.parametrize("num_processes", [1, 2])
+def test_pairwise_distances(items, num_processes):
+    flat = np.array([x.ravel() for x in items])
+
+    m = distance.pairwise_distances(
+        items, metric="euclidean", num_processes=num_processes, tile_size=5
+    )
+    assert np.allclose(m, cdist(flat, flat))
+
+    m = distance.pairwise_distances(
+        items, fn=manhattan, num_processes=num_processes, tile_size=5
+    )
+    assert np.allclose(m, cdist(flat, flat, "cityblock"))
+    assert np.allclose(
+        calculator.distance_matrix(items, num_processes=num_processes),
+        cdist(flat, flat),
+    )
+
+
+@pytest.mark.parametrize("num_processes", [1, 2])
+def test_pairwise_distances_objects(num_processes):
+    items = [frozenset(range(i, i + 5)) for i in range(8)]
+    m = distance.pairwise_distances(
+        items, fn=jaccard, num_processes=num_processes, tile_size=3
+    )
+    exact = [[jaccard(0, 0, x, y) for y in items] for x in items]
+    assert np.allclose(m, exact)
+
+
+def test_pairwise_distances_unconverted():
+    items = [[1, 2], [3, 4], [5, 6]]
+    m = distance.pairwise_distances(
+        items, fn=lambda i, j, x, y: float(x is items[i] and y is items[j])
+    )
+    assert np.array_equal(m, 1 - np.eye(3))
+
+
+def test_pairwise_distances_memmap(items, tmp_path):
+    flat = np.array([x.ravel() for x in items])
+    path = str(tmp_path / "dm.npy")
+    m = distance.pairwise_distances(
+        items, metric="euclidean", num_processes=2, tile_size=5, out_path=path
+    )
+    assert isinstance(m, np.memmap)
+    assert np.allclose(np.load(path), cdist(flat, flat))
+
+
+def test_pairwise_distances_invalid(items):
+    with pytest.raises(ValueError):
+        distance.pairwise_distances(items)
+    with pytest.raises(ValueError):
+        distance.pairwise_distances(
+            items[:2] + [np.zeros(3)], metric="euclidean"
+        )
+    with pytest.raises(ValueError):
+        distance.pairwise_distances(
+            [frozenset([1]), frozenset([2])], metric="euclidean"
+        )
+
+
+@pytest.mark.parametrize("method", ["random", "farthest"])
+def test_approximate_distances(method):
+    rng = np.random.default_rng(0)
+    # items in a 3 dimensional subspace are embedded exactly
+    x = rng.normal(size=(200, 3)) @ rng.normal(size=(3, 8))
+    m = distance.approximate_distances(
+        list(x), 10, metric="euclidean", method=method, seed=0
+    )
+    exact = cdist(x, x)
+
+    assert len(m.landmarks) == 10
+    assert m.error["relative"] < 1e-8
+    assert np.allclose(m.to_array(), exact)
+    assert np.allclose(m[5], exact[5])
+    assert np.isclose(m[5, 7], exact[5, 7])
+    assert np.allclose(m[:10, [3, 4]], exact[:10, [3, 4]])
+
+
+def test_approximate_distances_fn(items):
+    flat = np.array([x.ravel() for x in items])
+    m = calculator.distance_matrix(
+        items, fn=lambda x, y: np.abs(y - x).sum(), landmarks=5, seed=0
+    )
+    exact = cdist(flat, flat, "cityblock")
+    assert np.allclose(m.landmark_distances, exact[:, m.landmarks])
+    assert m.error["num_samples"] == len(items)
+    assert m.error["max"] >= np.abs(m.to_array() - exact).max() - 1e-8
+
+
+def test_farthest_points():
+    rng = np.random.default_rng(0)
+    x = rng.normal(size=(300, 4))
+    x[7] = x[0]  # duplicates are never picked
+
+    def block(rows, cols):
+        return cdist(x[rows], x[cols])
+
+    picks = list(distance.farthest_points(len(x), block, start=3, depth=20))
+    assert len(picks) == 20
+    assert picks[0][0] == 3 and picks[0][1] == np.inf
+
+    # each pick is the item farthest from every earlier pick
+    for c in range(1, len(picks)):
+        earlier = [i for i, _, _ in picks[:c]]
+        nearest = cdist(x, x[earlier]).min(axis=1)
+        assert picks[c][0] == nearest.argmax()
+        assert np.isclose(picks[c][1], nearest.max())
+        assert np.allclose(picks[c][2], cdist(x, x[[picks[c][0]]])[:, 0])
+
+    everything = [i for i, _, _ in distance.farthest_points(len(x), block)]
+    assert len(everything) == len(x) - 1
+    assert sorted(everything + [7]) == list(range(len(x)))
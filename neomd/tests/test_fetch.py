@@ -0,0 +1,38 @@
+#
+# © 2025. Triad National Security, LLC. All rights reserved.
+# This program was produced under U.S. Government contract 89233218CNA000001 for Los Alamos National Laboratory (LANL), which is operated by Triad National Security, LLC for the U.S. Department of Energy/National Nuclear Security Administration. All rights in the program are reserved by Triad National Security, LLC, and the U.S. Department of Energy/National Nuclear Security Administration. The Government is granted for itself and others acting on its behalf a nonexclusive, paid-up, irrevocable worldwide license in this material to reproduce, prepare. derivative works, distribute copies to the public, perform publicly and display publicly, and to permit others to do so.
+#
+import numpy as np
+import pytest
+
+from neomd import converter, fetch
+
+
+def test_shard():
+    assert fetch.shard(list(range(7)), 3) == [[0, 1, 2], [3, 4, 5], [6]]
+    assert fetch.shard([], 3) == []
+    with pytest.raises(ValueError):
+        fetch.shard([1], 0)
+
+
+@pytest.mark.usefixtures("driver", "qb")
+def test_fetch_ASE(driver, qb):
+    q = qb.get_states([1, 2, 3, 4, 5], True, columnar=True)
+    state_atom_dict = converter.query_to_ASE(driver, q)
+
+    sharded = fetch.fetch_ASE(
+        driver, [1, 2, 3, 4, 5], shard_size=2, max_workers=3
+    )
+
+    assert sharded.keys() == state_atom_dict.keys()
+    for id, atoms in state_atom_dict.items():
+        assert np.allclose(sharded[id].positions, atoms.positions)
+
+
+@pytest.mark.usefixtures("driver")
+def test_fetch_attributes(driver):
+    data = fetch.fetch_attributes(
+        driver, [1, 2, 3, 4, 5], ["id"], shard_size=2, max_workers=3
+    )
+
+    assert sorted(d["id"] for d in data) == [1, 2, 3, 4, 5]
@@ -0,0 +1,37 @@
+#
+# © 2025. Triad National Security, LLC. All rights reserved.
+# This program was produced under U.S. Government contract 89233218CNA000001 for Los Alamos National Laboratory (LANL), which is operated by Triad National Security, LLC for the U.S. Department of Energy/National Nuclear Security Administration. All rights in the program are reserved by Triad National Security, LLC, and the U.S. Department of Energy/National Nuclear Security Administration. The Government is granted for itself and others acting on its behalf a nonexclusive, paid-up, irrevocable worldwide license in this material to reproduce, prepare. derivative works, distribute copies to the public, perform publicly and display publicly, and to permit others to do so.
+#
+import pytest
+
+from neomd import metadata
+
+
+def test_metadata_cache(monkeypatch):
+    metadata.invalidate_metadata()
+    calls = []
+
+    def load():
+        calls.append(1)
+        return len(calls)
+
+    assert metadata._cached(("metadata", "nano_pt"), load) == 1
+    assert metadata._cached(("metadata", "nano_pt"), load) == 1
+
+    metadata.invalidate_metadata("nano_pt")
+    assert metadata._cached(("metadata", "nano_pt"), load) == 2
+
+    monkeypatch.setattr(metadata, "METADATA_TTL", 0.0)
+    assert metadata._cached(("metadata", "nano_pt"), load) == 3
+    metadata.invalidate_metadata()
+
+
+@pytest.mark.usefixtures("driver")
+def test_get_metadata_cached(driver):
+    metadata.invalidate_metadata()
+    md = metadata.get_metadata(driver, "nano_pt")
+    md["foo"] = "bar"
+
+    # cached copy is not affected by the caller
+    assert "foo" not in metadata.get_metadata(driver, "nano_pt")
+    assert "nano_pt" in metadata.get_runs(driver)
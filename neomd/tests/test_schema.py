@@ -0,0 +1,45 @@
+#
+# © 2025. Triad National Security, LLC. All rights reserved.
+# This program was produced under U.S. Government contract 89233218CNA000001 for Los Alamos National Laboratory (LANL), which is operated by Triad National Security, LLC for the U.S. Department of Energy/National Nuclear Security Administration. All rights in the program are reserved by Triad National Security, LLC, and the U.S. Department of Energy/National Nuclear Security Administration. The Government is granted for itself and others acting on its behalf a nonexclusive, paid-up, irrevocable worldwide license in this material to reproduce, prepare. derivative works, distribute copies to the public, perform publicly and display publicly, and to permit others to do so.
+#
+import pytest
+
+from neomd import schema
+
+
+def test_plan_operators():
+    plan = {
+        "operatorType": "ProduceResults@neo4j",
+        "children": [
+            {
+                "operatorType": "Filter@neo4j",
+                "children": [{"operatorType": "NodeByLabelScan@neo4j"}],
+            }
+        ],
+    }
+    ops = schema.plan_operators(plan)
+    assert ops == ["ProduceResults", "Filter", "NodeByLabelScan"]
+
+    report = {"q": {"before": ops, "after": ["NodeIndexSeek"]}}
+    assert schema.index_seeks(report) == {
+        "q": {"before": False, "after": True}
+    }
+
+
+def test_sample_queries():
+    queries = schema.sample_queries(["nano_pt"])
+    assert "nano_pt_path" in queries
+    text, params = queries["nano_pt_path"]
+    assert "nano_pt" in text
+    assert params == {"timestep_start": 0, "timestep_end": 1}
+
+
+@pytest.mark.usefixtures("driver")
+def test_ensure_indexes(driver):
+    report = schema.ensure_indexes(driver, ["nano_pt"], report=True)
+    assert schema.index_seeks(report)["get_states"]["after"] is True
+
+
+@pytest.mark.usefixtures("driver")
+def test_ensure_indexes_without_waiting(driver):
+    assert schema.ensure_indexes(driver, ["nano_pt"], timeout=0) == {}
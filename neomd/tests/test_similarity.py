@@ -0,0 +1,74 @@
+#
+# © 2025. Triad National Security, LLC. All rights reserved.
+# This program was produced under U.S. Government contract 89233218CNA000001 for Los Alamos National Laboratory (LANL), which is operated by Triad National Security, LLC for the U.S. Department of Energy/National Nuclear Security Administration. All rights in the program are reserved by Triad National Security, LLC, and the U.S. Department of Energy/National Nuclear Security Administration. The Government is granted for itself and others acting on its behalf a nonexclusive, paid-up, irrevocable worldwide license in this material to reproduce, prepare. derivative works, distribute copies to the public, perform publicly and display publicly, and to permit others to do so.
+#
+import networkx as nx
+import numpy as np
+import pytest
+from ase.build import bulk
+from ase.cluster import Icosahedron
+from scipy.integrate import quad
+
+from neomd import similarity
+from neomd.graphs import graphutils
+
+
+def test_spectral_density():
+    graphs = [nx.gnm_random_graph(20, 60, seed=s) for s in (1, 2)]
+    spectra = [
+        graphutils.laplacian_spectrum(nx.to_numpy_array(g)) for g in graphs
+    ]
+    grid = np.linspace(0, 6, 2001)
+    d1, d2 = [similarity.spectral_density(s, grid) for s in spectra]
+
+    # distances between the samples approximate im_distance over the grid
+    density1, density2 = [graphutils.im_spectrum(g) for g in graphs]
+    exact = np.sqrt(
+        quad(lambda w: (density1(w) - density2(w)) ** 2, 0, 6, limit=200)[0]
+    )
+    assert np.isclose(np.linalg.norm(d1 - d2), exact, rtol=1e-2)
+
+
+def test_similarity_index(tmp_path):
+    ico = Icosahedron("Pt", 4)
+    rattled = ico.copy()
+    rattled.rattle(0.05, seed=1)
+    fcc = bulk("Pt", "fcc", a=3.92, cubic=True).repeat(3)
+
+    index = similarity.SimilarityIndex("spectrum")
+    assert index.add([1, 2, 3], atoms={1: ico, 2: rattled, 3: fcc}) == 3
+    assert index.add([1], atoms={1: ico}) == 0
+
+    neighbors = index.query(1, k=2)
+    assert [i for i, _ in neighbors] == [2, 3]
+    assert neighbors[0][1] < neighbors[1][1]
+    assert index.query(ico, k=1) == [(1, 0.0)]
+
+    path = str(tmp_path / "index.npz")
+    index.save(path)
+    loaded = similarity.SimilarityIndex.load(path)
+    assert loaded.descriptor == "spectrum"
+    assert loaded.query(1, k=2) == neighbors
+
+    with pytest.raises(ValueError):
+        index.query(4)
+
+
+def test_similarity_index_exact():
+    rng = np.random.default_rng(0)
+    x = rng.normal(size=(1000, 8))
+    index = similarity.SimilarityIndex("custom", np.arange(1000) * 2, x)
+
+    exact = np.argsort(np.linalg.norm(x - x[10], axis=1))[1:6] * 2
+    assert [i for i, _ in index.query(20, k=5)] == exact.tolist()
+
+
+def test_farthest_states():
+    descriptors = np.array([[0.0], [1.0], [10.0], [4.0], [0.0]])
+    ids = [10, 11, 12, 13, 14]
+
+    picks = list(similarity.farthest_states(ids, descriptors))
+    assert [i for i, _ in picks] == [10, 12, 13, 11]
+    assert [d for _, d in picks[1:]] == [10.0, 4.0, 1.0]
+    assert len(list(similarity.farthest_states(ids, descriptors, 2))) == 2
+    assert list(similarity.farthest_states([], [])) == []
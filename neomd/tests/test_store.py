@@ -0,0 +1,89 @@
+#
+# © 2025. Triad National Security, LLC. All rights reserved.
+# This program was produced under U.S. Government contract 89233218CNA000001 for Los Alamos National Laboratory (LANL), which is operated by Triad National Security, LLC for the U.S. Department of Energy/National Nuclear Security Administration. All rights in the program are reserved by Triad National Security, LLC, and the U.S. Department of Energy/National Nuclear Security Administration. The Government is granted for itself and others acting on its behalf a nonexclusive, paid-up, irrevocable worldwide license in this material to reproduce, prepare. derivative works, distribute copies to the public, perform publicly and display publicly, and to permit others to do so.
+#
+import numpy as np
+import pytest
+
+from neomd import converter
+from neomd.store import ConfigurationStore, iter_load_ASE, load_ASE
+
+
+def make_state(id, n, rng):
+    state = {
+        "id": id,
+        "boxlo_x": 0.0,
+        "boxlo_y": 0.0,
+        "boxlo_z": 0.0,
+        "boxhi_x": 20.0,
+        "boxhi_y": 20.0,
+        "boxhi_z": 20.0,
+        "xy": None,
+        "xz": 0.5,
+        "yz": None,
+        "periodic_x": 1,
+        "periodic_y": 0,
+        "periodic_z": 1,
+        "AtomCount": n,
+    }
+    p = rng.uniform(0, 20, (n, 6))
+    columns = {
+        "position_x": p[:, 0].tolist(),
+        "position_y": p[:, 1].tolist(),
+        "position_z": p[:, 2].tolist(),
+        "velocity_x": p[:, 3].tolist(),
+        "velocity_y": p[:, 4].tolist(),
+        "velocity_z": p[:, 5].tolist(),
+        "atom_type": ["Pt"] * (n - 1) + ["Au"],
+        "internal_id": list(range(1, n + 1)),
+    }
+    return state, columns
+
+
+def test_store_matches_converter(tmp_path):
+    rng = np.random.default_rng(0)
+    states = [make_state(id, n, rng) for id, n in [(4, 10), (2, 7), (9, 1)]]
+    store = ConfigurationStore.write(str(tmp_path / "store"), states)
+
+    assert len(store) == 3
+    assert 2 in store and 3 not in store
+
+    reopened = ConfigurationStore(str(tmp_path / "store"))
+    for state, columns in states:
+        expected = converter.columns_to_ASE(state, columns)
+        atoms = reopened.get_atoms(state["id"])
+        assert (atoms.positions == expected.positions).all()
+        assert (atoms.get_velocities() == expected.get_velocities()).all()
+        assert (atoms.symbols == expected.symbols).all()
+        assert (atoms.cell == expected.cell).all()
+        assert (atoms.pbc == expected.pbc).all()
+        assert (atoms.get_tags() == expected.get_tags()).all()
+
+    with pytest.raises(KeyError):
+        reopened.get_atoms(3)
+
+
+@pytest.mark.usefixtures("driver")
+def test_load_ASE_from_store(driver, tmp_path):
+    store = ConfigurationStore.materialize(
+        driver, [1, 2], str(tmp_path / "store")
+    )
+    ase_dict = load_ASE(driver, [1, 2, 3], [store])
+    from_db = load_ASE(driver, [1, 2, 3])
+
+    assert ase_dict.keys() == from_db.keys()
+    for k in ase_dict:
+        assert (ase_dict[k].positions == from_db[k].positions).all()
+
+
+@pytest.mark.usefixtures("driver")
+def test_iter_load_ASE(driver, tmp_path):
+    store = ConfigurationStore.materialize(
+        driver, [1, 2], str(tmp_path / "store")
+    )
+    streamed = list(iter_load_ASE(driver, [1, 2, 3, 2], [store]))
+    ase_dict = load_ASE(driver, [1, 2, 3])
+
+    assert sorted(k for k, _ in streamed) == [1, 2, 3]
+    for k, atoms in streamed:
+        assert (atoms.positions == ase_dict[k].positions).all()
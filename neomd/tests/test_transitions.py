@@ -0,0 +1,41 @@
+#
+# © 2025. Triad National Security, LLC. All rights reserved.
+# This program was produced under U.S. Government contract 89233218CNA000001 for Los Alamos National Laboratory (LANL), which is operated by Triad National Security, LLC for the U.S. Department of Energy/National Nuclear Security Administration. All rights in the program are reserved by Triad National Security, LLC, and the U.S. Department of Energy/National Nuclear Security Administration. The Government is granted for itself and others acting on its behalf a nonexclusive, paid-up, irrevocable worldwide license in this material to reproduce, prepare. derivative works, distribute copies to the public, perform publicly and display publicly, and to permit others to do so.
+#
+import numpy as np
+import pytest
+
+from neomd import calculator
+from neomd.transitions import TransitionCounts
+
+
+@pytest.mark.parametrize("lag", [1, 3])
+def test_extend(lag):
+    rng = np.random.default_rng(0)
+    sequence = rng.integers(0, 20, 500).tolist()
+
+    counts = TransitionCounts("nano_pt", lag)
+    for start in range(0, len(sequence), 37):
+        counts.extend(sequence[start : start + 37])
+    assert counts.length == len(sequence)
+
+    m, idx_to_id = counts.transition_matrix()
+    expected, ids = calculator.transition_matrix_from_sequence(
+        sequence, lag=lag
+    )
+    order = [ids.index(i) for i in idx_to_id]
+    assert np.allclose(m.toarray(), expected.toarray()[order][:, order])
+
+    occurrences = np.bincount(sequence[:-lag], minlength=20)
+    assert counts.occurrences.tolist() == occurrences[idx_to_id].tolist()
+
+
+@pytest.mark.usefixtures("driver")
+def test_update(driver):
+    counts = TransitionCounts("nano_pt")
+    sequence = counts.update(driver)
+    assert sequence == calculator.get_sequence(driver, "nano_pt")
+
+    # nothing new since the last update
+    assert counts.update(driver) == []
+    assert counts.length == len(sequence)
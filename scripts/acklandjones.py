@@ -6,7 +6,8 @@
 properties() should return a list of attributes that this script produces per element. 
 This will determine the name the property is saved as in the database.
 
-run() should return a dictionary of state ID to attribute.
+run() receives an iterable of (state ID, ase.Atoms) pairs, streamed one state
+at a time, and should return a dictionary of state ID to attribute.
 """
 from neomd import calculator
 
@@ -20,7 +21,7 @@ def properties():
     ]
 
 
-def run(state_atom_dict):
+def run(state_atoms):
     return calculator.apply_ovito_pipeline_modifier(
-            state_atom_dict, "AcklandJonesModifier"
+            state_atoms, "AcklandJonesModifier"
     )
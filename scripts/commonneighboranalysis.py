@@ -15,7 +15,7 @@ def properties():
     ]
 
 
-def run(state_atom_dict):
+def run(state_atoms):
     return calculator.apply_ovito_pipeline_modifier(
-        state_atom_dict, "CommonNeighborAnalysisModifier"
+        state_atoms, "CommonNeighborAnalysisModifier"
     )